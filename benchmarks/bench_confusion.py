@@ -0,0 +1,47 @@
+"""
+metrics.confusion (label confusion over (filename, span) keys) next to metrics.fscore on the same corpora, with many
+labels, to check that the confusion report costs about as much as the F-score.
+
+python benchmarks/bench_confusion.py [n_docs] [entities_per_doc] [n_labels]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from peek import metrics  # noqa: E402
+from peek.ann_structure import AnnCorpus  # noqa: E402
+from synthetic import write_corpus  # noqa: E402
+
+
+def timed(f):
+    t0 = time.perf_counter()
+    result = f()
+    return result, time.perf_counter() - t0
+
+
+def main():
+    n_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    per_doc = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    n_labels = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    labels = ['Label{}'.format(i) for i in range(n_labels)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_corpus(os.path.join(tmp, 'gs'), n_docs, per_doc, labels=labels)
+        write_corpus(os.path.join(tmp, 'pred'), n_docs, per_doc, seed=1, labels=labels, noise=0.2)
+        gs = AnnCorpus(os.path.join(tmp, 'gs')).to_table()
+        pred = AnnCorpus(os.path.join(tmp, 'pred')).to_table()
+        print('{} documents, {} labels, {} GS and {} predicted entities'.format(n_docs, n_labels, len(gs), len(pred)))
+
+        _, fscore_t = timed(lambda: metrics.fscore(gs, pred, labels))
+        result, confusion_t = timed(lambda: metrics.confusion(gs, pred, labels))
+        print('{:<12} {:>10.2f} s'.format('fscore', fscore_t))
+        print('{:<12} {:>10.2f} s'.format('confusion', confusion_t))
+        print(result)
+        assert result.matrix.to_numpy().sum() == result.correct + result.swapped + result.spurious + result.missing
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+metrics.fscore (NumPy keys + join) vs. the previous pandas implementation of show_fscore (row-wise apply over a
+merged DataFrame). Both are checked to give the same global and per-document scores.
+
+python benchmarks/bench_fscore.py [n_docs] [entities_per_doc]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from peek import metrics  # noqa: E402
+from peek.ann_structure import AnnCorpus  # noqa: E402
+from synthetic import write_corpus  # noqa: E402
+
+
+def legacy_fscore(gs, pred, rel_labels):
+    """
+    Scores as computed by show_fscore before metrics.fscore (without printing).
+    :return: tuple (P_per_cc, P, R_per_cc, R, F1_per_cc, F1)
+    """
+    gs = metrics.get_table(gs)
+    pred = metrics.get_table(pred)
+    doc_list_gs = gs.doc_names
+    gs = gs.to_frame(labels=rel_labels)
+    pred = pred.to_frame(labels=rel_labels)
+
+    pred = pred.drop_duplicates(['filename', 'label', 'offset']).copy()
+    gs = gs.drop_duplicates(['filename', 'label', 'offset']).copy()
+    relevant_columns = ["filename", "offset", "label"]
+
+    Pred_Pos_per_cc = pred.drop_duplicates(subset=relevant_columns).groupby("filename")["offset"].count()
+    Pred_Pos = pred.drop_duplicates(subset=relevant_columns).shape[0]
+    GS_Pos_per_cc = gs.drop_duplicates(subset=relevant_columns).groupby("filename")["offset"].count()
+    GS_Pos = gs.drop_duplicates(subset=relevant_columns).shape[0]
+
+    df_sel = pd.merge(pred, gs, how="right", on=relevant_columns)
+    is_valid = df_sel.apply(lambda x: x.isnull().any() == False, axis=1)  # noqa: E712
+    df_sel = df_sel.assign(is_valid=is_valid.values)
+    TP_per_cc = df_sel[df_sel["is_valid"] == True].groupby("filename")["is_valid"].count()  # noqa: E712
+    TP = df_sel[df_sel["is_valid"] == True].shape[0]  # noqa: E712
+
+    cc_not_predicted = (pred.drop_duplicates(subset=["filename"])
+                        .merge(gs.drop_duplicates(subset=["filename"]), on='filename', how='right', indicator=True)
+                        .query('_merge == "right_only"')
+                        .drop(columns='_merge'))['filename'].to_list()
+    for cc in cc_not_predicted:
+        TP_per_cc[cc] = 0
+    for doc in doc_list_gs:
+        if doc not in TP_per_cc.index.tolist():
+            TP_per_cc[doc] = 0
+    cc_not_GS = (gs.drop_duplicates(subset=["filename"])
+                 .merge(pred.drop_duplicates(subset=["filename"]), on='filename', how='right', indicator=True)
+                 .query('_merge == "right_only"')
+                 .drop(columns='_merge'))['filename'].to_list()
+    Pred_Pos_per_cc = Pred_Pos_per_cc.drop(cc_not_GS)
+
+    P_per_cc = TP_per_cc / Pred_Pos_per_cc
+    P = TP / Pred_Pos
+    R_per_cc = TP_per_cc / GS_Pos_per_cc
+    R = TP / GS_Pos
+    F1_per_cc = (2 * P_per_cc * R_per_cc) / (P_per_cc + R_per_cc)
+    F1 = (2 * P * R) / (P + R) if P + R else 0
+    return P_per_cc, P, R_per_cc, R, F1_per_cc, F1
+
+
+def timed(f):
+    t0 = time.perf_counter()
+    result = f()
+    return result, time.perf_counter() - t0
+
+
+def main():
+    n_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    per_doc = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_corpus(os.path.join(tmp, 'gs'), n_docs, per_doc)
+        # Predictions: noisy copy, with some documents missing
+        write_corpus(os.path.join(tmp, 'pred'), n_docs - n_docs // 10, per_doc, seed=1, noise=0.2)
+        gs = AnnCorpus(os.path.join(tmp, 'gs')).to_table()
+        pred = AnnCorpus(os.path.join(tmp, 'pred')).to_table()
+        labels = gs.labels
+        print('{} documents, {} GS and {} predicted entities'.format(n_docs, len(gs), len(pred)))
+
+        legacy, legacy_t = timed(lambda: legacy_fscore(gs, pred, labels))
+        result, new_t = timed(lambda: metrics.fscore(gs, pred, labels))
+        print('{:<12} {:>10.2f} s'.format('legacy', legacy_t))
+        print('{:<12} {:>10.2f} s   ({:.0f}x)'.format('fscore', new_t, legacy_t / new_t))
+
+        P_per_cc, P, R_per_cc, R, F1_per_cc, F1 = legacy
+        assert np.isclose([P, R, F1], [result.precision, result.recall, result.f1]).all()
+        for legacy_scores, column in [(P_per_cc, 'precision'), (R_per_cc, 'recall'), (F1_per_cc, 'f1')]:
+            assert legacy_scores.index.tolist() == result.per_doc.index.tolist()
+            assert np.allclose(legacy_scores.to_numpy(dtype=float), result.per_doc[column].to_numpy(dtype=float),
+                               equal_nan=True)
+        print('Same scores: P={:.3f} R={:.3f} F1={:.3f}'.format(result.precision, result.recall, result.f1))
+        print(result.per_label)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+metrics.iaa (integer keys, one pass) vs. the previous computations (string codes rebuilt for every label and set
+operations for every ordered pair of annotators), with many annotators and labels.
+
+python benchmarks/bench_iaa.py [n_annotators] [n_labels] [n_docs] [entities_per_doc]
+"""
+from collections import Counter
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from peek import metrics  # noqa: E402
+from peek.ann_structure import AnnCorpus  # noqa: E402
+from synthetic import write_corpus  # noqa: E402
+
+
+def legacy_codes(list_df, relevant_colnames, rel_labels):
+    """
+    metrics.get_codes as it was before the integer-key engine.
+    :return: tuple (one set of 'value|value|...' codes per annotator, annotator names)
+    """
+    codes = []
+    annotator_names = []
+    for df in list_df:
+        if df.shape[0] == 0:
+            codes.append(set())
+            annotator_names.append('empty')
+            continue
+        codes.append(set(df[relevant_colnames].
+                         drop(df[df['label'].isin(rel_labels) == False].index).  # noqa: E712
+                         drop_duplicates(subset=relevant_colnames).
+                         agg('|'.join, axis=1).to_list()))
+        annotator_names.append(df.annotator.drop_duplicates().to_list()[0])
+
+    return codes, annotator_names
+
+
+def legacy_iaa(codes, annotator_names):
+    """
+    metrics.compute_iaa as it was before the integer-key engine.
+    :return: tuple (all vs all agreement, {(annotator1, annotator2): agreement})
+    """
+    if len(set.union(*codes)) == 0:
+        all_vs_all = 0
+    else:
+        all_vs_all = len(set.intersection(*codes)) / len(set.union(*codes))
+
+    pairwise = {}
+    for annotator1, annotations1 in zip(annotator_names, codes):
+        for annotator2, annotations2 in zip(annotator_names, codes):
+            comparison = (annotator1, annotator2)
+            if len(annotations1.union(annotations2)) == 0:
+                pairwise[comparison] = 0
+                continue
+            pairwise[comparison] = (len(annotations1.intersection(annotations2)) /
+                                    len(annotations1.union(annotations2)))
+
+    return all_vs_all, pairwise
+
+
+def legacy_computations(list_df, relevant_colnames, annotator_names):
+    """
+    computations(..., by_label=True) as it was before the integer-key engine.
+    """
+    labels = []
+    for df in list_df:
+        labels = labels + df.label.to_list()
+    count_labels = Counter(labels)
+    labels = set(count_labels.keys())
+    codes, _ = legacy_codes(list_df, relevant_colnames, labels)
+    iaa_all_vs_all, iaa_pairwise = legacy_iaa(codes, annotator_names)
+    iaa_by_label = {}
+    for label in labels:
+        codes, _ = legacy_codes(list_df, relevant_colnames, [label])
+        iaa_by_label[label] = legacy_iaa(codes, annotator_names)
+    return iaa_all_vs_all, iaa_pairwise, iaa_by_label, count_labels
+
+
+def timed(f):
+    t0 = time.perf_counter()
+    result = f()
+    return result, time.perf_counter() - t0
+
+
+def main():
+    n_annotators = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    n_labels = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    n_docs = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    per_doc = int(sys.argv[4]) if len(sys.argv) > 4 else 50
+    labels = ['Label{}'.format(i) for i in range(n_labels)]
+    variables = ['filename', 'label', 'offset']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tables = []
+        for a in range(n_annotators):
+            folder = os.path.join(tmp, 'annotator{:02d}'.format(a))
+            write_corpus(folder, n_docs, per_doc, seed=a, labels=labels, noise=0.1)
+            tables.append(AnnCorpus(folder).to_table())
+        print('{} annotators, {} labels, {} entities'.format(n_annotators, n_labels, sum(len(t) for t in tables)))
+
+        list_df = [t.to_frame(labels=labels) for t in tables]
+        names = [t.name for t in tables]
+        legacy, legacy_t = timed(lambda: legacy_computations(list_df, variables, names))
+        result, new_t = timed(lambda: metrics.iaa(tables, variables, labels))
+        print('{:<12} {:>10.2f} s'.format('legacy', legacy_t))
+        print('{:<12} {:>10.2f} s   ({:.0f}x)'.format('iaa', new_t, legacy_t / new_t))
+
+        all_vs_all, pairwise, by_label, count_labels = result.to_dicts()
+        assert np.isclose(all_vs_all, legacy[0])
+        assert all(np.isclose(pairwise[k], v) for k, v in legacy[1].items())
+        assert all(np.isclose(by_label[k][0], v[0]) for k, v in legacy[2].items())
+        assert count_labels == legacy[3]
+        print('Same agreement: all vs all = {:.3f}'.format(all_vs_all))
+
+
+if __name__ == '__main__':
+    main()
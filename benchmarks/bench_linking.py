@@ -0,0 +1,62 @@
+"""
+Cross-reference linking in AnnDocument._construct_document: ID index vs. the former nested loops.
+
+python benchmarks/bench_linking.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from peek.ann_structure import AnnDocument  # noqa: E402
+from synthetic import dense_document  # noqa: E402
+
+
+def nested_loop_linking(doc):
+    # Former implementation, O(E·(R+A+N))
+    for ent in doc['entities']:
+        for rel in doc['relations']:
+            if rel.arg1.split(':')[-1] == ent.name:
+                ent.rels.append(rel)
+            elif rel.arg2.split(':')[-1] == ent.name:
+                ent.rels.append(rel)
+        for att in doc['attributes']:
+            if att.arguments[0] == ent.name:
+                ent.attr.append(att)
+        for note in doc['notes']:
+            if note.ann_id == ent.name:
+                ent.notes.append(note)
+
+
+def reset_links(doc):
+    for ent in doc['entities']:
+        ent.rels, ent.events, ent.attr, ent.notes = [], [], [], []
+
+
+def main():
+    print('{:>10} {:>14} {:>14} {:>10}'.format('entities', 'nested (s)', 'indexed (s)', 'speed-up'))
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in [250, 500, 1000, 2000, 4000]:
+            _, lines = dense_document(n)
+            path = os.path.join(tmp, 'dense_{}.ann'.format(n))
+            with open(path, 'w') as f_out:
+                f_out.write('\n'.join(lines) + '\n')
+            anns = AnnDocument(path).anns
+
+            reset_links(anns)
+            t0 = time.perf_counter()
+            nested_loop_linking(anns)
+            nested = time.perf_counter() - t0
+
+            reset_links(anns)
+            t0 = time.perf_counter()
+            AnnDocument._link_annotations(anns)
+            indexed = time.perf_counter() - t0
+
+            print('{:>10} {:>14.4f} {:>14.4f} {:>9.0f}x'.format(n, nested, indexed, nested / indexed))
+
+
+if __name__ == '__main__':
+    main()
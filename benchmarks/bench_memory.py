@@ -0,0 +1,66 @@
+"""
+Memory used by annotation objects: slotted Entity vs. the former __dict__-based layout.
+
+python benchmarks/bench_memory.py [n_docs] [entities_per_doc]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from peek.ann_structure import AnnCorpus, Entity  # noqa: E402
+from synthetic import write_corpus  # noqa: E402
+
+
+class DictEntity:
+    # Former layout: instance __dict__ and four eagerly created lists
+    def __init__(self, name, tag, span, text):
+        self.name = name
+        self.tag = tag
+        self.span = span
+        self.text = text
+        self.rels = []
+        self.events = []
+        self.attr = []
+        self.notes = []
+
+
+def measure(build):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - t0
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak, elapsed
+
+
+def build_entities(cls, rows):
+    # Build tags and IDs from fresh strings, like the parser does for every line
+    return [cls(name=''.join(['T', str(i)]), tag=''.join(['Dis', 'ease']), span=((i, i + 5),), text='fever')
+            for i in rows]
+
+
+def main():
+    n_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    per_doc = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    n = n_docs * per_doc
+
+    print('Annotation objects ({} entities)'.format(n))
+    for cls in [DictEntity, Entity]:
+        _, current, _, elapsed = measure(lambda: build_entities(cls, range(n)))
+        print('  {:<12} {:>8.1f} MiB  {:>6.1f} bytes/entity  {:>6.2f} s'.format(
+            cls.__name__, current / 2 ** 20, current / n, elapsed))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_corpus(tmp, n_docs, per_doc)
+        corpus, current, peak, elapsed = measure(lambda: AnnCorpus(tmp))
+        print('AnnCorpus load ({} docs)'.format(len(corpus)))
+        print('  retained {:.1f} MiB, peak {:.1f} MiB, {:.2f} s'.format(current / 2 ** 20, peak / 2 ** 20, elapsed))
+
+
+if __name__ == '__main__':
+    main()
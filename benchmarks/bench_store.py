@@ -0,0 +1,57 @@
+"""
+Binary corpus store vs. pickle: save time, load time and file size.
+
+python benchmarks/bench_store.py [n_docs] [entities_per_doc]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from peek import rwsl  # noqa: E402
+from peek.ann_structure import AnnCorpus  # noqa: E402
+from synthetic import write_corpus  # noqa: E402
+
+
+def timed(f):
+    t0 = time.perf_counter()
+    result = f()
+    return result, time.perf_counter() - t0
+
+
+def main():
+    n_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    per_doc = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = os.path.join(tmp, 'corpus')
+        write_corpus(folder, n_docs, per_doc)
+        corpus = AnnCorpus(folder, txt=True)
+        # Read texts and compute stats so that both formats store the same information
+        for doc in corpus.docs:
+            doc.text
+        corpus.count
+        print('{} documents, {} entities'.format(len(corpus), sum(corpus.count['entities'].values())))
+        print('{:<22} {:>10} {:>10} {:>10}'.format('', 'save (s)', 'load (s)', 'size (MB)'))
+
+        pickle_path = os.path.join(tmp, 'corpus.pckl')
+        _, save_t = timed(lambda: rwsl.save_corpus(corpus, tmp))
+        _, load_t = timed(lambda: rwsl.load_corpus(pickle_path))
+        print('{:<22} {:>10.2f} {:>10.2f} {:>10.1f}'.format('pickle', save_t, load_t,
+                                                             os.path.getsize(pickle_path) / 1e6))
+
+        store_path, save_t = timed(lambda: rwsl.save_corpus_store(corpus, tmp, txt=True))
+        _, load_t = timed(lambda: rwsl.load_corpus_store(store_path))
+        print('{:<22} {:>10.2f} {:>10.2f} {:>10.1f}'.format('store', save_t, load_t, os.path.getsize(store_path) / 1e6))
+
+        names = [doc.name for doc in corpus.docs[::100]]
+        _, subset_t = timed(lambda: rwsl.load_corpus_store(store_path, names=names))
+        print('{:<22} {:>10} {:>10.2f}'.format('store ({} docs)'.format(len(names)), '', subset_t))
+        _, table_t = timed(lambda: rwsl.CorpusStore(store_path).to_table())
+        print('{:<22} {:>10} {:>10.2f}'.format('store -> AnnTable', '', table_t))
+
+
+if __name__ == '__main__':
+    main()
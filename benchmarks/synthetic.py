@@ -0,0 +1,65 @@
+"""
+Synthetic brat corpora for the benchmarks in this folder.
+"""
+import os
+import random
+
+LABELS = ['Disease', 'Drug', 'Procedure', 'Symptom', 'Anatomy']
+WORDS = ['fever', 'aspirin', 'biopsy', 'cough', 'liver', 'pain', 'insulin', 'scan', 'rash', 'heart']
+
+
+def dense_document(n_entities, seed=0):
+    """
+    Build the text and .ann lines of a relation-dense document.
+    Every entity takes part in one relation, half of them have an attribute and a quarter have notes and events.
+    :return: tuple (text, list of .ann lines)
+    """
+    rnd = random.Random(seed)
+    tokens = [rnd.choice(WORDS) for _ in range(n_entities)]
+    text = ' '.join(tokens)
+    lines = []
+    start = 0
+    for i, tok in enumerate(tokens, 1):
+        lines.append('T{}\t{} {} {}\t{}'.format(i, rnd.choice(LABELS), start, start + len(tok), tok))
+        start += len(tok) + 1
+    for i in range(1, n_entities + 1):
+        lines.append('R{}\tRelated Arg1:T{} Arg2:T{}'.format(i, rnd.randint(1, n_entities), rnd.randint(1, n_entities)))
+    for i in range(1, n_entities // 2 + 1):
+        lines.append('A{}\tNegated T{}'.format(i, rnd.randint(1, n_entities)))
+    for i in range(1, n_entities // 4 + 1):
+        lines.append('#{}\tAnnotatorNotes T{}\tnote {}'.format(i, rnd.randint(1, n_entities), i))
+        lines.append('E{}\tTreatment:T{} Theme:T{}'.format(i, rnd.randint(1, n_entities), rnd.randint(1, n_entities)))
+    return text, lines
+
+
+def write_corpus(folder, n_docs, n_entities, seed=0, labels=None, noise=0.0):
+    """
+    Write n_docs .ann/.txt pairs with n_entities entities each.
+    With noise > 0, that fraction of entities gets a different label or shifted span (useful for predictions).
+    """
+    rnd = random.Random(seed)
+    labels = labels or LABELS
+    os.makedirs(folder, exist_ok=True)
+    for d in range(n_docs):
+        doc_rnd = random.Random(d)
+        tokens = [doc_rnd.choice(WORDS) for _ in range(n_entities * 2)]
+        text = ' '.join(tokens)
+        lines = []
+        start = 0
+        t_id = 1
+        for i, tok in enumerate(tokens):
+            if i % 2 == 0:
+                label = labels[doc_rnd.randint(0, len(labels) - 1)]
+                s, e = start, start + len(tok)
+                if noise and rnd.random() < noise:
+                    if rnd.random() < 0.5:
+                        label = rnd.choice(labels)
+                    else:
+                        e += 1
+                lines.append('T{}\t{} {} {}\t{}'.format(t_id, label, s, e, text[s:e]))
+                t_id += 1
+            start += len(tok) + 1
+        with open(os.path.join(folder, 'doc{:06d}.ann'.format(d)), 'w') as f_out:
+            f_out.write('\n'.join(lines) + '\n')
+        with open(os.path.join(folder, 'doc{:06d}.txt'.format(d)), 'w') as f_out:
+            f_out.write(text)
@@ -7,6 +7,15 @@ from . import rwsl
 from . import metrics
 from . import stats
 from . import txt
+from . import table
+from . import store
+from . import cache
+from . import archive
+from . import mapreduce
+from . import matching
+from . import significance
+from . import streaming
+from . import kappa
 
 # Export main classes and functions for convenience
 from .ann_structure import (
@@ -40,4 +49,13 @@ __all__ = [
     "metrics",
     "stats",
     "txt",
+    "table",
+    "store",
+    "cache",
+    "archive",
+    "mapreduce",
+    "matching",
+    "significance",
+    "streaming",
+    "kappa",
 ]
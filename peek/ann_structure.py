@@ -7,10 +7,16 @@ and Placeholder].
 More info about brat standoff format: http://brat.nlplab.org/standoff.html.
 '''
 import os
-from collections import defaultdict, Counter
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, Counter, OrderedDict
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 import glob
 import random
 import copy
+import sys
+import threading
 
 
 # Corpus object (compilation of multiple AnnDocument)
@@ -21,48 +27,345 @@ class AnnCorpus:
     The input of object instances should always be a folder!
     Recursive by default. (TODO: Optional?)
     # TODO: iterable?
+
+    Big corpora can be loaded in parallel by setting workers to the number of processes to use, or by passing any
+    concurrent.futures.Executor as executor (e.g. a ThreadPoolExecutor or an already running pool).
+    Documents are kept in the same order as in a sequential load.
+    Problems found while loading are stored in the errors attribute ({path: [messages]}) instead of being printed,
+    and files that cannot be read at all are left out of the corpus.
+
+    With lazy=True no file is read when the corpus is created: docs becomes a LazyDocList that parses each document
+    the first time it is accessed and keeps the last cache_size ones in memory. Use iter_docs() to go through the
+    whole corpus in constant memory.
+    Corpus stats (count, text_freq, text_freq_lower and the label lists) are computed the first time they are used.
+
+    Set cache_dir to a folder (or a peek.cache.ParseCache) to keep parsed documents on disk: later loads only parse
+    the files that have changed since they were cached. The cache is kept under cache_size_bytes (1 GB by default) by
+    evicting the least recently used documents.
+
+    path can also be a .zip or .tar(.gz) archive of a brat folder, which is read without extracting it (see
+    archive.py). Archives are always read sequentially and cannot be lazy.
     '''
 
-    def __init__(self, path, txt=False, from_list=False):
+    def __init__(self, path, txt=False, from_list=False, workers=None, executor=None, lazy=False, cache_size=128,
+                 cache_dir=None, cache_size_bytes=None):
         # Meta
         self.path = path
         self.name = os.path.split(path.rstrip('/'))[-1]  # corpus name is same as folder's
+        self.errors = {}
+        cache = self._get_cache(cache_dir, cache_size_bytes)
+        # How documents were loaded and (size, mtime) of each file at that point, used by refresh
+        self._load_options = {'txt': txt, 'cache': cache}
+        self._fingerprints = {}
         # Content
-        if from_list:
+        if from_list or isinstance(from_list, list):
             content = from_list
             # From list usage:
             # corpus = AnnCorpus(path='', from_list=[list,with,AnnDocs])
+        elif self.is_archive:
+            # Archives are streamed in order (see archive.py), so they are always read sequentially
+            from . import archive
+            if lazy:
+                raise ValueError('Corpora read from archives cannot be lazy, extract the archive first')
+            self.name = archive.archive_name(path)
+            content = list(archive.iter_archive_documents(path, txt=txt, errors=self.errors))
+        elif lazy:
+            paths = list(glob.iglob(os.path.join(self.path, '**/*.ann'), recursive=True))
+            self._fingerprints.update((f, _fingerprint(f)) for f in paths)
+            content = LazyDocList([DocHandle(f) for f in paths], txt=txt, cache_size=cache_size, errors=self.errors,
+                                  cache=cache)
         else:
-            content = self._construct_corpus(txt)
+            content = self._construct_corpus(txt, workers=workers, executor=executor, cache=cache)
+            if cache is not None:
+                cache.evict()
         self.docs = content
         self.collections = set()
-        # Stats
-        count = self._count_corpus()
-        self.count = count
-        self.text_freq = self._text_frequency_corpus()
-        self.text_freq_lower = self._text_frequency_corpus(lower=True)
-        # Labels found in the corpus
-        self.text_labels = sorted(list(set([ent for ent in self.count['entities']])))
-        self.rel_labels = sorted(list(set([ent for ent in self.count['relations']])))
-        self.event_labels = sorted(list(set([ent for ent in self.count['events']])))
-        self.attr_labels = sorted(list(set([ent for ent in self.count['attributes']])))
+        # Stats, see the properties below
+        self._count = None
+        self._text_freq = None
+        self._text_freq_lower = None
+        self._labels = None
+        self._stats_size = None
+        # Columnar view of the annotations, see to_table
+        self._table = None
+        # Lookup tables for documents by name and collection, see _get_index
+        self._index = None
 
     def __len__(self):
         # Returns the number of documents in the corpus
         return len(self.docs)
 
+    def __setstate__(self, state):
+        # Corpora pickled before stats were computed on demand stored them as plain attributes
+        for k in ['count', 'text_freq', 'text_freq_lower']:
+            state.setdefault('_' + k, state.pop(k, None))
+        for k in ['text_labels', 'rel_labels', 'event_labels', 'attr_labels']:
+            state.pop(k, None)
+        state.setdefault('_labels', None)
+        state.setdefault('_stats_size', len(state['docs']) if state.get('_count') is not None else None)
+        state.setdefault('_table', None)
+        state.setdefault('_index', None)
+        state.setdefault('errors', {})
+        state.setdefault('_load_options', {'txt': False, 'cache': None})
+        state.setdefault('_fingerprints', {})
+        self.__dict__.update(state)
+
+    @staticmethod
+    def _get_cache(cache_dir, cache_size_bytes=None):
+        if cache_dir is None:
+            return None
+        from .cache import DEFAULT_MAX_SIZE, ParseCache
+        if isinstance(cache_dir, ParseCache):
+            return cache_dir
+        return ParseCache(cache_dir, max_size=cache_size_bytes if cache_size_bytes is not None else DEFAULT_MAX_SIZE)
+
+    @property
+    def is_archive(self):
+        # Whether the corpus is read from a .zip/.tar(.gz) archive instead of a folder
+        from . import archive
+        return archive.is_archive(self.path)
+
+    @property
+    def lazy(self):
+        return isinstance(self.docs, LazyDocList)
+
+    def iter_docs(self):
+        '''
+        Go through all the documents in the corpus.
+        Lazy corpora parse each document on the fly and do not keep it afterwards.
+        '''
+        if self.lazy:
+            return self.docs.stream()
+        return iter(self.docs)
+
+    def _doc_refs(self):
+        '''
+        Objects that know each document's path, name and collection without needing to parse it.
+        '''
+        if self.lazy:
+            return self.docs.handles
+        return self.docs
+
+    # Stats
+    # count, text_freq and text_freq_lower are computed together the first time one of them is used.
+    # They are recomputed if documents are added or removed, call invalidate_stats after modifying documents.
+    def _check_stats(self):
+        if self._count is None or self._text_freq is None or self._text_freq_lower is None \
+                or self._stats_size != len(self._doc_refs()):
+            self._compute_stats()
+
+    def invalidate_stats(self):
+        """
+        Forget the corpus' stats, label lists and table so that they are computed again when needed.
+        """
+        self._count = None
+        self._text_freq = None
+        self._text_freq_lower = None
+        self._labels = None
+        self._stats_size = None
+        self._table = None
+
+    @property
+    def count(self):
+        self._check_stats()
+        return self._count
+
+    @count.setter
+    def count(self, value):
+        self._count = value
+        self._labels = None
+
+    @property
+    def text_freq(self):
+        self._check_stats()
+        return self._text_freq
+
+    @text_freq.setter
+    def text_freq(self, value):
+        self._text_freq = value
+
+    @property
+    def text_freq_lower(self):
+        self._check_stats()
+        return self._text_freq_lower
+
+    @text_freq_lower.setter
+    def text_freq_lower(self, value):
+        self._text_freq_lower = value
+
+    # Labels found in the corpus
+    def _get_labels(self, k):
+        if self._labels is None:
+            self._labels = {ann_type: sorted(self.count.get(ann_type, {}))
+                            for ann_type in ['entities', 'relations', 'events', 'attributes']}
+        return self._labels[k]
+
+    @property
+    def text_labels(self):
+        return self._get_labels('entities')
+
+    @property
+    def rel_labels(self):
+        return self._get_labels('relations')
+
+    @property
+    def event_labels(self):
+        return self._get_labels('events')
+
+    @property
+    def attr_labels(self):
+        return self._get_labels('attributes')
+
+    def to_table(self, refresh=False):
+        '''
+        Columnar (NumPy-backed) view of all text annotations in the corpus, see peek.table.AnnTable.
+        It is built the first time it is requested and cached afterwards.
+        :param refresh: rebuild the table (e.g. after modifying the documents, it is rebuilt automatically if documents
+                        are added or removed)
+        :return: AnnTable
+        '''
+        if self._table is None or refresh or len(self._table.doc_names) != len(self._doc_refs()):
+            from .table import AnnTable
+            self._table = AnnTable.from_corpus(self)
+        return self._table
+
     # Corpus construction
-    def _construct_corpus(self, with_text=False):
+    def _construct_corpus(self, with_text=False, workers=None, executor=None, cache=None):
         '''
         Get all .ann files in input folder and return a list of AnnDocuments.
+        If workers or executor are given, documents are parsed in parallel and merged back in glob order.
+        If a ParseCache is given, unchanged documents are read from it instead of being parsed.
         :return: list
         '''
+        paths = list(glob.iglob(os.path.join(self.path, '**/*.ann'), recursive=True))
+        # Files are fingerprinted before parsing, so changes made during the load are found by refresh
+        self._fingerprints.update((f, _fingerprint(f)) for f in paths)
+        # Sequential and parallel loads go through _load_document, so problems are handled the same way
+        n_workers = workers or os.cpu_count() or 1
+        chunksize = _chunksize(len(paths), n_workers)
+        if not workers and executor is None:
+            results = map(_load_document, paths, repeat(with_text), repeat(cache))
+        elif executor is None:
+            with ProcessPoolExecutor(max_workers=n_workers) as pool:
+                results = list(pool.map(_load_document, paths, repeat(with_text), repeat(cache), chunksize=chunksize))
+        else:
+            results = list(executor.map(_load_document, paths, repeat(with_text), repeat(cache), chunksize=chunksize))
+
+        # Executor.map keeps the input order, so the corpus looks exactly like a sequential one
         corpus = []
-        for f in glob.iglob(os.path.join(self.path, '**/*.ann'), recursive=True):
-            corpus.append(AnnDocument(f, txt=with_text))
+        for f, (doc, errors) in zip(paths, results):
+            if errors:
+                self.errors[f] = errors
+            if doc is not None:
+                corpus.append(doc)
 
         return corpus
 
+    # Incremental updates (e.g. for folders that are being annotated)
+    def refresh(self):
+        '''
+        Look for .ann files that have been added, removed or modified (size or modification time) since the corpus
+        was loaded or last refreshed, and only (re)parse those.
+        Cached stats (count, text_freq, text_freq_lower) are updated with the difference instead of being computed
+        again for the whole corpus. Lazy corpora update their list of files and clear their in-memory documents.
+        :return: dict with the paths that were 'added', 'removed' and 'modified'
+        '''
+        if self.is_archive:
+            raise ValueError('Corpora read from archives cannot be refreshed, load the archive again')
+        current = {f: _fingerprint(f) for f in glob.iglob(os.path.join(self.path, '**/*.ann'), recursive=True)}
+        known = {ref.path: self._fingerprints.get(ref.path) for ref in self._doc_refs()}
+        changes = {'added': [f for f in current if f not in known],
+                   'removed': [f for f in known if f not in current],
+                   'modified': [f for f in current if f in known and current[f] != known[f]]}
+        if self.lazy:
+            self._refresh_lazy(current, changes)
+        else:
+            self._refresh_docs(current, changes)
+        self._index = None
+        self._table = None
+        self._labels = None
+        return changes
+
+    def _refresh_docs(self, current, changes):
+        stats_ready = self._count is not None and self._text_freq is not None and self._text_freq_lower is not None \
+            and self._stats_size == len(self.docs)
+        positions = {doc.path: i for i, doc in enumerate(self.docs)}
+        removed = set()
+        for f in changes['removed'] + changes['modified']:
+            if f in positions:
+                if stats_ready:
+                    self._apply_stats_delta(self.docs[positions[f]], remove=True)
+                removed.add(positions[f])
+            self.errors.pop(f, None)
+            self._fingerprints.pop(f, None)
+        # Modified documents keep their position in the corpus, new ones go at the end
+        new_docs = {}
+        for f in changes['modified'] + changes['added']:
+            self._fingerprints[f] = current[f]
+            doc = self._load_one(f)
+            if f in positions:
+                doc.collection = self.docs[positions[f]].collection
+                new_docs[positions[f]] = doc
+            else:
+                new_docs[len(self.docs) + len(new_docs)] = doc
+        docs = [new_docs.get(i, doc) for i, doc in enumerate(self.docs)
+                if i not in removed or i in new_docs]
+        docs.extend(new_docs[i] for i in sorted(new_docs) if i >= len(self.docs))
+        if stats_ready:
+            for doc in new_docs.values():
+                self._apply_stats_delta(doc)
+            self._stats_size = len(docs)
+        self.docs[:] = docs
+
+    def _refresh_lazy(self, current, changes):
+        gone = set(changes['removed'])
+        handles = [h for h in self.docs.handles if h.path not in gone]
+        handles.extend(DocHandle(f) for f in changes['added'])
+        self.docs.handles = handles
+        self.docs.clear_cache()
+        for f in changes['removed']:
+            self._fingerprints.pop(f, None)
+            self.errors.pop(f, None)
+        self._fingerprints.update((f, current[f]) for f in changes['added'] + changes['modified'])
+        # Documents are read from disk again when needed, so are the stats
+        if changes['added'] or changes['removed'] or changes['modified']:
+            self.invalidate_stats()
+
+    def _load_one(self, f):
+        cache = self._load_options['cache']
+        txt = self._load_options['txt']
+        doc = cache.load(f, txt) if cache is not None else AnnDocument(f, txt=txt)
+        if doc.errors:
+            self.errors[f] = doc.errors
+        return doc
+
+    def _apply_stats_delta(self, doc, remove=False):
+        '''
+        Add (or remove) a document's counters to the corpus totals in place.
+        '''
+        for total, doc_stats in [(self._count, doc.count), (self._text_freq, doc.text_freq),
+                                 (self._text_freq_lower, doc.text_freq_lower)]:
+            for k, counter in doc_stats.items():
+                if k not in total:
+                    total[k] = Counter()
+                if remove:
+                    total[k].subtract(counter)
+                    for item in [item for item in counter if total[k][item] <= 0]:
+                        del total[k][item]
+                    # Labels that are not in the corpus anymore disappear from the text frequencies
+                    if not total[k] and total is not self._count:
+                        del total[k]
+                else:
+                    total[k].update(counter)
+
+    def watch(self, interval=60, callback=None):
+        '''
+        Call refresh every interval seconds in a background thread.
+        :param callback: optional function called with the corpus and the changes found (only if there are some)
+        :return: CorpusWatcher, call its stop method to stop watching
+        '''
+        return CorpusWatcher(self, interval, callback)
+
     # Corpus management
     # We might have different types of documents, or even the same documents annotated with multiple systems
     # Collections are a way to group documents within the same folder
@@ -76,11 +379,12 @@ class AnnCorpus:
         :return:
         '''
         counter = defaultdict(int)
-        for doc in self.docs:
+        for doc in self._doc_refs():
             collection = doc.path.split('/')[-2]
             doc.collection = collection
             counter[collection] += 1
             self.collections.update([collection])
+        self._index = None
         print('Collections assigned:\n{}'.format('\n'.join(['{}: {}'.format(c, counter[c]) for c in counter])))
 
     # 2. Use a list of possible collections
@@ -90,7 +394,7 @@ class AnnCorpus:
         collections_list.sort(key=len, reverse=True)
         for collection in collections_list:
             d = 0
-            for doc in self.docs:
+            for doc in self._doc_refs():
                 # if collection in doc.path.split('/')[:-1]:
                 if not doc.collection:
                     if collection in doc.path:
@@ -98,6 +402,7 @@ class AnnCorpus:
                         d += 1
             counter.append(d)
             self.collections.update([collection])
+        self._index = None
         print('Collections assigned:\n{}'.format('\n'.join([str(z) for z in zip(collections_list, counter)])))
 
     # 3. Use a regular expression to look for a pattern inside the file's path
@@ -113,54 +418,71 @@ class AnnCorpus:
     #     print('Collections assigned:\n{}'.format('\n'.join(['{}: {}'.format(c, counter[c]) for c in counter])))
 
     # Count
-    def _count_corpus(self):
+    def _compute_stats(self):
         '''
-        Return sum of all counters
-        :return:
+        Merge all document counters and text frequencies in a single pass over the corpus.
+        Counters are updated in place instead of being added up (which would copy them for every document).
         '''
-        count = {}
-        for doc in self.docs:
-            for k in doc.count.keys():
-                if k not in count.keys():
-                    count[k] = Counter()
-                count[k] += doc.count[k]
-
-        return count
-
-    def _text_frequency_corpus(self, lower=False):
-        '''
-        Return sum of all text frequency counters.
-        :return:
-        '''
-        count = {}
-        for doc in self.docs:
-            if lower:
-                for k in doc.text_freq_lower.keys():
-                    if k not in count.keys():
-                        count[k] = Counter()
-                    count[k] += doc.text_freq_lower[k]
-            else:
-                for k in doc.text_freq.keys():
-                    if k not in count.keys():
-                        count[k] = Counter()
-                    count[k] += doc.text_freq[k]
-
-        return count
+        count, text_freq, text_freq_lower = {}, {}, {}
+        n_docs = 0
+        for doc in self.iter_docs():
+            for total, doc_stats in [(count, doc.count), (text_freq, doc.text_freq),
+                                     (text_freq_lower, doc.text_freq_lower)]:
+                for k, counter in doc_stats.items():
+                    if k not in total:
+                        total[k] = Counter()
+                    total[k].update(counter)
+            n_docs += 1
+        self._count, self._text_freq, self._text_freq_lower = count, text_freq, text_freq_lower
+        self._stats_size = n_docs
+        self._labels = None
 
     # Document retrieval
+    def _get_index(self):
+        """
+        Hash indices to find documents by name and by (name, collection).
+        They are built on first use, rebuilt when collections are assigned and when documents are added or removed.
+        :return: tuple of dicts ({(name, collection): position}, {name: [positions]})
+        """
+        refs = self._doc_refs()
+        if self._index is None or self._index[2] != len(refs):
+            by_key = {}
+            by_name = defaultdict(list)
+            for i, doc in enumerate(refs):
+                by_key.setdefault((doc.name, doc.collection), i)
+                by_name[doc.name].append(i)
+            self._index = (by_key, dict(by_name), len(refs))
+        return self._index
+
+    def _find_doc(self, f_name, collection=''):
+        # Position of the first document with the given name (and collection), None if it is not in the corpus
+        by_key, by_name, _ = self._get_index()
+        if collection:
+            return by_key.get((f_name, collection))
+        positions = by_name.get(f_name)
+        return positions[0] if positions else None
+
     def get_doc_by_name(self, f_name, collection=''):
         """
         Returns a given doc in the corpus.
-        TODO: allow for multiple docs?
+        Use get_docs_by_name to retrieve multiple docs at once.
         :return:
         """
-        try:
-            if collection:
-                return [doc for doc in self.docs if doc.name == f_name and doc.collection == collection][0]
-            else:
-                return [doc for doc in self.docs if doc.name == f_name][0]
-        except IndexError:
+        i = self._find_doc(f_name, collection)
+        if i is None:
             print('File not in corpus')
+            return None
+        return self.docs[i]
+
+    def get_docs_by_name(self, f_names, collection=''):
+        """
+        Returns the docs with the given names (in the same order), None for names that are not in the corpus.
+        :param f_names: iterable of document names
+        :param collection: only look for documents in this collection
+        :return: list
+        """
+        positions = [self._find_doc(f_name, collection) for f_name in f_names]
+        return [self.docs[i] if i is not None else None for i in positions]
 
     def get_random_doc(self):
         """
@@ -171,7 +493,7 @@ class AnnCorpus:
 
     def get_text_from_tag(self, tag):
         all_text = []
-        for doc in self.docs:
+        for doc in self.iter_docs():
             all_text.extend(doc.get_text_from_tag(tag))
 
         return all_text
@@ -181,7 +503,158 @@ class AnnCorpus:
         Return which files have no annotations.
         A file should be empty if it has no TextBound annotations.
         """
-        return [doc.path for doc in self.docs if not doc.anns['entities']]
+        return [doc.path for doc in self.iter_docs() if not doc.anns['entities']]
+
+
+def _fingerprint(path):
+    # Size and modification time of a file, used to find out whether it changed
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class CorpusWatcher:
+    '''
+    Background thread that refreshes a corpus periodically (see AnnCorpus.watch).
+    The corpus is modified in place, avoid reading it from other threads while a refresh is running.
+    '''
+
+    def __init__(self, corpus, interval=60, callback=None):
+        self.corpus = corpus
+        self.interval = interval
+        self.callback = callback
+        self.errors = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                changes = self.corpus.refresh()
+                if self.callback is not None and any(changes.values()):
+                    self.callback(self.corpus, changes)
+            except Exception as e:
+                # Keep watching, files might be half-written
+                self.errors.append(e)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+# Lazy corpora
+class DocHandle:
+    '''
+    Lightweight reference to an .ann file that has not been parsed (yet).
+    '''
+
+    def __init__(self, path, collection=''):
+        self.path = path
+        self.name = path.split('/')[-1][:-4]  # same naming as AnnDocument
+        self.collection = collection
+
+    def __repr__(self):
+        return self.name
+
+    def load(self, txt=False, cache=None):
+        if cache is not None:
+            doc = cache.load(self.path, txt, quiet=True)
+        else:
+            doc = AnnDocument(self.path, txt=txt, quiet=True)
+        doc.collection = self.collection
+        return doc
+
+
+class LazyDocList(Sequence):
+    '''
+    List of documents that are only parsed when accessed.
+    The last cache_size documents used are kept in memory (LRU).
+    '''
+
+    def __init__(self, handles, txt=False, cache_size=128, errors=None, cache=None):
+        self.handles = handles
+        self.txt = txt
+        self.cache_size = cache_size
+        # Optional on-disk ParseCache
+        self.cache = cache
+        # Loading problems are reported to the corpus' errors dict
+        self.errors = errors if errors is not None else {}
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return len(self.handles)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._get(j) for j in range(*i.indices(len(self.handles)))]
+        if i < 0:
+            i += len(self.handles)
+        return self._get(i)
+
+    def __iter__(self):
+        for i in range(len(self.handles)):
+            yield self._get(i)
+
+    def _load(self, i):
+        handle = self.handles[i]
+        doc = handle.load(self.txt, cache=getattr(self, 'cache', None))
+        if doc.errors:
+            self.errors[handle.path] = doc.errors
+        return doc
+
+    def _get(self, i):
+        if i in self._cache:
+            self._cache.move_to_end(i)
+            doc = self._cache[i]
+        else:
+            doc = self._load(i)
+            if self.cache_size:
+                self._cache[i] = doc
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        # Collections may have been assigned to the handle after the document was cached
+        doc.collection = self.handles[i].collection
+        return doc
+
+    def stream(self):
+        '''
+        Yield every document once without filling the cache.
+        '''
+        for i in range(len(self.handles)):
+            if i in self._cache:
+                yield self._get(i)
+            else:
+                yield self._load(i)
+        if getattr(self, 'cache', None) is not None:
+            self.cache.evict()
+
+    def clear_cache(self):
+        self._cache.clear()
+
+
+# Parallel loading helpers
+# They need to live at module level so that process pools can pickle them
+def _load_document(path, with_text=False, cache=None):
+    '''
+    Build an AnnDocument without printing anything.
+    :return: tuple with the document (None if it could not be read) and the list of problems found
+    '''
+    try:
+        if cache is not None:
+            doc = cache.load(path, with_text, quiet=True)
+        else:
+            doc = AnnDocument(path, txt=with_text, quiet=True)
+    except Exception as e:
+        return None, ['{}: {}'.format(type(e).__name__, e)]
+    return doc, doc.errors
+
+
+def _chunksize(n_items, n_workers):
+    # A few chunks per worker keeps the pool busy without paying the IPC cost of one task per file
+    return max(1, n_items // (n_workers * 4))
 
 
 # Document object (compilation of lines of different tags)
@@ -192,31 +665,77 @@ class AnnDocument:
     The input of object instances should always be a .ann file!
     """
 
-    def __init__(self, path, txt=False):
+    def __init__(self, path, txt=False, quiet=False):
         # Meta
         self.path = path
         self.name = path.split('/')[-1][:-4]  # .ann ending not included in name
         self.collection = ''
+        # Problems found while reading the files (quiet=True stores them without printing)
+        self.errors = []
+        self._quiet = quiet
         # Content
         content = self._construct_document()
         self.anns = content
-        # Text files  ** This is experimental, might take a while to load big corpora **
+        # Text files, see DocText (the file is only read when the text is used)
         if txt:
-            try:
-                with open(self.path[:-3] + 'txt', 'r') as doc_txt:
-                    #self.txt = [sent.rstrip('\n') if sent != '\n' else sent for sent in doc_txt.readlines()]
-                    self.txt = [sent.rstrip('\n') for sent in doc_txt.readlines()]
-                    # To get the entire text as a string, you can join all items in the list using '\n'.join(doc.txt)
-                    # I know this is weird but it's a workaround for files with multiple newlines together
-            except FileNotFoundError:
-                print('Text file for <{}> not found!'.format(self.path))
+            if os.path.isfile(self.path[:-3] + 'txt'):
+                self.txt = DocText(self.path[:-3] + 'txt')
+            else:
+                self._report('Text file for <{}> not found!'.format(self.path))
                 self.txt = []
         else:
             self.txt = []
-        # Stats
-        self.count = self._count_tags()
-        self.text_freq = self._text_frequency()
-        self.text_freq_lower = self._text_frequency(lower=True)
+        # Stats are computed when first used, see the properties below
+        self._stats_key = None
+
+    @classmethod
+    def from_annotations(cls, path, anns, txt=None, collection=''):
+        """
+        Build a document from annotations that have already been read (e.g. from a stored corpus) instead of
+        parsing its .ann file. Interactions between annotations are linked as usual.
+        :param path: path of the original .ann file (used for name and collections)
+        :param anns: dict with lists of annotations, as in AnnDocument.anns
+        :param txt: optional text of the document (string or DocText)
+        :param collection: collection the document belongs to
+        :return: AnnDocument
+        """
+        doc = cls.__new__(cls)
+        doc.path = path
+        doc.name = path.split('/')[-1][:-4]
+        doc.collection = collection
+        doc.errors = []
+        doc._quiet = True
+        doc.anns = {k: anns.get(k, []) for k in ['entities', 'relations', 'events', 'attributes', 'notes']}
+        cls._link_annotations(doc.anns)
+        if isinstance(txt, str):
+            txt = DocText(text=txt)
+        doc.txt = txt if txt is not None else []
+        doc._stats_key = None
+        return doc
+
+    @classmethod
+    def from_lines(cls, path, lines, txt=None, collection='', quiet=True):
+        """
+        Build a document from the lines of an .ann file that is not on disk (e.g. a member of an archive).
+        :param path: path used for the document's name and collections
+        :param lines: iterable of .ann lines (an open file works too)
+        :param txt: optional text of the document (string or DocText)
+        :param collection: collection the document belongs to
+        :param quiet: whether to store problems found in errors without printing them
+        :return: AnnDocument
+        """
+        doc = cls.__new__(cls)
+        doc.path = path
+        doc.name = path.split('/')[-1][:-4]
+        doc.collection = collection
+        doc.errors = []
+        doc._quiet = quiet
+        doc.anns = doc._construct_document(lines)
+        if isinstance(txt, str):
+            txt = DocText(text=txt)
+        doc.txt = txt if txt is not None else []
+        doc._stats_key = None
+        return doc
 
     def __str__(self):
         # TODO: verbose and non-verbose? (don't print things that = 0)
@@ -230,6 +749,83 @@ class AnnDocument:
         # Returns whether a given annotation is equal to another annotation within the document
         return any([item == ann for ann in self.anns['entities']])
 
+    # Text
+    @property
+    def text(self):
+        """
+        Whole text of the document as a single string (same as '\\n'.join(doc.txt), but built only once).
+        """
+        if isinstance(self.txt, DocText):
+            return self.txt.text
+        return '\n'.join(self.txt)
+
+    def get_span_text(self, start, end):
+        """
+        Text between two brat character offsets.
+        """
+        if isinstance(self.txt, DocText):
+            return self.txt.span(start, end)
+        return self.text[start:end]
+
+    def __setstate__(self, state):
+        # Documents pickled before stats were computed on demand stored them as plain attributes
+        for k in ['count', 'text_freq', 'text_freq_lower']:
+            state.pop(k, None)
+        state['_stats_key'] = None
+        state.setdefault('errors', [])
+        self.__dict__.update(state)
+
+    # Stats
+    def _check_stats(self):
+        # Recompute if annotations were added or removed since last time, call invalidate_stats for other changes
+        key = tuple(len(anns) for anns in self.anns.values())
+        if getattr(self, '_stats_key', None) != key:
+            self._compute_stats()
+            self._stats_key = key
+
+    def invalidate_stats(self):
+        self._stats_key = None
+
+    def _compute_stats(self):
+        """
+        Count tags and annotated texts in one pass (same results as _count_tags and _text_frequency).
+        """
+        count = {}
+        for k, anns in self.anns.items():
+            tags = Counter()
+            for a in anns:
+                tags[a.tag] += 1
+            count[k] = tags
+        text_freq, text_freq_lower = {}, {}
+        for ann in self.anns['entities']:
+            if ann.tag not in text_freq:
+                text_freq[ann.tag] = Counter()
+                text_freq_lower[ann.tag] = Counter()
+            text_freq[ann.tag][ann.text] += 1
+            text_freq_lower[ann.tag][ann.text.lower()] += 1
+        self._count, self._text_freq, self._text_freq_lower = count, text_freq, text_freq_lower
+
+    @property
+    def count(self):
+        self._check_stats()
+        return self._count
+
+    @property
+    def text_freq(self):
+        self._check_stats()
+        return self._text_freq
+
+    @property
+    def text_freq_lower(self):
+        self._check_stats()
+        return self._text_freq_lower
+
+    def _report(self, message):
+        # Keep track of loading problems, print them unless the document is being loaded quietly
+        self.errors.append(message)
+        if not self._quiet:
+            print(message)
+
     # Line understanding
     @staticmethod
     def _parse_line(line):
@@ -275,58 +871,81 @@ class AnnDocument:
         # TODO: read normalizations and placeholders
 
     # Object building
-    def _construct_document(self):
+    def _construct_document(self, lines=None):
         """
         Open .ann file, read all lines and construct the document.
+        :param lines: optional iterable of lines to use instead of opening the file
         :return: dict
         """
+        if lines is None:
+            with open(self.path, 'r', encoding='utf-8') as f_in:
+                return self._construct_document(f_in)
         # Create dict with all of the file's content
         # TODO: implement normalizations and placeholders
         doc = {'entities': [], 'relations': [], 'events': [], 'attributes': [], 'notes': []}
-        with open(self.path, 'r', encoding='utf-8') as f_in:
-            for line in f_in:
-                try:
-                    ann = self._parse_line(line)
-                except IndexError:
-                    print(
-                        'File {} seems to be faulty, please check and load the corpus again. Ignoring wrongly-formatted line for now...'.format(
-                            self.path))
-                    continue
-
-                if isinstance(ann, Entity):
-                    doc['entities'].append(ann)
-                elif isinstance(ann, Relation):
-                    doc['relations'].append(ann)
-                elif isinstance(ann, Event):
-                    doc['events'].append(ann)
-                elif isinstance(ann, Attribute):
-                    doc['attributes'].append(ann)
-                elif isinstance(ann, Note):
-                    doc['notes'].append(ann)
-                else:
-                    print('Could not recognize the following line in file {}, please check:\n{}\n'.format(self.path,
-                                                                                                          line))
-
-        # Get interactions between entities and other types
-        for ent in doc['entities']:
-            # Build relations
-            for rel in doc['relations']:
-                # Debería separar arg1 y arg2 pero ahora mismo no sé cuál es el mejor modo, TODO
-                if rel.arg1.split(':')[-1] == ent.name:
-                    ent.rels.append(rel)
-                elif rel.arg2.split(':')[-1] == ent.name:
-                    ent.rels.append(rel)
-            # Build attributes
-            for att in doc['attributes']:
-                if att.arguments[0] == ent.name:
-                    ent.attr.append(att)
-            # Build notes
-            for note in doc['notes']:
-                if note.ann_id == ent.name:
-                    ent.notes.append(note)
+        for line in lines:
+            try:
+                ann = self._parse_line(line)
+            except IndexError:
+                self._report(
+                    'File {} seems to be faulty, please check and load the corpus again. Ignoring wrongly-formatted line for now...'.format(
+                        self.path))
+                continue
+
+            if isinstance(ann, Entity):
+                doc['entities'].append(ann)
+            elif isinstance(ann, Relation):
+                doc['relations'].append(ann)
+            elif isinstance(ann, Event):
+                doc['events'].append(ann)
+            elif isinstance(ann, Attribute):
+                doc['attributes'].append(ann)
+            elif isinstance(ann, Note):
+                doc['notes'].append(ann)
+            else:
+                self._report('Could not recognize the following line in file {}, please check:\n{}\n'.format(self.path,
+                                                                                                             line))
+
+        self._link_annotations(doc)
 
         return doc
 
+    @staticmethod
+    def _link_annotations(doc):
+        """
+        Attach relations, events, attributes and notes to the entities they point to.
+        Entities are indexed by ID first, so every other annotation is only looked at once.
+        :param doc: dict with annotations, as returned by _construct_document
+        """
+        ids = {ent.name: ent for ent in doc['entities']}
+        # Build relations
+        for rel in doc['relations']:
+            # Debería separar arg1 y arg2 pero ahora mismo no sé cuál es el mejor modo, TODO
+            arg1 = ids.get(rel.arg1.split(':')[-1])
+            arg2 = ids.get(rel.arg2.split(':')[-1])
+            if arg1 is not None:
+                arg1._link('_rels', rel)
+            if arg2 is not None and arg2 is not arg1:
+                arg2._link('_rels', rel)
+        # Build events (both the trigger and the arguments point to the event)
+        for eve in doc['events']:
+            linked = set()
+            for arg in [eve.trigger] + [arg.split(':')[-1] for arg in eve.arguments]:
+                ent = ids.get(arg)
+                if ent is not None and arg not in linked:
+                    ent._link('_events', eve)
+                    linked.add(arg)
+        # Build attributes
+        for att in doc['attributes']:
+            ent = ids.get(att.arguments[0]) if att.arguments else None
+            if ent is not None:
+                ent._link('_attr', att)
+        # Build notes
+        for note in doc['notes']:
+            ent = ids.get(note.ann_id)
+            if ent is not None:
+                ent._link('_notes', note)
+
     # Count
     def _count_tags(self):
         """
@@ -367,11 +986,231 @@ class AnnDocument:
 
         return count
 
+    # Span queries
+    @property
+    def span_index(self):
+        """
+        Interval index over the document's entities (see SpanIndex).
+        It is built on first use and rebuilt if the entity list is replaced or changes size.
+        """
+        ents = self.anns['entities']
+        index = getattr(self, '_span_index', None)
+        if index is None or index.entities_list is not ents or len(index) != len(ents):
+            index = SpanIndex(ents)
+            self._span_index = index
+        return index
+
+    def overlapping(self, start, end):
+        """
+        Entities that share at least one character with [start, end).
+        """
+        return self.span_index.overlapping(start, end)
+
+    def contained_in(self, start, end):
+        """
+        Entities that are inside [start, end).
+        """
+        return self.span_index.contained_in(start, end)
+
+    def containing(self, start, end):
+        """
+        Entities that cover the whole of [start, end).
+        """
+        return self.span_index.containing(start, end)
+
     # Co-occurrence
     # Document wise?
     # Span wise?
 
 
+class DocText(Sequence):
+    """
+    Text of a document, stored once as a single string together with the offset where each line starts.
+    The file is not read until the text is used.
+
+    It behaves like the list of lines AnnDocument used to keep in its txt attribute (lines without their final
+    newline, so '\\n'.join(doc.txt) still gives the whole text), while brat offsets can be sliced directly with span.
+    """
+
+    def __init__(self, path=None, text=None):
+        self.path = path
+        self._text = None
+        self._line_starts = None
+        self._n_lines = None
+        if text is not None:
+            self._set_text(text)
+
+    def _set_text(self, raw):
+        # Same as reading lines and removing their newline: a final newline does not start a new line
+        self._n_lines = raw.count('\n') + (0 if raw == '' or raw.endswith('\n') else 1)
+        self._text = raw[:-1] if raw.endswith('\n') else raw
+
+    def _load(self):
+        if self._text is None:
+            with open(self.path, 'r') as doc_txt:
+                self._set_text(doc_txt.read())
+
+    @property
+    def text(self):
+        self._load()
+        return self._text
+
+    @property
+    def line_starts(self):
+        """
+        Character offset where each line starts.
+        """
+        if self._line_starts is None:
+            text = self.text
+            starts = [0]
+            i = text.find('\n')
+            while i != -1:
+                starts.append(i + 1)
+                i = text.find('\n', i + 1)
+            self._line_starts = starts[:self._n_lines]
+        return self._line_starts
+
+    def span(self, start, end):
+        """
+        Text between two brat character offsets.
+        """
+        return self.text[start:end]
+
+    def line_of(self, offset):
+        """
+        Index of the line that contains a character offset.
+        """
+        return bisect_right(self.line_starts, offset) - 1
+
+    def __len__(self):
+        self._load()
+        return self._n_lines
+
+    def __bool__(self):
+        # An empty file has no lines, no need to read the others to know they have some
+        if self._text is None and self.path is not None:
+            return os.path.getsize(self.path) > 0
+        return len(self) > 0
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('line index out of range')
+        starts = self.line_starts
+        end = starts[i + 1] - 1 if i + 1 < len(starts) else len(self._text)
+        return self._text[starts[i]:end]
+
+    def __iter__(self):
+        text = self.text
+        starts = self.line_starts
+        for i, start in enumerate(starts):
+            yield text[start:starts[i + 1] - 1 if i + 1 < len(starts) else len(text)]
+
+    def __eq__(self, other):
+        if isinstance(other, (DocText, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class SpanIndex:
+    """
+    Interval index (centered interval tree plus entities sorted by start) over a list of entities.
+    Queries take O(log n + number of results) and return entities in the same order as the original list.
+    Spans are read as half-open ranges [start, end), like brat offsets, so contiguous entities do not overlap.
+    # TODO: Discontinuous spans, only the first fragment is indexed for now (as in Entity.compare_overlap)
+    """
+
+    def __init__(self, entities):
+        self.entities_list = entities
+        self.entities = list(entities)
+        spans = [(ent.span[0][0], ent.span[0][1], i) for i, ent in enumerate(self.entities)]
+        self._by_start = sorted(spans)
+        self._starts = [sp[0] for sp in self._by_start]
+        self._root = self._build(spans)
+
+    def __len__(self):
+        return len(self.entities)
+
+    @staticmethod
+    def _build(spans):
+        """
+        Each node keeps the spans that contain its center, sorted by start and by end (descending).
+        Spans that end before the center go to the left subtree and spans that start after it to the right one.
+        """
+        if not spans:
+            return None
+        points = sorted(p for sp in spans for p in sp[:2])
+        center = points[len(points) // 2]
+        here, left, right = [], [], []
+        for sp in spans:
+            if sp[1] < center:
+                left.append(sp)
+            elif sp[0] > center:
+                right.append(sp)
+            else:
+                here.append(sp)
+        return (center, sorted(here), sorted(here, key=lambda sp: -sp[1]),
+                SpanIndex._build(left), SpanIndex._build(right))
+
+    def _stab(self, point, closed=False):
+        """
+        Positions of the spans that contain point (start <= point < end, or start <= point <= end if closed).
+        """
+        found = []
+        node = self._root
+        while node is not None:
+            center, by_start, by_end, left, right = node
+            if point < center:
+                # Every span here ends after the point, check their start
+                for start, end, i in by_start:
+                    if start > point:
+                        break
+                    found.append(i)
+                node = left
+            else:
+                # Every span here starts before the point, check their end
+                for start, end, i in by_end:
+                    if end < point or (end == point and not closed):
+                        break
+                    found.append(i)
+                node = right
+        return found
+
+    def _entities(self, positions):
+        return [self.entities[i] for i in sorted(positions)]
+
+    def overlapping(self, start, end):
+        """
+        Entities that share at least one character with [start, end).
+        """
+        # Spans that contain the first character plus spans that start inside the range
+        found = self._stab(start)
+        found.extend(sp[2] for sp in self._by_start[bisect_right(self._starts, start):bisect_left(self._starts, end)])
+        return self._entities(found)
+
+    def contained_in(self, start, end):
+        """
+        Entities that are inside [start, end).
+        """
+        candidates = self._by_start[bisect_left(self._starts, start):bisect_right(self._starts, end)]
+        return self._entities([i for s, e, i in candidates if e <= end])
+
+    def containing(self, start, end):
+        """
+        Entities that cover the whole of [start, end).
+        """
+        return self._entities([i for i in self._stab(start, closed=True) if self.entities[i].span[0][1] >= end])
+
+
 class AnnSentence(AnnDocument):
     """
     A sentence is a special kind of AnnDocument that is fed metadata, annotations and text manually.
@@ -382,21 +1221,21 @@ class AnnSentence(AnnDocument):
         self.path = ""
         self.name = name
         self.source = ""
+        self.collection = ''
+        self.errors = []
         # Content
         self.anns = {'entities': [], 'relations': [], 'events': [], 'attributes': [], 'notes': []}
         # Text files  ** This is experimental, might take a while to load big corpora **
         self.txt = []
-        # Stats
-        self.count = self._count_tags()
-        self.text_freq = self._text_frequency()
-        self.text_freq_lower = self._text_frequency(lower=True)
+        # Stats are computed when first used
+        self._stats_key = None
 
     def update_stats(self):
         """
         Stats items should be updated after adding new ones
+        (they are recomputed automatically when annotations are added, this also covers modified annotations)
         """
-        self.count = self._count_tags()
-        self.text_freq = self._text_frequency()
+        self.invalidate_stats()
 
     def copy_entity(self, ent):
         """
@@ -428,24 +1267,73 @@ class AnnSentence(AnnDocument):
 
 
 # Annotation line atoms
+# Corpora can have tens of millions of these, so they use __slots__ instead of a __dict__, tags and IDs are interned
+# (there are only a few different ones) and the Entity interaction lists are only created when they are needed.
+class _Annotation:
+    __slots__ = ()
+
+    def _slot_names(self):
+        return [slot for cls in type(self).__mro__ for slot in getattr(cls, '__slots__', ())]
+
+    def __getstate__(self):
+        return {slot: getattr(self, slot) for slot in self._slot_names()}
+
+    def __setstate__(self, state):
+        # Objects pickled before __slots__ were added store their state as a plain dict, which also works here
+        if isinstance(state, tuple):
+            state = {**(state[0] or {}), **(state[1] or {})}
+        for k, v in state.items():
+            setattr(self, k, v)
+
+
+def _interaction_list(slot):
+    """
+    Property for an Entity interaction list that is only created when something is linked to the entity.
+    Reading it does not create it: entities without interactions give an empty tuple (assign a list to change it).
+    """
+    def getter(self):
+        value = getattr(self, slot)
+        return () if value is None else value
+
+    def setter(self, value):
+        setattr(self, slot, value)
+
+    return property(getter, setter)
+
+
 # Entity (also called TextBound as they are the only ones that have text)
-class Entity:
+class Entity(_Annotation):
+    __slots__ = ('name', 'tag', 'span', 'text', '_rels', '_events', '_attr', '_notes')
+
     def __init__(self, name: str, tag: str, span: tuple, text: str):
-        self.name = name
-        self.tag = tag
-        self.span = span  # Spans are tuples with two tuples inside
+        self.name = sys.intern(name)
+        self.tag = sys.intern(tag)
+        self.span = span if isinstance(span, tuple) else tuple(tuple(s) for s in span)  # Spans are tuples with two tuples inside
         self.text = text
-        # # Entity interactions:
+        # # Entity interactions (see the properties below):
         # # nested (elements that share part of span)
         # self.nested = []
         # # relations pointing to self
-        self.rels = []
+        self._rels = None
         # # events pointing to self
-        self.events = []  # Separate triggers and arguments
+        self._events = None  # Separate triggers and arguments
         # # annotation's attributes
-        self.attr = []
+        self._attr = None
         # # annotator's notes
-        self.notes = []
+        self._notes = None
+
+    rels = _interaction_list('_rels')
+    events = _interaction_list('_events')
+    attr = _interaction_list('_attr')
+    notes = _interaction_list('_notes')
+
+    def _link(self, slot, ann):
+        # Add an annotation pointing to the entity, creating its interaction list if needed (see _link_annotations)
+        value = getattr(self, slot)
+        if value is None:
+            value = []
+            setattr(self, slot, value)
+        value.append(ann)
 
     def __repr__(self):
         if len(self.span) == 2:
@@ -491,10 +1379,12 @@ class Entity:
 
 
 # Relation
-class Relation:
+class Relation(_Annotation):
+    __slots__ = ('name', 'tag', 'arg1', 'arg2')
+
     def __init__(self, name: str, tag: str, arg1: str, arg2: str):
-        self.name = name
-        self.tag = tag
+        self.name = sys.intern(name)
+        self.tag = sys.intern(tag)
         self.arg1 = arg1
         self.arg2 = arg2
 
@@ -503,11 +1393,13 @@ class Relation:
 
 
 # Event
-class Event:
+class Event(_Annotation):
+    __slots__ = ('name', 'tag', 'trigger', 'arguments')
+
     def __init__(self, name: str, tag: str, trigger: str, arguments: list):
-        self.name = name
-        self.tag = tag
-        self.trigger = trigger
+        self.name = sys.intern(name)
+        self.tag = sys.intern(tag)
+        self.trigger = sys.intern(trigger)
         self.arguments = arguments
 
     def __repr__(self):
@@ -515,10 +1407,12 @@ class Event:
 
 
 # Attributes and modifications
-class Attribute:
+class Attribute(_Annotation):
+    __slots__ = ('name', 'tag', 'arguments', 'type')
+
     def __init__(self, name: str, tag: str, arguments: list):
-        self.name = name
-        self.tag = tag
+        self.name = sys.intern(name)
+        self.tag = sys.intern(tag)
         self.arguments = arguments
         self.type = self.check_type()
 
@@ -533,20 +1427,24 @@ class Attribute:
 
 # Normalizations
 # TODO: idk how this type works, check if parts are correct
-class Normalization:
+class Normalization(_Annotation):
+    __slots__ = ('name', 'tag', 'referent', 'norm')
+
     def __init__(self, name, tag, referent, norm):
-        self.name = name
-        self.tag = tag
+        self.name = sys.intern(name)
+        self.tag = sys.intern(tag)
         self.referent = referent
         self.norm = norm
 
 
 # Note
-class Note:
+class Note(_Annotation):
+    __slots__ = ('name', 'tag', 'ann_id', 'note')
+
     def __init__(self, name: str, tag: str, ann_id: str, note: str):
-        self.name = name
-        self.tag = tag
-        self.ann_id = ann_id
+        self.name = sys.intern(name)
+        self.tag = sys.intern(tag)
+        self.ann_id = sys.intern(ann_id)
         self.note = note
 
     def __repr__(self):
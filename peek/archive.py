@@ -0,0 +1,188 @@
+"""
+Read and write brat files straight from .zip and .tar(.gz/.bz2/.xz) archives, without extracting them.
+
+Reading: AnnCorpus('round_1.tar.gz') streams the archive's members in order and builds a document for each .ann
+member (with the text of the .txt member with the same name when txt=True). Documents get the path
+<archive>/<member>, so names and create_collections_subfolders work as with folders.
+Writing: pass an ArchiveWriter instead of a folder to rwsl.write_ann_file and rwsl.write_txt_file.
+"""
+from . import ann_structure
+
+import io
+import os
+import tarfile
+import time
+import zipfile
+
+_TAR_MODES = {'.tar': '', '.tar.gz': 'gz', '.tgz': 'gz', '.tar.bz2': 'bz2', '.tbz2': 'bz2', '.tar.xz': 'xz',
+              '.txz': 'xz'}
+
+
+def _extension(path):
+    # Archive extension of a path ('' if it is not an archive)
+    lower = path.lower()
+    for ext in sorted(list(_TAR_MODES) + ['.zip'], key=len, reverse=True):
+        if lower.endswith(ext):
+            return ext
+    return ''
+
+
+def is_archive(path):
+    """
+    Whether path is a (supported) archive file rather than a folder.
+    """
+    return bool(_extension(path)) and os.path.isfile(path)
+
+
+def archive_name(path):
+    """
+    Name of an archive without its extension (used as corpus name).
+    """
+    name = os.path.split(path.rstrip('/'))[-1]
+    return name[:len(name) - len(_extension(name))]
+
+
+def _read_text(raw):
+    # Same newline handling as reading the file in text mode
+    return raw.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+
+def _iter_members(path):
+    """
+    Go through the .ann and .txt files in an archive in the order they are stored.
+    :return: generator of (member name, function that returns the member's file object)
+    """
+    if _extension(path) == '.zip':
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.endswith(('.ann', '.txt')):
+                    yield info.filename, lambda info=info: archive.open(info)
+    else:
+        # Stream mode ('r|'): members are read one after the other, without seeking back
+        with tarfile.open(path, 'r|' + _TAR_MODES[_extension(path)]) as archive:
+            for info in archive:
+                if info.isfile() and info.name.endswith(('.ann', '.txt')):
+                    yield info.name, lambda info=info: archive.extractfile(info)
+
+
+def iter_archive_documents(path, txt=False, errors=None):
+    """
+    Build the AnnDocuments in an archive, one at a time and in the order they are stored.
+    With txt=True each .ann file is paired with the .txt file with the same name, and the document comes out as soon
+    as both have been read. Only members whose pair has not been read yet are kept in memory, which is almost nothing
+    for archives created from brat folders (where both files are next to each other). Documents whose text is not in
+    the archive come out at the end.
+    Problems found (e.g. a missing text) are not printed, as when a folder is loaded into an AnnCorpus: they are kept
+    in each document's errors attribute and, if given, in errors.
+    :param path: path to a .zip or .tar(.gz) archive
+    :param txt: whether to also read the text files
+    :param errors: optional dict where problems found are stored ({path: [messages]})
+    :return: generator of AnnDocument
+    """
+    pending = {}  # documents whose text has not been read yet
+    texts = {}  # text members whose .ann file has not been read yet
+    for member, open_member in _iter_members(path):
+        stem, ext = member[:-4], member[-4:]
+        if ext == '.txt':
+            if not txt:
+                continue
+            with open_member() as f_in:
+                text = _read_text(f_in.read())
+            if stem in pending:
+                yield _with_text(pending.pop(stem), text, errors)
+            else:
+                texts[stem] = text
+        else:
+            with open_member() as f_in:
+                # StringIO splits on newlines only, like iterating over the file (str.splitlines would also
+                # split on form feeds, \u2028 and other line boundaries)
+                doc = ann_structure.AnnDocument.from_lines(os.path.join(path, member),
+                                                           io.StringIO(_read_text(f_in.read())))
+            if not txt:
+                yield _checked(doc, errors)
+            elif stem in texts:
+                yield _with_text(doc, texts.pop(stem), errors)
+            else:
+                pending[stem] = doc
+    for doc in pending.values():
+        doc._report('Text file for <{}> not found!'.format(doc.path))
+        yield _checked(doc, errors)
+
+
+def _with_text(doc, text, errors):
+    doc.txt = ann_structure.DocText(path=doc.path[:-3] + 'txt', text=text)
+    return _checked(doc, errors)
+
+
+def _checked(doc, errors):
+    if errors is not None and doc.errors:
+        errors[doc.path] = doc.errors
+    return doc
+
+
+def load_archive_document(path, member, txt=False):
+    """
+    Build a single document from an archive (e.g. load_archive_document('round_1.zip', 'round_1/doc_1.ann')).
+    The whole archive is read for tar files, use iter_archive_documents to get several documents.
+    """
+    for doc in iter_archive_documents(path, txt=txt):
+        if doc.path == os.path.join(path, member):
+            return doc
+    raise KeyError('{} not found in {}'.format(member, path))
+
+
+class ArchiveWriter:
+    """
+    Archive that .ann and .txt files are written to, instead of a folder. The format depends on the extension
+    (.zip, .tar, .tar.gz, .tgz, .tar.bz2, .tar.xz). Use it as a context manager:
+
+        with peek.archive.ArchiveWriter('output.tar.gz') as out:
+            for doc in corpus.docs:
+                peek.rwsl.write_ann_file(doc, out)
+                peek.rwsl.write_txt_file(doc, out)
+
+    Nothing is printed for the files written to an archive, n_files keeps how many there are.
+    :param path: path of the archive to create
+    :param folder: optional folder inside the archive where files are written
+    """
+
+    def __init__(self, path, folder=''):
+        ext = _extension(path)
+        if not ext:
+            raise ValueError('Unknown archive format for {}, possible extensions are: {}'.format(
+                path, ', '.join(['.zip'] + list(_TAR_MODES))))
+        self.path = path
+        self.folder = folder
+        self.n_files = 0
+        if ext == '.zip':
+            self._archive = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED)
+        else:
+            self._archive = tarfile.open(path, 'w:' + _TAR_MODES[ext])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, file_name, content):
+        """
+        Add a file to the archive.
+        :param file_name: name of the file (inside folder)
+        :param content: str
+        """
+        member = '/'.join([self.folder.strip('/'), file_name]) if self.folder else file_name
+        data = content.encode('utf-8')
+        if isinstance(self._archive, zipfile.ZipFile):
+            self._archive.writestr(member, data)
+        else:
+            info = tarfile.TarInfo(member)
+            info.size = len(data)
+            info.mtime = time.time()
+            self._archive.addfile(info, io.BytesIO(data))
+        self.n_files += 1
+
+    def close(self):
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
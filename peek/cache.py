@@ -0,0 +1,194 @@
+"""
+On-disk cache of parsed documents, so that unchanged brat folders do not have to be parsed again.
+
+Use it through AnnCorpus(path, cache_dir='some/folder'). Each document is stored in its own file, named after its
+path. The entry keeps the fingerprint (size, modification time and content hash) of the .ann file (and of the .txt
+file when text is loaded), and is only reused if the files have not changed.
+Several processes can share the same cache: entries are written to a temporary file and atomically renamed, and
+entries that disappear or cannot be read (e.g. evicted by another process) are simply treated as missing.
+"""
+from . import ann_structure
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+_SUFFIX = '.pkdoc'
+# Default limit for the total size of a cache, in bytes
+DEFAULT_MAX_SIZE = 1024 ** 3
+
+
+def _file_fingerprint(path):
+    """
+    (size, mtime in ns) of a file, None if it does not exist.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def _content_hash(path):
+    if not os.path.isfile(path):
+        return None
+    h = hashlib.sha1()
+    with open(path, 'rb') as f_in:
+        for block in iter(lambda: f_in.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ParseCache:
+    """
+    Cache of parsed AnnDocuments.
+    :param cache_dir: folder where entries are stored (created if needed)
+    :param max_size: maximum total size of the cache in bytes (1 GB by default, None: no limit). Least recently used
+                     entries are evicted after a corpus is loaded and whenever a tenth of max_size has been written
+                     since the last eviction, so lazy corpora stay within the limit too
+    :param include_text: whether cached documents also store their text (only when loaded with txt=True)
+    """
+
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE, include_text=False):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.include_text = include_text
+        # Bytes written since the last eviction
+        self._written = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def __repr__(self):
+        return '<ParseCache {}>'.format(self.cache_dir)
+
+    def _entry_path(self, path, with_text):
+        key = hashlib.sha1('{}|{}'.format(os.path.abspath(path), bool(with_text)).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key + _SUFFIX)
+
+    @staticmethod
+    def _files(path, with_text):
+        files = [path]
+        if with_text:
+            files.append(path[:-3] + 'txt')
+        return files
+
+    def _stats(self, path, with_text):
+        return [_file_fingerprint(f) for f in self._files(path, with_text)]
+
+    def _hashes(self, path, with_text):
+        return [_content_hash(f) for f in self._files(path, with_text)]
+
+    def get(self, path, with_text=False):
+        """
+        Cached document for path, None if there is no entry or the files have changed.
+        """
+        entry_path = self._entry_path(path, with_text)
+        try:
+            with open(entry_path, 'rb') as f_in:
+                fingerprint = pickle.load(f_in)
+                stats = self._stats(path, with_text)
+                if fingerprint['stats'] != stats:
+                    # Files were touched, they can still be reused if their content is the same
+                    if fingerprint['hashes'] != self._hashes(path, with_text):
+                        return None
+                    fingerprint['stats'] = stats
+                    doc = pickle.load(f_in)
+                    self._write(entry_path, fingerprint, doc)
+                    return doc
+                doc = pickle.load(f_in)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, KeyError, TypeError):
+            return None
+        # Keep track of usage for eviction
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        return doc
+
+    def fingerprint(self, path, with_text=False):
+        return {'stats': self._stats(path, with_text), 'hashes': self._hashes(path, with_text)}
+
+    def put(self, path, doc, with_text=False, fingerprint=None):
+        """
+        Store a parsed document.
+        :param fingerprint: fingerprint of the files taken before parsing them (computed now if not given)
+        """
+        if with_text and self.include_text and isinstance(doc.txt, ann_structure.DocText):
+            doc.txt.text  # read the text now so that it is stored with the document
+        if fingerprint is None:
+            fingerprint = self.fingerprint(path, with_text)
+        self._write(self._entry_path(path, with_text), fingerprint, doc)
+
+    def _write(self, entry_path, fingerprint, doc):
+        # Write to a temporary file and rename it, so other processes never see half-written entries
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f_out:
+                pickle.dump(fingerprint, f_out)
+                pickle.dump(doc, f_out)
+                written = f_out.tell()
+            os.replace(tmp_path, entry_path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        self._written += written
+        if self.max_size is not None and self._written > self.max_size // 10:
+            self.evict()
+
+    def load(self, path, with_text=False, quiet=False):
+        """
+        Cached document for path, parsing (and caching) it if needed.
+        """
+        doc = self.get(path, with_text)
+        if doc is None:
+            # Fingerprint first, so that files modified while parsing are not cached as unchanged
+            fingerprint = self.fingerprint(path, with_text)
+            doc = ann_structure.AnnDocument(path, txt=with_text, quiet=quiet)
+            self.put(path, doc, with_text, fingerprint=fingerprint)
+        return doc
+
+    def size(self):
+        """
+        Total size of the cache in bytes.
+        """
+        return sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        entries = []
+        for f in os.listdir(self.cache_dir):
+            if not f.endswith(_SUFFIX):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, f))
+            except FileNotFoundError:
+                continue
+            entries.append((os.path.join(self.cache_dir, f), st.st_size, st.st_mtime))
+        return entries
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache is smaller than max_size.
+        """
+        self._written = 0
+        if self.max_size is None:
+            return
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for entry_path, size, _ in sorted(entries, key=lambda e: e[2]):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for entry_path, _, _ in self._entries():
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                pass
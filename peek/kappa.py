@@ -0,0 +1,251 @@
+"""
+Token-level, chance-corrected agreement (Cohen's and Fleiss' kappa) between annotators.
+
+Every document's text is tokenised once. Tokens of the whole corpus are laid one after the other in two NumPy arrays
+(start and end offsets), and each annotator's entity spans are projected onto them with searchsorted, giving:
+    - one label per token and annotator (O, i.e. no label, for tokens outside entities), for the overall kappas
+    - the set of (label, token) pairs of every annotator, for the per-label (label vs. not label) kappas
+Contingency tables are then counted with bincount and unique over the (token, label) cells that are used, so no
+tokens x labels table is ever built.
+
+EXAMPLE USE:
+    result = peek.kappa.token_kappa([corpus1, corpus2, corpus3], corpus1.text_labels)
+    print(result.fleiss, result.cohen, result.per_label)
+"""
+from . import metrics
+from .table import AnnTable, shared_codes
+
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+# Words and single punctuation marks
+TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+
+def tokenize(text, pattern=TOKEN_PATTERN):
+    """
+    Token offsets of a text.
+    :param pattern: compiled regular expression matching one token (or string)
+    :return: tuple of int64 arrays (starts, ends)
+    """
+    pattern = re.compile(pattern) if isinstance(pattern, str) else pattern
+    offsets = np.array([m.span() for m in pattern.finditer(text)], dtype=np.int64).reshape(-1, 2)
+    return offsets[:, 0].copy(), offsets[:, 1].copy()
+
+
+def _document_texts(corpus_list, doc_names, txt_dir=None):
+    # {document name: text}, reading every .txt file once (from txt_dir or next to any annotator's .ann file)
+    paths = {}
+    if txt_dir is not None:
+        paths = {name: os.path.join(txt_dir, name + '.txt') for name in doc_names}
+    else:
+        if any(isinstance(corpus, AnnTable) for corpus in corpus_list):
+            raise ValueError('AnnTables do not keep the paths of their documents, txt_dir is needed to find the '
+                             'text files')
+        for corpus in corpus_list:
+            # Paths are known without parsing documents (lazy corpora keep handles)
+            for doc in corpus._doc_refs():
+                path = doc.path[:-3] + 'txt'
+                if doc.name not in paths and os.path.isfile(path):
+                    paths[doc.name] = path
+    texts = {}
+    for name in doc_names:
+        if name in paths and os.path.isfile(paths[name]):
+            with open(paths[name], 'r', encoding='utf-8') as f:
+                texts[name] = f.read()
+    return texts
+
+
+def _cover(token_start, token_end, start, end):
+    # (entity, token) pairs of every entity [start, end) and the tokens it overlaps (tokens sorted by offset)
+    first = np.searchsorted(token_end, start, side='right')
+    last = np.searchsorted(token_start, end, side='left')
+    counts = np.clip(last - first, 0, None)
+    entity = np.repeat(np.arange(len(start)), counts)
+    token = np.repeat(first, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return entity, token
+
+
+def _cohen(table):
+    # Cohen's kappa from a K x K contingency table (nan if agreement by chance is 1)
+    n = table.sum()
+    if n == 0:
+        return np.nan
+    observed = np.trace(table) / n
+    expected = (table.sum(axis=0) * table.sum(axis=1)).sum() / n ** 2
+    return (observed - expected) / (1 - expected) if expected < 1 else np.nan
+
+
+def _binary_cohen(both, positives_a, positives_b, n_items):
+    # Cohen's kappa of many 2 x 2 tables at once (one per label), from the positives of each rater and of both
+    if n_items == 0:
+        return np.full(len(both), np.nan)
+    observed = (n_items - positives_a - positives_b + 2 * both) / n_items
+    expected = (positives_a * positives_b + (n_items - positives_a) * (n_items - positives_b)) / n_items ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(expected < 1, (observed - expected) / (1 - expected), np.nan)
+
+
+def _fleiss(sum_squares, category_totals, n_items, n_raters):
+    # Fleiss' kappa from sum over items and categories of n_ij ** 2 and the total of every category
+    if n_items == 0 or n_raters < 2:
+        return np.nan
+    p_bar = (sum_squares - n_items * n_raters) / (n_items * n_raters * (n_raters - 1))
+    p = np.asarray(category_totals, dtype=float) / (n_items * n_raters)
+    expected = (p ** 2).sum()
+    return (p_bar - expected) / (1 - expected) if expected < 1 else np.nan
+
+
+class KappaResult:
+    """
+    Agreement returned by token_kappa.
+    fleiss: Fleiss' kappa of all annotators over every token (categories are the labels and O)
+    cohen: DataFrame (annotators x annotators) with pairwise Cohen's kappa over every token
+    per_label: DataFrame indexed by label with columns fleiss, mean_cohen (mean of the pairwise Cohen's kappa) and
+               tokens (tokens that at least one annotator gave the label), each label against the rest
+    n_tokens: number of tokens
+    missing_text: documents left out because their .txt file was not found
+    out_of_text: (annotator, document, entity text) of the entities that end after their document's text (they are
+                 clipped to the end of the text)
+    Kappa is nan where it is not defined (agreement by chance is 1, e.g. nobody used a label).
+    """
+
+    def __init__(self, annotators, labels, n_tokens, fleiss, cohen, label_fleiss, label_cohen, label_tokens,
+                 missing_text, out_of_text):
+        self.annotators = annotators
+        self.labels = labels
+        self.n_tokens = n_tokens
+        self.fleiss = fleiss
+        self.cohen = pd.DataFrame(cohen, index=annotators, columns=annotators)
+        self.label_cohen_arrays = label_cohen
+        pairs = np.triu_indices(len(annotators), k=1)
+        with np.errstate(all='ignore'):
+            mean_cohen = np.nanmean(label_cohen[:, pairs[0], pairs[1]], axis=1) if len(pairs[0]) else \
+                np.full(len(labels), np.nan)
+        self.per_label = pd.DataFrame({'fleiss': label_fleiss, 'mean_cohen': mean_cohen, 'tokens': label_tokens},
+                                      index=pd.Index(labels, name='label')).sort_index()
+        self.missing_text = missing_text
+        self.out_of_text = out_of_text
+
+    def __repr__(self):
+        return '<KappaResult: Fleiss={} over {} tokens, {} annotators>'.format(round(self.fleiss, 3), self.n_tokens,
+                                                                              len(self.annotators))
+
+    def label_cohen(self, label):
+        """
+        Pairwise Cohen's kappa of one label (label vs. rest).
+        :return: DataFrame (annotators x annotators)
+        """
+        i = self.labels.index(label)
+        return pd.DataFrame(self.label_cohen_arrays[i], index=self.annotators, columns=self.annotators)
+
+
+def token_kappa(corpus_list, rel_labels, txt_dir=None, pattern=TOKEN_PATTERN):
+    """
+    Token-level Cohen's (pairwise) and Fleiss' (all annotators) kappa, overall and per label.
+    A token gets a label if an entity with that label overlaps it. In the overall kappas, a token covered by entities
+    with different labels takes the label of the shortest one; per-label kappas count every label.
+    Documents are matched by name; a document an annotator does not have counts as all O for them.
+    :param corpus_list: list of AnnCorpus (or AnnTable), one per annotator.
+    :param rel_labels: list of labels to consider.
+    :param txt_dir: folder with the .txt files (by default they are looked for next to the annotators' .ann files;
+                    needed if AnnTables are passed)
+    :param pattern: regular expression matching one token
+    :return: KappaResult
+
+    EXAMPLE USE:
+    result = peek.kappa.token_kappa([corpus1, corpus2], ['Disease', 'Drug'])
+    print(result.cohen, result.per_label)
+    """
+    tables = [metrics.get_table(corpus).select(rel_labels) for corpus in corpus_list]
+    doc_codes, doc_names = shared_codes(tables, 'filename')
+    tag_codes, labels = shared_codes(tables, 'label')
+    n, n_labels = len(tables), len(labels)
+
+    # Tokenise every text once, one after the other: token offsets are shifted by the document's base offset
+    texts = _document_texts(corpus_list, doc_names, txt_dir)
+    base = np.zeros(len(doc_names), dtype=np.int64)
+    text_length = np.zeros(len(doc_names), dtype=np.int64)
+    starts, ends = [], []
+    position = 0
+    for i, name in enumerate(doc_names):
+        base[i] = position
+        if name in texts:
+            doc_start, doc_end = tokenize(texts[name], pattern)
+            starts.append(doc_start + position)
+            ends.append(doc_end + position)
+            text_length[i] = len(texts[name])
+            position += len(texts[name]) + 1
+    token_start = np.concatenate(starts) if starts else np.zeros(0, dtype=np.int64)
+    token_end = np.concatenate(ends) if ends else np.zeros(0, dtype=np.int64)
+    n_tokens = len(token_start)
+    has_text = np.array([name in texts for name in doc_names], dtype=bool)
+
+    # Project spans (both fragments of discontinuous entities) onto tokens
+    token_labels = np.zeros((n, n_tokens), dtype=np.int64)
+    label_keys = []
+    out_of_text = []
+    for a, (table, doc, tag) in enumerate(zip(tables, doc_codes, tag_codes)):
+        rows = np.flatnonzero(has_text[doc]) if len(doc) else np.zeros(0, dtype=np.int64)
+        second = rows[table.start2[rows] >= 0]
+        # Spans past the end of their text would cover the first tokens of the next document: clip them
+        for row in rows[np.maximum(table.end[rows], table.end2[rows]) > text_length[doc[rows]]]:
+            print('ANNOTATION OUT OF TEXT: ', table.texts[table.text[row]], '|', doc_names[doc[row]], '|',
+                  'text length:', text_length[doc[row]])
+            out_of_text.append((table.name, doc_names[doc[row]], table.texts[table.text[row]]))
+        entity_doc = np.concatenate([doc[rows], doc[second]])
+        start = np.minimum(np.concatenate([table.start[rows], table.start2[second]]), text_length[entity_doc]) + \
+            base[entity_doc]
+        end = np.minimum(np.concatenate([table.end[rows], table.end2[second]]), text_length[entity_doc]) + \
+            base[entity_doc]
+        entity_tag = np.concatenate([tag[rows], tag[second]])
+        length = np.concatenate([table.end[rows] - table.start[rows], table.end2[second] - table.start2[second]])
+        entity, token = _cover(token_start, token_end, start, end)
+        # Shortest entity first, then lowest label code (0 is O)
+        best = np.full(n_tokens, np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(best, token, length[entity] * (n_labels + 1) + entity_tag[entity] + 1)
+        covered = best < np.iinfo(np.int64).max
+        token_labels[a, covered] = best[covered] % (n_labels + 1)
+        label_keys.append(np.unique(entity_tag[entity] * n_tokens + token))
+
+    # Overall: categories are O and the labels
+    k = n_labels + 1
+    cohen = np.full((n, n), np.nan)
+    for i in range(n):
+        for j in range(i, n):
+            table = np.bincount(token_labels[i] * k + token_labels[j], minlength=k * k).reshape(k, k)
+            cohen[i, j] = cohen[j, i] = _cohen(table)
+    # Fleiss only needs the (token, label) cells someone used: the rest of each token's raters are in O
+    labelled = token_labels > 0
+    cells, raters = np.unique((np.arange(n_tokens) * k + token_labels)[labelled], return_counts=True)
+    o_raters = n - np.bincount(cells // k, weights=raters, minlength=n_tokens)
+    fleiss = _fleiss((raters.astype(float) ** 2).sum() + (o_raters ** 2).sum(),
+                     np.bincount(token_labels.ravel(), minlength=k), n_tokens, n)
+
+    # Per label (label vs. rest), from the (label, token) pairs of every annotator
+    sizes = np.array([np.bincount(keys // max(n_tokens, 1), minlength=n_labels) for keys in label_keys])
+    label_cohen = np.full((n_labels, n, n), np.nan)
+    for i in range(n):
+        for j in range(i, n):
+            both = np.intersect1d(label_keys[i], label_keys[j], assume_unique=True)
+            both = np.bincount(both // max(n_tokens, 1), minlength=n_labels)
+            label_cohen[:, i, j] = label_cohen[:, j, i] = _binary_cohen(both, sizes[i], sizes[j], n_tokens)
+    all_keys = np.concatenate(label_keys) if label_keys else np.zeros(0, dtype=np.int64)
+    keys, raters = np.unique(all_keys, return_counts=True)
+    key_label = keys // max(n_tokens, 1)
+    # Tokens nobody gave the label: n raters in the "rest" category
+    label_tokens = np.bincount(key_label, minlength=n_labels)
+    squares = np.bincount(key_label, weights=raters.astype(float) ** 2 + (n - raters).astype(float) ** 2,
+                          minlength=n_labels) + (n_tokens - label_tokens) * float(n) ** 2
+    positives = np.bincount(key_label, weights=raters.astype(float), minlength=n_labels)
+    label_fleiss = [_fleiss(squares[label], [positives[label], n_tokens * n - positives[label]], n_tokens, n)
+                    for label in range(n_labels)]
+
+    # Only the relevant labels are reported (tables keep their whole label dictionaries)
+    keep = [i for i, label in enumerate(labels) if label in set(rel_labels)]
+    return KappaResult([t.name for t in tables], [labels[i] for i in keep], n_tokens, fleiss, cohen,
+                       np.array(label_fleiss)[keep] if keep else np.zeros(0), label_cohen[keep],
+                       label_tokens[keep], [name for name in doc_names if name not in texts], out_of_text)
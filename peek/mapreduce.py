@@ -0,0 +1,498 @@
+"""
+Corpus aggregates computed shard by shard (e.g. a corpus split across several machines or disks).
+
+Each partial result can be computed from one shard, saved as JSON, sent elsewhere and merged with the partial results
+of the other shards. Merging gives the same numbers as computing them over the whole corpus at once:
+    - CorpusAggregate: count, text_freq, text_freq_lower and label lists, as in AnnCorpus
+    - StatsRows: per-document rows used by stats.create_stats_row
+    - IAATally: intersection and union sizes behind metrics.show_iaa
+    - FScoreTally: true positives, predicted and gold standard positives behind metrics.show_fscore
+
+Shards must split the corpus by document (the same document cannot be in two shards). For IAA, every shard is a list
+with one folder (or corpus) per annotator, covering the same documents.
+
+EXAMPLE USE:
+    aggregate = peek.mapreduce.corpus_map_reduce(['disk1/corpus', 'disk2/corpus'], workers=2)
+    print(aggregate.count['entities'])
+    # Or compute on each machine, save and merge later
+    peek.mapreduce.save_partial(peek.mapreduce.corpus_stats('disk1/corpus'), 'disk1.json')
+    aggregate = peek.mapreduce.merge_partials([peek.mapreduce.load_partial(f) for f in ['disk1.json', 'disk2.json']])
+"""
+from . import ann_structure
+from . import archive
+from . import metrics
+from .table import AnnTable, encode_keys
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial, reduce
+
+import json
+import math
+
+import numpy as np
+
+
+def _counters_from_dict(d):
+    return {k: Counter(v) for k, v in d.items()}
+
+
+def _merge_counters(total, other):
+    for k, counter in other.items():
+        if k not in total:
+            total[k] = Counter()
+        total[k].update(counter)
+
+
+class CorpusAggregate:
+    """
+    Mergeable version of an AnnCorpus' stats: count, text_freq and text_freq_lower (dicts of Counters, as in
+    AnnCorpus) and the number of documents.
+    """
+    kind = 'corpus'
+
+    def __init__(self, count=None, text_freq=None, text_freq_lower=None, n_docs=0):
+        self.count = count if count is not None else {}
+        self.text_freq = text_freq if text_freq is not None else {}
+        self.text_freq_lower = text_freq_lower if text_freq_lower is not None else {}
+        self.n_docs = n_docs
+
+    def __repr__(self):
+        return '<CorpusAggregate: {} documents, {} text labels>'.format(self.n_docs, len(self.text_labels))
+
+    @classmethod
+    def from_corpus(cls, corpus):
+        aggregate = cls()
+        for doc in corpus.iter_docs():
+            aggregate.add_doc(doc)
+        return aggregate
+
+    def add_doc(self, doc):
+        _merge_counters(self.count, doc.count)
+        _merge_counters(self.text_freq, doc.text_freq)
+        _merge_counters(self.text_freq_lower, doc.text_freq_lower)
+        self.n_docs += 1
+
+    def merge(self, other):
+        """
+        Add another shard's aggregate to this one (in place).
+        :return: self
+        """
+        _merge_counters(self.count, other.count)
+        _merge_counters(self.text_freq, other.text_freq)
+        _merge_counters(self.text_freq_lower, other.text_freq_lower)
+        self.n_docs += other.n_docs
+        return self
+
+    # Same label lists as AnnCorpus
+    @property
+    def text_labels(self):
+        return sorted(self.count.get('entities', {}))
+
+    @property
+    def rel_labels(self):
+        return sorted(self.count.get('relations', {}))
+
+    @property
+    def event_labels(self):
+        return sorted(self.count.get('events', {}))
+
+    @property
+    def attr_labels(self):
+        return sorted(self.count.get('attributes', {}))
+
+    def to_dict(self):
+        return {'kind': self.kind, 'count': self.count, 'text_freq': self.text_freq,
+                'text_freq_lower': self.text_freq_lower, 'n_docs': self.n_docs}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(count=_counters_from_dict(d['count']), text_freq=_counters_from_dict(d['text_freq']),
+                   text_freq_lower=_counters_from_dict(d['text_freq_lower']), n_docs=d['n_docs'])
+
+
+class StatsRows:
+    """
+    One row per document with what stats.create_stats_row needs: number of entities per label and, optionally,
+    the text counts. Use corpus_row to get the row for the whole (merged) corpus.
+    """
+    kind = 'stats_rows'
+
+    def __init__(self, rows=None, include_txt=False):
+        self.rows = rows if rows is not None else []
+        self.include_txt = include_txt
+
+    def __repr__(self):
+        return '<StatsRows: {} documents>'.format(len(self.rows))
+
+    @classmethod
+    def from_corpus(cls, corpus, include_txt=False):
+        table = corpus if isinstance(corpus, AnnTable) else corpus.to_table()
+        histogram = table.doc_label_histogram()
+        rows = []
+        for i, doc in enumerate(corpus.iter_docs() if include_txt else table.doc_names):
+            row = {'name': table.doc_names[i], 'collection': table.doc_collections[i],
+                   'entities': {label: int(n) for label, n in zip(table.labels, histogram[i]) if n}}
+            if include_txt:
+                # Same (naive) counts as create_stats_row
+                row['sents'] = len([sent.split('.') for sent in doc.txt])
+                row['tokens'] = len([sent.split(' ') for sent in doc.txt])
+            rows.append(row)
+        return cls(rows, include_txt=include_txt)
+
+    def merge(self, other):
+        self.rows.extend(other.rows)
+        self.include_txt = self.include_txt and other.include_txt
+        return self
+
+    @property
+    def text_labels(self):
+        return sorted(set(label for row in self.rows for label in row['entities']))
+
+    def corpus_row(self, name, columns=None, collection=None):
+        """
+        Row of generate_corpus_stats_tsv for the documents in these rows.
+        :param name: corpus name (first column)
+        :param columns: optional dict with the row's columns, as in create_stats_row
+        :param collection: only use documents in this collection
+        :return: dict
+        """
+        rows = [row for row in self.rows if collection is None or row['collection'] == collection]
+        columns = columns if columns is not None else {}
+        label_totals = Counter()
+        for row in rows:
+            label_totals.update(row['entities'])
+        n_docs = len(rows)
+        total_entities = sum(label_totals.values())
+        columns['corpus'] = name
+        columns['docs'] = n_docs
+        if self.include_txt:
+            columns['total_sents'] = sum(row['sents'] for row in rows)
+            columns['avg_sents'] = round(columns['total_sents'] / n_docs, 2)
+            columns['total_tokens'] = sum(row['tokens'] for row in rows)
+            columns['avg_tokens'] = round(columns['total_tokens'] / n_docs, 2)
+        columns['total_entities'] = total_entities
+        for label in sorted(label_totals):
+            columns['total_{}'.format(label)] = label_totals[label]
+        columns['avg_entities'] = round(total_entities / n_docs, 2)
+        for label in sorted(label_totals):
+            columns['avg_{}'.format(label)] = round(label_totals[label] / n_docs, 2)
+        return columns
+
+    def to_dict(self):
+        return {'kind': self.kind, 'rows': self.rows, 'include_txt': self.include_txt}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(rows=d['rows'], include_txt=d['include_txt'])
+
+
+def _ratio(intersection, union):
+    # Same convention as show_iaa: no annotations at all means an agreement of 0
+    return intersection / union if union else 0
+
+
+class IAATally:
+    """
+    Sizes of the intersections and unions of annotation sets that metrics.show_iaa divides, for all annotators
+    together, for every pair of annotators and for every label.
+    Sizes can be added up across shards because annotations in different documents are always different, which
+    requires 'filename' to be one of the variables.
+    """
+    kind = 'iaa'
+
+    def __init__(self, annotators, variables, labels=None, all_vs_all=None, pairwise=None, by_label=None,
+                 count_labels=None):
+        self.annotators = list(annotators)
+        self.variables = list(variables)
+        self.labels = list(labels) if labels is not None else None
+        n = len(self.annotators)
+        # [intersection, union]
+        self.all_vs_all = all_vs_all if all_vs_all is not None else [0, 0]
+        self.pairwise = pairwise if pairwise is not None else np.zeros((n, n, 2), dtype=np.int64)
+        # {label: ([intersection, union], pairwise array)}
+        self.by_label = by_label if by_label is not None else {}
+        self.count_labels = count_labels if count_labels is not None else Counter()
+
+    def __repr__(self):
+        return '<IAATally: {} annotators, {} labels>'.format(len(self.annotators), len(self.by_label))
+
+    @classmethod
+    def from_tables(cls, tables, variables, labels):
+        """
+        Tally one shard.
+        :param tables: list of AnnTable (or AnnCorpus), one per annotator, with the shard's documents
+        :param variables: relevant variables, as in show_iaa
+        :param labels: relevant labels, as in show_iaa
+        """
+        result = metrics.iaa(tables, variables, labels)
+        tally = cls(result.annotators, variables, labels)
+        tally.all_vs_all = [int(result.all_intersection), int(result.all_union)]
+        tally.pairwise = np.stack([result.pair_intersection, result.pair_union], axis=-1)
+        for i, label in enumerate(result.labels):
+            tally.by_label[label] = ([int(result.label_intersection[i]), int(result.label_union[i])],
+                                     np.stack([result.label_pair_intersection[i], result.label_pair_union[i]],
+                                              axis=-1))
+        tally.count_labels = Counter(result.count_labels)
+        return tally
+
+    def merge(self, other):
+        if other.annotators != self.annotators or other.variables != self.variables:
+            raise ValueError('Cannot merge IAA tallies with different annotators or variables')
+        if 'filename' not in self.variables:
+            raise ValueError("IAA tallies can only be merged if 'filename' is one of the variables")
+        self.all_vs_all = [a + b for a, b in zip(self.all_vs_all, other.all_vs_all)]
+        self.pairwise = self.pairwise + other.pairwise
+        n = len(self.annotators)
+        for label, (sizes, pairwise) in other.by_label.items():
+            own_sizes, own_pairwise = self.by_label.get(label, ([0, 0], np.zeros((n, n, 2), dtype=np.int64)))
+            self.by_label[label] = ([a + b for a, b in zip(own_sizes, sizes)], own_pairwise + pairwise)
+        self.count_labels.update(other.count_labels)
+        return self
+
+    def subtract(self, other):
+        """
+        Take out a partial result that was merged before (e.g. the old version of a document that changed).
+        Labels left without annotations are dropped, as if they had never been merged.
+        """
+        if other.annotators != self.annotators or other.variables != self.variables:
+            raise ValueError('Cannot subtract IAA tallies with different annotators or variables')
+        self.all_vs_all = [a - b for a, b in zip(self.all_vs_all, other.all_vs_all)]
+        self.pairwise = self.pairwise - other.pairwise
+        for label, (sizes, pairwise) in other.by_label.items():
+            own_sizes, own_pairwise = self.by_label[label]
+            own_sizes = [a - b for a, b in zip(own_sizes, sizes)]
+            if own_sizes[1] == 0:
+                del self.by_label[label]
+            else:
+                self.by_label[label] = (own_sizes, own_pairwise - pairwise)
+        self.count_labels.subtract(other.count_labels)
+        self.count_labels = +self.count_labels
+        return self
+
+    def _pairwise_dict(self, sizes):
+        return {(a1, a2): _ratio(*sizes[i, j]) for i, a1 in enumerate(self.annotators)
+                for j, a2 in enumerate(self.annotators)}
+
+    def results(self):
+        """
+        Same values as metrics.computations(..., by_label=True).
+        Print them like show_iaa with metrics.print_iaa(variables, annotators, *tally.results()).
+        :return: tuple (iaa_all_vs_all, iaa_pairwise, iaa_by_label, count_labels)
+        """
+        iaa_by_label = {label: (_ratio(*sizes), self._pairwise_dict(pairwise))
+                        for label, (sizes, pairwise) in self.by_label.items()}
+        return _ratio(*self.all_vs_all), self._pairwise_dict(self.pairwise), iaa_by_label, Counter(self.count_labels)
+
+    def to_dict(self):
+        return {'kind': self.kind, 'annotators': self.annotators, 'variables': self.variables, 'labels': self.labels,
+                'all_vs_all': [int(n) for n in self.all_vs_all], 'pairwise': self.pairwise.tolist(),
+                'by_label': {label: [[int(n) for n in sizes], pairwise.tolist()]
+                             for label, (sizes, pairwise) in self.by_label.items()},
+                'count_labels': dict(self.count_labels)}
+
+    @classmethod
+    def from_dict(cls, d):
+        n = len(d['annotators'])
+        by_label = {label: (sizes, np.array(pairwise, dtype=np.int64).reshape(n, n, 2))
+                    for label, (sizes, pairwise) in d['by_label'].items()}
+        return cls(d['annotators'], d['variables'], d['labels'], all_vs_all=d['all_vs_all'],
+                   pairwise=np.array(d['pairwise'], dtype=np.int64).reshape(n, n, 2), by_label=by_label,
+                   count_labels=Counter(d['count_labels']))
+
+
+class FScoreTally:
+    """
+    Counts behind metrics.show_fscore, per document: true positives, predicted positives and gold standard
+    positives (annotations are matched by filename, label and text, as in show_fscore).
+    """
+    kind = 'fscore'
+
+    def __init__(self, docs=None, gs_docs=None):
+        # {filename: [TP, predicted positives, GS positives]}
+        self.docs = docs if docs is not None else {}
+        # Documents in the gold standard (also those without annotations)
+        self.gs_docs = gs_docs if gs_docs is not None else []
+
+    def __repr__(self):
+        tp, pred_pos, gs_pos = self.totals()
+        return '<FScoreTally: TP={}, predicted={}, GS={}>'.format(tp, pred_pos, gs_pos)
+
+    @classmethod
+    def from_tables(cls, gs, pred, labels):
+        """
+        Tally one shard.
+        :param gs: gold standard AnnTable (or AnnCorpus)
+        :param pred: predictions AnnTable (or AnnCorpus)
+        :param labels: relevant labels, as in show_fscore
+        """
+        gs = gs if isinstance(gs, AnnTable) else gs.to_table()
+        pred = pred if isinstance(pred, AnnTable) else pred.to_table()
+        tally = cls(gs_docs=list(gs.doc_names))
+        gs_sel, pred_sel = gs.select(labels), pred.select(labels)
+        gs_keys, pred_keys = encode_keys([gs_sel, pred_sel], ['filename', 'label', 'offset'])
+        # Duplicates are dropped, so each key is counted once
+        gs_unique, gs_rows = np.unique(gs_keys, return_index=True)
+        pred_unique, pred_rows = np.unique(pred_keys, return_index=True)
+        is_tp = np.isin(gs_unique, pred_unique)
+        for names, sel, rows, tp in [(gs.doc_names, gs_sel, gs_rows, is_tp),
+                                     (pred.doc_names, pred_sel, pred_rows, None)]:
+            docs = np.array(names, dtype=object)[sel.doc[rows]] if len(rows) else np.zeros(0, dtype=object)
+            for doc, n in Counter(docs.tolist()).items():
+                tally.docs.setdefault(doc, [0, 0, 0])[2 if tp is not None else 1] += n
+            if tp is not None:
+                for doc, n in Counter(docs[tp].tolist()).items():
+                    tally.docs[doc][0] += n
+        return tally
+
+    def merge(self, other):
+        for doc, counts in other.docs.items():
+            own = self.docs.setdefault(doc, [0, 0, 0])
+            for i, n in enumerate(counts):
+                own[i] += n
+        self.gs_docs.extend(other.gs_docs)
+        return self
+
+    def totals(self):
+        """
+        :return: tuple (TP, predicted positives, GS positives)
+        """
+        return tuple(sum(counts[i] for counts in self.docs.values()) for i in range(3))
+
+    def per_doc(self):
+        """
+        Precision, recall and F-score of each gold standard document (nan where they are not defined, as in
+        show_fscore).
+        :return: dict {filename: (P, R, F1)}
+        """
+        scores = {}
+        for doc in self.gs_docs:
+            tp, pred_pos, gs_pos = self.docs.get(doc, [0, 0, 0])
+            p = tp / pred_pos if pred_pos else math.nan
+            r = tp / gs_pos if gs_pos else math.nan
+            f = 2 * p * r / (p + r) if p + r else math.nan
+            scores[doc] = (p, r, f)
+        return scores
+
+    def results(self):
+        """
+        Micro-averaged precision, recall and F-score, as returned by metrics.show_fscore.
+        """
+        tp, pred_pos, gs_pos = self.totals()
+        if pred_pos == 0:
+            return 0, 0, 0
+        elif gs_pos == 0:
+            raise Exception('There are no parsed Gold Standard annotations')
+        p, r = tp / pred_pos, tp / gs_pos
+        if p + r == 0:
+            return p, r, 0
+        return round(p, 3), round(r, 3), round(2 * p * r / (p + r), 3)
+
+    def to_dict(self):
+        return {'kind': self.kind, 'docs': self.docs, 'gs_docs': self.gs_docs}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(docs={doc: list(counts) for doc, counts in d['docs'].items()}, gs_docs=list(d['gs_docs']))
+
+
+_KINDS = {cls.kind: cls for cls in [CorpusAggregate, StatsRows, IAATally, FScoreTally]}
+
+
+# Map functions: one shard in, one partial result out
+def _open_shard(shard, txt=False):
+    # Shards can be corpora, tables or paths to folders/archives (folders are read lazily, in constant memory)
+    if isinstance(shard, (ann_structure.AnnCorpus, AnnTable)):
+        return shard
+    return ann_structure.AnnCorpus(shard, txt=txt, lazy=not archive.is_archive(shard))
+
+
+def corpus_stats(shard):
+    """
+    :param shard: folder, archive or AnnCorpus
+    :return: CorpusAggregate
+    """
+    return CorpusAggregate.from_corpus(_open_shard(shard))
+
+
+def stats_rows(shard, include_txt=False):
+    """
+    :param shard: folder, archive or AnnCorpus (loaded with txt=True if include_txt is True)
+    :return: StatsRows
+    """
+    return StatsRows.from_corpus(_open_shard(shard, txt=include_txt), include_txt=include_txt)
+
+
+def iaa_tally(shard, rel_variables, rel_labels):
+    """
+    :param shard: list with one folder, archive or AnnCorpus per annotator
+    :return: IAATally
+    """
+    return IAATally.from_tables([_open_shard(s) for s in shard], rel_variables, rel_labels)
+
+
+def fscore_tally(shard, rel_labels):
+    """
+    :param shard: tuple (gold standard, predictions), each a folder, archive or AnnCorpus
+    :return: FScoreTally
+    """
+    gs, pred = shard
+    return FScoreTally.from_tables(_open_shard(gs), _open_shard(pred), rel_labels)
+
+
+def merge_partials(partials):
+    """
+    Merge a list of partial results of the same kind into a new one.
+    """
+    partials = list(partials)
+    if not partials:
+        raise ValueError('Nothing to merge')
+    # Start from a copy, so the given partial results are not modified
+    first = type(partials[0]).from_dict(json.loads(json.dumps(partials[0].to_dict())))
+    return reduce(lambda total, p: total.merge(p), partials[1:], first)
+
+
+def corpus_map_reduce(shards, map_fn=corpus_stats, workers=None, executor=None, **kwargs):
+    """
+    Compute a partial result for each shard and merge them, so that only one shard is in memory at a time (per
+    worker).
+    :param shards: list of shards, each one passed to map_fn (e.g. folders for corpus_stats, lists of folders for
+                   iaa_tally or (gold standard, predictions) tuples for fscore_tally)
+    :param map_fn: corpus_stats, stats_rows, iaa_tally, fscore_tally or any function that takes a shard (and
+                   kwargs) and returns an object with a merge method. It must be picklable to be used with workers.
+    :param workers: number of processes used to map the shards (sequential by default)
+    :param executor: any concurrent.futures.Executor to use instead of creating a process pool
+    :param kwargs: passed to map_fn (e.g. rel_variables and rel_labels for iaa_tally)
+    :return: merged partial result (ValueError if there are no shards, as in merge_partials)
+
+    EXAMPLE USE:
+    tally = corpus_map_reduce([['disk1/ann_A', 'disk1/ann_B'], ['disk2/ann_A', 'disk2/ann_B']], iaa_tally,
+                              rel_variables=['filename', 'label', 'offset'], rel_labels=['Organism'])
+    iaa_all_vs_all, iaa_pairwise, iaa_by_label, count_labels = tally.results()
+    """
+    fn = partial(map_fn, **kwargs) if kwargs else map_fn
+    shards = list(shards)
+    if not shards:
+        raise ValueError('Nothing to merge')
+    if not workers and executor is None:
+        partials = map(fn, shards)
+    elif executor is not None:
+        partials = executor.map(fn, shards)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            partials = list(pool.map(fn, shards))
+    return reduce(lambda total, p: total.merge(p), partials)
+
+
+def save_partial(result, path):
+    """
+    Save a partial result as JSON (to merge it with other shards' later, see load_partial).
+    """
+    with open(path, 'w', encoding='utf-8') as f_out:
+        json.dump(result.to_dict(), f_out, ensure_ascii=False)
+
+
+def load_partial(path):
+    with open(path, 'r', encoding='utf-8') as f_in:
+        d = json.load(f_in)
+    return _KINDS[d['kind']].from_dict(d)
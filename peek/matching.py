@@ -0,0 +1,128 @@
+"""
+Lenient span matching between two sets of annotations (e.g. Gold Standard vs. predictions, or two annotators).
+
+Modes:
+    overlap: same label and overlapping spans (SemEval's "type" scheme: the type must be right, boundaries may not)
+    boundary: same label and both boundaries within tolerance characters of each other
+    span: same span, whatever the label
+
+Spans are the first fragment of each entity, read as half-open ranges [start, end) like in SpanIndex, so contiguous
+annotations do not overlap.
+Candidate pairs are found with sort-and-sweep: one side is sorted by (document, start) and, for each annotation on
+the other side, only the window of starts that could match is looked at (found with binary search), so documents
+are never compared all-pairs. Pairs are then assigned one-to-one, preferring closer boundaries and bigger overlaps,
+so an annotation is never counted as a match twice.
+"""
+import numpy as np
+
+LENIENT_MODES = ['overlap', 'boundary', 'span']
+
+
+def _window_pairs(group, start, query_group, low, high, n_pos):
+    """
+    Sort-and-sweep: pairs (query, annotation) of the annotations in the query's group that start in [low, high].
+    Annotations are sorted by (group, start) and encoded as a single integer, so each window is two binary searches.
+    :return: tuple of int arrays (query indices, annotation indices), by query and then by start
+    """
+    order = np.lexsort((start, group))
+    key = group[order] * n_pos + start[order]
+    first = np.searchsorted(key, query_group * n_pos + np.clip(low, 0, None), side='left')
+    last = np.searchsorted(key, query_group * n_pos + high, side='right')
+    counts = np.clip(last - first, 0, None)
+
+    # Expand every window into (query, annotation) pairs
+    query_idx = np.repeat(np.arange(len(query_group)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return query_idx, order[np.repeat(first, counts) + offsets]
+
+
+def candidate_pairs(gold_group, gold_start, gold_end, pred_group, pred_start, pred_end, mode='overlap',
+                    tolerance=1):
+    """
+    All pairs (pred, gold) that match in the given mode.
+    :param gold_group: int array, group of each gold annotation (e.g. document, or document and label)
+    :param gold_start: int array, start offsets
+    :param gold_end: int array, end offsets
+    :param pred_group, pred_start, pred_end: same for the other side
+    :param mode: one of LENIENT_MODES
+    :param tolerance: maximum distance between boundaries in 'boundary' mode
+    :return: tuple of int arrays (pred indices, gold indices)
+    """
+    if mode not in LENIENT_MODES:
+        raise ValueError('Unknown matching mode <{}>, possible values are: {}'.format(mode, ', '.join(LENIENT_MODES)))
+    empty = np.zeros(0, dtype=np.int64)
+    if len(gold_start) == 0 or len(pred_start) == 0:
+        return empty, empty.copy()
+    gold_group, gold_start, gold_end = [np.asarray(a, dtype=np.int64) for a in (gold_group, gold_start, gold_end)]
+    pred_group, pred_start, pred_end = [np.asarray(a, dtype=np.int64) for a in (pred_group, pred_start, pred_end)]
+
+    n_pos = int(max(gold_end.max(), pred_end.max(), gold_start.max(), pred_start.max())) + tolerance + 2
+    if mode == 'overlap':
+        # Two spans overlap if the gold one starts inside the prediction, or the prediction starts inside the gold
+        # one (after its start, so that no pair is found twice). Both are windows of starts, so only pairs that
+        # overlap are looked at, however long the spans are
+        pred_idx, gold_idx = _window_pairs(gold_group, gold_start, pred_group, pred_start, pred_end - 1, n_pos)
+        more_gold, more_pred = _window_pairs(pred_group, pred_start, gold_group, gold_start + 1, gold_end - 1, n_pos)
+        pred_idx, gold_idx = np.concatenate([pred_idx, more_pred]), np.concatenate([gold_idx, more_gold])
+        # Same order as one window per prediction: by prediction, then by gold start
+        by_pred = np.lexsort((gold_idx, gold_start[gold_idx], pred_idx))
+        pred_idx, gold_idx = pred_idx[by_pred], gold_idx[by_pred]
+    elif mode == 'boundary':
+        pred_idx, gold_idx = _window_pairs(gold_group, gold_start, pred_group, pred_start - tolerance,
+                                           pred_start + tolerance, n_pos)
+    else:
+        pred_idx, gold_idx = _window_pairs(gold_group, gold_start, pred_group, pred_start, pred_start, n_pos)
+
+    g_start, g_end = gold_start[gold_idx], gold_end[gold_idx]
+    p_start, p_end = pred_start[pred_idx], pred_end[pred_idx]
+    if mode == 'overlap':
+        keep = np.minimum(g_end, p_end) > np.maximum(g_start, p_start)
+    elif mode == 'boundary':
+        keep = np.abs(g_end - p_end) <= tolerance
+    else:
+        keep = g_end == p_end
+    return pred_idx[keep], gold_idx[keep]
+
+
+def assign_one_to_one(pred_idx, gold_idx, cost):
+    """
+    Choose pairs so that each annotation is matched at most once, taking the cheapest pairs first.
+    In every round, pairs where the prediction and the gold annotation are each other's cheapest option are kept and
+    every other pair that uses them is dropped (the cheapest remaining pair always qualifies, so this is the same
+    as going through the pairs by cost, but vectorised).
+    :param cost: int or float array, cost of each pair (ties are broken by index)
+    :return: tuple of int arrays (pred indices, gold indices) of the assigned pairs
+    """
+    pred_idx, gold_idx, cost = np.asarray(pred_idx), np.asarray(gold_idx), np.asarray(cost)
+    chosen = []
+    active = np.arange(len(pred_idx))
+    while len(active):
+        p, g, c = pred_idx[active], gold_idx[active], cost[active]
+        by_pred = np.lexsort((g, c, p))
+        best_for_pred = by_pred[np.r_[True, p[by_pred][1:] != p[by_pred][:-1]]]
+        by_gold = np.lexsort((p, c, g))
+        best_for_gold = by_gold[np.r_[True, g[by_gold][1:] != g[by_gold][:-1]]]
+        mutual = np.intersect1d(best_for_pred, best_for_gold, assume_unique=True)
+        chosen.append(active[mutual])
+        used = np.isin(p, p[mutual]) | np.isin(g, g[mutual])
+        active = active[~used]
+    chosen = np.concatenate(chosen) if chosen else np.zeros(0, dtype=np.int64)
+    return pred_idx[chosen], gold_idx[chosen]
+
+
+def match(gold_group, gold_start, gold_end, pred_group, pred_start, pred_end, mode='overlap', tolerance=1):
+    """
+    One-to-one lenient matching (see candidate_pairs and assign_one_to_one).
+    :return: tuple of int arrays (pred indices, gold indices) of the matched annotations
+    """
+    pred_idx, gold_idx = candidate_pairs(gold_group, gold_start, gold_end, pred_group, pred_start, pred_end,
+                                         mode=mode, tolerance=tolerance)
+    if len(pred_idx) == 0:
+        return pred_idx, gold_idx
+    gold_start, gold_end = np.asarray(gold_start)[gold_idx], np.asarray(gold_end)[gold_idx]
+    pred_start, pred_end = np.asarray(pred_start)[pred_idx], np.asarray(pred_end)[pred_idx]
+    # Closer boundaries first, then bigger overlaps
+    distance = np.abs(gold_start - pred_start) + np.abs(gold_end - pred_end)
+    overlap = np.minimum(gold_end, pred_end) - np.maximum(gold_start, pred_start)
+    scale = int(max(gold_end.max(), pred_end.max())) + 1
+    return assign_one_to_one(pred_idx, gold_idx, distance.astype(np.int64) * scale - overlap)
@@ -5,12 +5,17 @@ Adaptation of Antonio Miranda's IAA computation script (https://github.com/TeMU-
 evaluation library for precision, recall, F-1 measure (https://github.com/TeMU-BSC/meddoprof-evaluation-library)
 """
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
-import os
 import pandas as pd
 import numpy as np
 import warnings
 
+from . import ann_structure
+from . import matching
+from .table import AnnTable, KEY_COLUMNS, RelationTable, encode_keys, encode_relation_keys, shared_codes
+
 
 def warning_on_one_line(message, category, filename, lineno, file=None, line=None):
     return '%s:%s: %s: %s\n' % (filename, lineno, category.__name__, message)
@@ -19,55 +24,57 @@ def warning_on_one_line(message, category, filename, lineno, file=None, line=Non
 warnings.formatwarning = warning_on_one_line
 
 
+def get_table(corpus):
+    '''
+    Metrics accept both AnnCorpus objects and their columnar AnnTable (see AnnCorpus.to_table).
+    '''
+    if isinstance(corpus, AnnTable):
+        return corpus
+    return corpus.to_table()
+
+
 # Show metrics
-def show_iaa(corpus_list, rel_variables, rel_labels, tsv=False):
+def show_iaa(corpus_list, rel_variables, rel_labels, tsv=False, tsv_output='temp/disagreement.tsv', lenient=None,
+             tolerance=1):
     """
     Compute IAA from several annotators (all vs all and detailed) and for different labels (all together and per label).
-    :param corpus_list: list of AnnCorpus.
+    :param corpus_list: list of AnnCorpus (or AnnTable).
     :param rel_variables: list with relevant variables in IAA computation.
         Possible values are: annotator, filename, mark, label, offset, span, code.
         If we choose "filename,label,offset", matches are annotations in the same file, with same label and in the same
         position in text. It is recommended to always use those three (filename,label,offset).
     :param rel_labels: list of labels to consider when computing IAA.
     :param tsv: Whether to output a tsv file with disagreement info.  # TODO: include IAA info in tsv?
+    :param tsv_output: path or open file object where the disagreement tsv is written (see write_disagreements).
+    :param lenient: optional list of lenient matching modes ('overlap', 'boundary', 'span') to also show pairwise
+                    agreement with (see iaa).
+    :param tolerance: maximum distance between boundaries in 'boundary' mode
 
     EXAMPLE USE:
     peek.metrics.show_iaa([corpus1, corpus2], ['filename', 'label', 'offset'], ['label1', ...])
     """
-    annotator_names = [corpus.name for corpus in corpus_list]
-
-    ##### GET ANN INFORMATION #####
-    list_df = []
-    for corpus in corpus_list:
-        info = []
-        for doc in corpus.docs:
-            for ann in doc.anns['entities']:
-                # TODO: CODES
-                if ann.tag in rel_labels:
-                    span = " ". join([str(n) for tup in ann.span for n in tup])
-                    info.append([corpus.name, doc.name, ann.name, ann.tag, ann.text, span])
-        df = pd.DataFrame(info, columns=['annotator', 'filename', 'mark',
-                                         'label', 'offset', 'span'])
-        list_df.append(df)
+    tables = [get_table(corpus) for corpus in corpus_list]
+    annotator_names = [table.name for table in tables]
 
     if tsv:
-        paths = list(map(lambda x: os.path.join('temp', x + '.tsv'), annotator_names))
-        output_annotation_tables(list_df, paths)
-
-        df1 = pd.read_csv(paths[0], sep='\t', header=0)
-        df1 = df1.drop(['mark'], axis=1)
-
-        df2 = pd.read_csv(paths[1], sep='\t', header=0)
-        df2 = df2.drop(['mark'], axis=1)
-
-        aux = pd.merge(df1, df2, how='outer', on=['filename', 'label', 'offset', 'span'])
-        aux[aux.isnull().any(axis=1)].sort_values(by=['filename', 'span']). \
-            to_csv('temp/disagreement.tsv', sep='\t', header=True, index=False)
+        write_disagreements(tables, rel_labels, tsv_output)
 
     ##### COMPUTE IAA #####
-    (iaa_all_vs_all, iaa_pairwise,
-     iaa_by_label, count_labels) = computations(list_df, rel_variables,
-                                                annotator_names, by_label=True)
+    result = iaa(tables, rel_variables, rel_labels, lenient=lenient, tolerance=tolerance)
+    iaa_all_vs_all, iaa_pairwise, iaa_by_label, count_labels = result.to_dicts()
+    print_iaa(rel_variables, annotator_names, iaa_all_vs_all, iaa_pairwise, iaa_by_label, count_labels)
+    for mode, pairwise in result.lenient.items():
+        print('-----------------------------------------------------------------')
+        print('IAA different annotators, lenient matching ({}):'.format(mode))
+        print('-----------------------------------------------------------------')
+        print(pairwise.round(3).to_string())
+        print('\n')
+
+
+def print_iaa(rel_variables, annotator_names, iaa_all_vs_all, iaa_pairwise, iaa_by_label, count_labels):
+    """
+    Print IAA results as show_iaa does (e.g. for results merged from several shards, see mapreduce.IAATally).
+    """
     ###### PRINT ######
     print('_________________________________________________________________')
     print('\nIAA taking into account {}'.format(rel_variables))
@@ -91,123 +98,42 @@ def show_iaa(corpus_list, rel_variables, rel_labels, tsv=False):
     print('\n')
 
 
-def show_fscore(gs, pred, rel_labels, verbose=False):
+def show_fscore(gs, pred, rel_labels, verbose=False, lenient=None, tolerance=1):
     """
     Compute F-score by comparing a GS brat-annotated corpus and a set of predictions also in brat format.
-    :param gs: Gold Standard as AnnCorpus object.
-    :param pred: Predictions as AnnCorpus object.
+    Scores are computed with fscore, use it directly to get them (also per label) without printing.
+    :param gs: Gold Standard as AnnCorpus (or AnnTable) object.
+    :param pred: Predictions as AnnCorpus (or AnnTable) object.
     :param rel_labels: list of labels to consider for F-score.
     :param verbose: whether to show each individual document's score
+    :param lenient: optional list of lenient matching modes ('overlap', 'boundary', 'span') whose micro-averages are
+                    shown after the strict ones (returned scores are always the strict ones).
+    :param tolerance: maximum distance between boundaries in 'boundary' mode
     # TODO: Print tsv
-    # TODO: Show scores for each individual label
     """
+    result = fscore(gs, pred, rel_labels, lenient=lenient, tolerance=tolerance)
 
-    ##### GET ANN INFORMATION #####
-
-    doc_list_gs = [doc.name for doc in gs.docs]
-
-    info_gs = []
-    for doc in gs.docs:
-        for ann in doc.anns['entities']:
-            if ann.tag in rel_labels:
-                span = " ". join([str(n) for tup in ann.span for n in tup])
-                info_gs.append([gs.name, doc.name, ann.name, ann.tag, ann.text, span])
-    gs = pd.DataFrame(info_gs, columns=['annotator', 'filename', 'mark',
-                                        'label', 'offset', 'span'])
-
-    info_pred = []
-    for doc in pred.docs:
-        for ann in doc.anns['entities']:
-            # TODO: CODES
-            if ann.tag in rel_labels:
-                span = " ". join([str(n) for tup in ann.span for n in tup])
-                info_pred.append([pred.name, doc.name, ann.name, ann.tag, ann.text, span])
-    pred = pd.DataFrame(info_pred, columns=['annotator', 'filename', 'mark',
-                                            'label', 'offset', 'span'])
-
-    if pred.shape[0] == 0:
+    if result.pred_pos == 0:
         print('There are no parsed predicted annotations, setting all metrics to 0')
         P = 0
         R = 0
         F = 0
         return P, R, F
-    elif gs.shape[0] == 0:
+    elif result.gs_pos == 0:
         raise Exception('There are no parsed Gold Standard annotations')
 
-    # Drop duplicates
-    pred = pred.drop_duplicates(['filename', 'label', 'offset']).copy()
-    gs = gs.drop_duplicates(['filename', 'label', 'offset']).copy()
-
-    relevant_columns = ["filename", "offset", "label"]
-
-    # Predicted Positives:
-    Pred_Pos_per_cc = \
-        pred.drop_duplicates(subset=relevant_columns). \
-            groupby("filename")["offset"].count()
-    Pred_Pos = pred.drop_duplicates(subset=relevant_columns).shape[0]
-
-    # Gold Standard Positives:
-    GS_Pos_per_cc = \
-        gs.drop_duplicates(subset=relevant_columns). \
-            groupby("filename")["offset"].count()
-    GS_Pos = gs.drop_duplicates(subset=relevant_columns).shape[0]
-
-    # Eliminate predictions not in GS (prediction needs to be in same clinical
-    # case and to have the exact same offset to be considered valid!!!!)
-    df_sel = pd.merge(pred, gs,
-                      how="right",
-                      on=relevant_columns)
-    is_valid = df_sel.apply(lambda x: x.isnull().any() == False, axis=1)
-    df_sel = df_sel.assign(is_valid=is_valid.values)
-
-    # True Positives:
-    TP_per_cc = (df_sel[df_sel["is_valid"] == True]
-                 .groupby("filename")["is_valid"].count())
-    TP = df_sel[df_sel["is_valid"] == True].shape[0]
-
-    # Add entries for clinical cases that are not in predictions but are present
-    # in the GS
-    cc_not_predicted = (pred.drop_duplicates(subset=["filename"])
-                        .merge(gs.drop_duplicates(subset=["filename"]),
-                               on='filename',
-                               how='right', indicator=True)
-                        .query('_merge == "right_only"')
-                        .drop('_merge', 1))['filename'].to_list()
-    for cc in cc_not_predicted:
-        TP_per_cc[cc] = 0
-
-    # Add TP = 0 in clinical cases where all predictions are wrong
-    for doc in doc_list_gs:
-        if doc not in TP_per_cc.index.tolist():
-            TP_per_cc[doc] = 0
-
-    # Remove entries for clinical cases that are not in GS but are present
-    # in the predictions
-    cc_not_GS = (gs.drop_duplicates(subset=["filename"])
-                 .merge(pred.drop_duplicates(subset=["filename"]),
-                        on='filename',
-                        how='right', indicator=True)
-                 .query('_merge == "right_only"')
-                 .drop('_merge', 1))['filename'].to_list()
-    Pred_Pos_per_cc = Pred_Pos_per_cc.drop(cc_not_GS)
-
-    # Calculate Final Metrics:
-    P_per_cc = TP_per_cc / Pred_Pos_per_cc
-    P = TP / Pred_Pos
-    R_per_cc = TP_per_cc / GS_Pos_per_cc
-    R = TP / GS_Pos
-    F1_per_cc = (2 * P_per_cc * R_per_cc) / (P_per_cc + R_per_cc)
+    P, R = result.precision, result.recall
+    P_per_cc, R_per_cc, F1_per_cc = result.per_doc['precision'], result.per_doc['recall'], result.per_doc['f1']
     if (P + R) == 0:
         F1 = 0
         warnings.warn('Global F1 score automatically set to zero to avoid division by zero')
         return P, R, F1
-    F1 = (2 * P * R) / (P + R)
+    F1 = result.f1
 
     if (any([F1, P, R]) > 1) | any(F1_per_cc > 1) | any(P_per_cc > 1) | any(R_per_cc > 1):
         warnings.warn(
             'Metric greater than 1! You have encountered an undetected bug, please, contact antoniomiresc@gmail.com!')
 
-    # return P_per_cc, P, R_per_cc, R, F1_per_cc, F1
     ###### Show results ######
     if verbose:
         print('\n-----------------------------------------------------')
@@ -237,9 +163,728 @@ def show_fscore(gs, pred, rel_labels, verbose=False):
     print('\nMicro-average precision = {}\n'.format(round(P, 3)))
     print('\nMicro-average recall = {}\n'.format(round(R, 3)))
     print('\nMicro-average F-score = {}\n'.format(round(F1, 3)))
+    for mode, lenient_result in result.lenient.items():
+        print('\n_____________________________________________________')
+        print('Micro-average metrics, lenient matching ({})'.format(mode))
+        print('_____________________________________________________')
+        print('\nMicro-average precision = {}\n'.format(round(lenient_result.precision, 3)))
+        print('\nMicro-average recall = {}\n'.format(round(lenient_result.recall, 3)))
+        print('\nMicro-average F-score = {}\n'.format(round(lenient_result.f1, 3)))
 
     return round(P, 3), round(R, 3), round(F1, 3)
 
+
+def show_confusion(gs, pred, rel_labels=None, top=10):
+    """
+    Print how many predicted mentions are correct, have the wrong label, are spurious or are missing, the most
+    frequent label swaps and the confusion matrix (see confusion).
+    :param gs: Gold Standard as AnnCorpus (or AnnTable) object.
+    :param pred: Predictions as AnnCorpus (or AnnTable) object.
+    :param rel_labels: optional list of labels to consider (all by default).
+    :param top: number of label swaps to show
+    :return: ConfusionResult
+    """
+    result = confusion(gs, pred, rel_labels)
+    print('\n_____________________________________________________')
+    print('Mentions by (filename, span)')
+    print('_____________________________________________________')
+    for name in ['correct', 'swapped', 'spurious', 'missing']:
+        print('{}\t{}'.format(name, getattr(result, name)))
+    print('\n-----------------------------------------------------')
+    print('Most frequent label swaps (gold -> predicted)')
+    print('-----------------------------------------------------')
+    for gold, predicted, count in result.top_confusions(top):
+        print('{} -> {}\t{}'.format(gold, predicted, count))
+    print('\n-----------------------------------------------------')
+    print('Confusion matrix (rows: gold, columns: predicted)')
+    print('-----------------------------------------------------')
+    print(result.matrix.to_string())
+    return result
+
+
+class FScoreResult:
+    """
+    Scores returned by fscore.
+    tp, pred_pos, gs_pos: true positives, predicted positives and Gold Standard positives (duplicates not counted)
+    precision, recall, f1: micro-averaged scores (0 when they are not defined)
+    per_doc: DataFrame indexed by filename with columns tp, pred_pos, gs_pos, precision, recall and f1
+             (documents and NaN values as in show_fscore's per-document scores)
+    per_label: DataFrame indexed by label with the same columns (NaN where scores are not defined)
+    lenient: dict {mode: FScoreResult} with the scores of the lenient matching modes that were requested (see
+             matching.py). Their counts are of distinct (filename, label, span) annotations.
+    """
+
+    def __init__(self, tp, pred_pos, gs_pos, per_doc, per_label, lenient=None):
+        self.tp = tp
+        self.pred_pos = pred_pos
+        self.gs_pos = gs_pos
+        self.precision = tp / pred_pos if pred_pos else 0
+        self.recall = tp / gs_pos if gs_pos else 0
+        p_r = self.precision + self.recall
+        self.f1 = 2 * self.precision * self.recall / p_r if p_r else 0
+        self.per_doc = per_doc
+        self.per_label = per_label
+        self.lenient = lenient if lenient is not None else {}
+
+    def __repr__(self):
+        return '<FScoreResult: P={} R={} F1={}>'.format(round(self.precision, 3), round(self.recall, 3),
+                                                        round(self.f1, 3))
+
+
+def _scores_frame(tp, pred_pos, gs_pos, index):
+    # P, R and F1 for each row, NaN when they are not defined
+    frame = pd.DataFrame({'tp': tp, 'pred_pos': pred_pos, 'gs_pos': gs_pos}, index=index)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frame['precision'] = frame['tp'] / frame['pred_pos'].replace(0, np.nan)
+        frame['recall'] = frame['tp'] / frame['gs_pos'].replace(0, np.nan)
+        frame['f1'] = 2 * frame['precision'] * frame['recall'] / (frame['precision'] + frame['recall'])
+    return frame
+
+
+def fscore(gs, pred, rel_labels, lenient=None, tolerance=1):
+    """
+    Precision, recall and F-score of predictions against a Gold Standard, globally, per document and per label.
+    Same matching as show_fscore (an annotation is a true positive if there is one in the Gold Standard with the same
+    filename, label and text), computed with NumPy over the corpora's columnar tables: every annotation is encoded as
+    an integer key and true positives are found with a single join of the (deduplicated) keys.
+    To score many predictions against the same Gold Standard, build a GoldIndex once and use it instead.
+    :param gs: Gold Standard as AnnCorpus (or AnnTable) object.
+    :param pred: Predictions as AnnCorpus (or AnnTable) object.
+    :param rel_labels: list of labels to consider for F-score.
+    :param lenient: optional list of lenient matching modes to also score ('overlap', 'boundary' and/or 'span',
+                    see matching.py), available in result.lenient. Note that lenient modes compare positions, while
+                    strict scores compare entity text, so lenient scores can be lower when the same text is annotated
+                    at different positions.
+    :param tolerance: maximum distance between boundaries in 'boundary' mode
+    :return: FScoreResult
+
+    EXAMPLE USE:
+    result = peek.metrics.fscore(gs, pred, gs.text_labels)
+    print(result.f1, result.per_label)
+    """
+    return GoldIndex(gs, rel_labels).score(pred, lenient=lenient, tolerance=tolerance)
+
+
+class GoldIndex:
+    """
+    Gold Standard indexed once to score any number of predictions against it (e.g. every checkpoint of a model), with
+    the same matching and results as fscore.
+    The deduplicated gold keys, their documents and labels and the positives per document and label are computed
+    when the index is built; scoring a prediction only encodes the prediction and joins it with them.
+
+    EXAMPLE USE:
+    index = peek.metrics.GoldIndex(gs, gs.text_labels)
+    result = index.score(pred)
+    table = index.compare(['checkpoint1/', 'checkpoint2/', 'checkpoint3/'], workers=3)
+    """
+
+    def __init__(self, gs, rel_labels):
+        '''
+        :param gs: Gold Standard as AnnCorpus (or AnnTable) object.
+        :param rel_labels: list of labels to consider for F-score.
+        '''
+        gs = get_table(gs)
+        self.name = gs.name
+        self.rel_labels = list(rel_labels)
+        self.table = gs.select(self.rel_labels)
+        # Dictionaries {value: code} that predictions are encoded with
+        self._docs, self._labels, self._texts = {}, {}, {}
+        self.doc, _ = _lookup(self._docs, self.table.doc, gs.doc_names, extend=True)
+        self.tag, _ = _lookup(self._labels, self.table.tag, gs.labels, extend=True)
+        self.text, _ = _lookup(self._texts, self.table.text, gs.texts, extend=True)
+        self.doc_list = list(gs.doc_names)
+
+        # Distinct gold annotations (first occurrence of each key), sorted by key
+        self.key, self.rows = np.unique(self._key(self.doc, self.tag, self.text), return_index=True)
+        self.key_doc, self.key_tag = self.doc[self.rows], self.tag[self.rows]
+        self.doc_pos = np.bincount(self.key_doc, minlength=len(self._docs))
+        self.label_pos = np.bincount(self.key_tag, minlength=len(self._labels))
+        self._span_rows = None
+
+    def __repr__(self):
+        return '<GoldIndex {}: {} annotations, {} documents>'.format(self.name, len(self.key), len(self._docs))
+
+    def _key(self, doc, tag, text):
+        return (doc * len(self._labels) + tag) * len(self._texts) + text
+
+    def score(self, pred, lenient=None, tolerance=1):
+        """
+        Score one set of predictions (see fscore).
+        :param pred: Predictions as AnnCorpus (or AnnTable) object, or path to a corpus folder or archive.
+        :return: FScoreResult
+        """
+        if isinstance(pred, str):
+            pred = ann_structure.AnnCorpus(pred)
+        pred = get_table(pred).select(self.rel_labels)
+        n_gold_docs, n_gold_labels = len(self._docs), len(self._labels)
+        # Values the Gold Standard does not have get codes after its own, so they never match
+        doc, extra_docs = _lookup(self._docs, pred.doc, pred.doc_names)
+        tag, extra_labels = _lookup(self._labels, pred.tag, pred.labels)
+        text, extra_texts = _lookup(self._texts, pred.text, pred.texts)
+        doc_names = np.array(list(self._docs) + extra_docs, dtype=object)
+        labels = list(self._labels) + extra_labels
+        lenient_results = {mode: self._lenient_score(pred, doc, tag, doc_names, labels, mode, tolerance)
+                           for mode in (lenient or [])}
+
+        # Drop duplicates, then join
+        n_labels, n_texts = len(labels), len(self._texts) + len(extra_texts)
+        _, rows = np.unique((doc * n_labels + tag) * n_texts + text, return_index=True)
+        doc, tag, text = doc[rows], tag[rows], text[rows]
+        known = (doc < n_gold_docs) & (tag < n_gold_labels) & (text < len(self._texts))
+        is_tp = np.isin(self.key, self._key(doc[known], tag[known], text[known]))
+
+        # Per label
+        per_label = _scores_frame(np.bincount(self.key_tag[is_tp], minlength=n_labels),
+                                  np.bincount(tag, minlength=n_labels),
+                                  np.bincount(self.key_tag, minlength=n_labels), pd.Index(labels, name='label'))
+        per_label = per_label[per_label.index.isin(self.rel_labels)].sort_index()
+
+        # Per document, keeping the documents show_fscore reports (only Gold Standard documents)
+        doc_names = doc_names[:n_gold_docs]
+        tp_doc = np.bincount(self.key_doc[is_tp], minlength=n_gold_docs)
+        pred_pos_doc = np.bincount(doc[doc < n_gold_docs], minlength=n_gold_docs)
+        gs_pos_doc = self.doc_pos
+        # Documents with true positives, then GS documents without predictions (in GS order), then every other GS document
+        with_tp = np.flatnonzero(tp_doc)
+        tp_names = sorted(doc_names[with_tp].tolist())
+        not_predicted = pred_pos_doc[self.key_doc] == 0
+        first_rows = np.argsort(self.rows[not_predicted], kind='stable')
+        not_predicted, first = np.unique(self.key_doc[not_predicted][first_rows], return_index=True)
+        tp_index = tp_names + doc_names[not_predicted[np.argsort(first)]].tolist()
+        seen = set(tp_index)
+        tp_index.extend(d for d in self.doc_list if d not in seen and not seen.add(d))
+        tp_per_cc = pd.Series([tp_doc[self._docs[d]] for d in tp_index], index=tp_index, dtype=np.int64)
+        # Predicted positives only for documents with GS annotations
+        pred_docs = np.flatnonzero((pred_pos_doc > 0) & (gs_pos_doc > 0))
+        pred_pos_per_cc = pd.Series(pred_pos_doc[pred_docs], index=doc_names[pred_docs]).sort_index()
+        gs_docs = np.flatnonzero(gs_pos_doc)
+        gs_pos_per_cc = pd.Series(gs_pos_doc[gs_docs], index=doc_names[gs_docs]).sort_index()
+
+        p_per_cc = tp_per_cc / pred_pos_per_cc
+        r_per_cc = tp_per_cc / gs_pos_per_cc
+        per_doc = pd.DataFrame({'precision': p_per_cc, 'recall': r_per_cc,
+                                'f1': (2 * p_per_cc * r_per_cc) / (p_per_cc + r_per_cc)})
+        per_doc.insert(0, 'gs_pos', gs_pos_per_cc.reindex(per_doc.index, fill_value=0))
+        per_doc.insert(0, 'pred_pos', pred_pos_per_cc.reindex(per_doc.index, fill_value=0))
+        per_doc.insert(0, 'tp', tp_per_cc.reindex(per_doc.index, fill_value=0))
+        per_doc.index.name = 'filename'
+
+        return FScoreResult(int(is_tp.sum()), len(rows), len(self.key), per_doc, per_label, lenient=lenient_results)
+
+    def _lenient_score(self, pred, doc, tag, doc_names, labels, mode, tolerance):
+        if self._span_rows is None:
+            self._span_rows = _distinct_spans([self.table])[0]
+        gs_rows = self._span_rows
+        pred_rows = _distinct_spans([pred])[0]
+        # Typed modes only match annotations with the same label
+        n_labels = len(labels)
+        gs_group = self.doc * n_labels + self.tag if mode != 'span' else self.doc
+        pred_group = doc * n_labels + tag if mode != 'span' else doc
+        _, matched = _lenient_match(self.table, pred, gs_rows, pred_rows, gs_group, pred_group, mode, tolerance)
+        matched = gs_rows[matched]
+        n_docs = len(doc_names)
+        per_doc = _scores_frame(np.bincount(self.doc[matched], minlength=n_docs),
+                                np.bincount(doc[pred_rows], minlength=n_docs),
+                                np.bincount(self.doc[gs_rows], minlength=n_docs), pd.Index(doc_names, name='filename'))
+        per_label = _scores_frame(np.bincount(self.tag[matched], minlength=n_labels),
+                                  np.bincount(tag[pred_rows], minlength=n_labels),
+                                  np.bincount(self.tag[gs_rows], minlength=n_labels), pd.Index(labels, name='label'))
+        per_label = per_label[per_label.index.isin(self.rel_labels)].sort_index()
+        return FScoreResult(len(matched), len(pred_rows), len(gs_rows), per_doc, per_label)
+
+    def score_many(self, pred_list, lenient=None, tolerance=1, workers=None, executor=None):
+        """
+        Score several predictions, optionally in parallel (the index is sent once to every task).
+        :param pred_list: list of predictions as AnnCorpus or AnnTable objects or paths to corpus folders or archives
+                          (paths are loaded by the workers, so only their scores travel back).
+        :param workers: number of processes to use (sequential by default)
+        :param executor: any concurrent.futures.Executor to use instead of creating a process pool
+        :return: list of FScoreResult, in the same order
+        """
+        fn = partial(_score_with_index, self, lenient=lenient, tolerance=tolerance)
+        pred_list = list(pred_list)
+        if not workers and executor is None:
+            return list(map(fn, pred_list))
+        elif executor is not None:
+            return list(executor.map(fn, pred_list))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(fn, pred_list))
+
+    def compare(self, pred_list, names=None, lenient=None, tolerance=1, workers=None, executor=None):
+        """
+        Comparison table of several predictions (see score_many for the parameters).
+        :param names: optional list of names for the predictions (by default, their paths or corpus names)
+        :return: DataFrame indexed by system with columns tp, pred_pos, gs_pos, precision, recall and f1 (and
+                 precision, recall and f1 of every lenient mode, prefixed by its name)
+        """
+        pred_list = list(pred_list)
+        if names is None:
+            names = [pred if isinstance(pred, str) else get_table(pred).name for pred in pred_list]
+        rows = []
+        for result in self.score_many(pred_list, lenient=lenient, tolerance=tolerance, workers=workers,
+                                      executor=executor):
+            row = {'tp': result.tp, 'pred_pos': result.pred_pos, 'gs_pos': result.gs_pos,
+                   'precision': result.precision, 'recall': result.recall, 'f1': result.f1}
+            for mode, lenient_result in result.lenient.items():
+                for score in ['precision', 'recall', 'f1']:
+                    row['{}_{}'.format(mode, score)] = getattr(lenient_result, score)
+            rows.append(row)
+        return pd.DataFrame(rows, index=pd.Index(names, name='system'))
+
+
+def _score_with_index(index, pred, lenient=None, tolerance=1):
+    # Module-level so that it can be sent to worker processes
+    return index.score(pred, lenient=lenient, tolerance=tolerance)
+
+
+def _lookup(index, codes, values, extend=False):
+    '''
+    Map the codes of a dictionary-encoded column onto an index {value: code}.
+    :param extend: whether to add new values to the index; otherwise they get codes after the index's own
+    :return: tuple (int64 codes, list of the values that are not in the index, in code order)
+    '''
+    extra = {}
+    if extend:
+        mapping = [index.setdefault(v, len(index)) for v in values]
+    else:
+        mapping = [index[v] if v in index else extra.setdefault(v, len(index) + len(extra)) for v in values]
+    mapping = np.array(mapping, dtype=np.int64)
+    return (mapping[codes] if len(codes) else np.zeros(0, dtype=np.int64)), list(extra)
+
+
+def _distinct_spans(tables):
+    # Rows of each table with a distinct (filename, label, span), the units of lenient matching
+    return [np.unique(k, return_index=True)[1] for k in encode_keys(tables, ['filename', 'label', 'span'])]
+
+
+def _lenient_match(table_a, table_b, rows_a, rows_b, group_a, group_b, mode, tolerance):
+    # One-to-one lenient matching of two tables' rows (a plays the role of the Gold Standard)
+    return matching.match(group_a[rows_a], table_a.start[rows_a], table_a.end[rows_a],
+                          group_b[rows_b], table_b.start[rows_b], table_b.end[rows_b], mode=mode, tolerance=tolerance)
+
+
+# Label confusion
+NO_LABEL = '(none)'
+
+
+class ConfusionResult:
+    """
+    Mentions returned by confusion, keyed by (filename, span).
+    correct: same span and label in both
+    swapped: same span, different label
+    spurious: predicted span the Gold Standard does not have
+    missing: Gold Standard span without prediction
+    matrix: DataFrame with Gold Standard labels as rows and predicted labels as columns. The diagonal holds correct
+            mentions, other cells label swaps, the NO_LABEL row spurious mentions and the NO_LABEL column missing ones.
+    per_label: DataFrame indexed by label with columns correct, swapped_out (Gold Standard mentions predicted with
+               another label), swapped_in (predictions of the label where the Gold Standard has another), spurious and
+               missing
+    """
+
+    def __init__(self, labels, matrix):
+        self.labels = labels
+        self.matrix = matrix
+        values = matrix.to_numpy()
+        n = len(labels)
+        inner = values[:n, :n]
+        self.correct = int(np.trace(inner))
+        self.swapped = int(inner.sum() - self.correct)
+        self.spurious = int(values[n, :n].sum())
+        self.missing = int(values[:n, n].sum())
+        diagonal = np.diag(inner)
+        self.per_label = pd.DataFrame({'correct': diagonal, 'swapped_out': inner.sum(axis=1) - diagonal,
+                                       'swapped_in': inner.sum(axis=0) - diagonal, 'spurious': values[n, :n],
+                                       'missing': values[:n, n]}, index=pd.Index(labels, name='label'))
+
+    def __repr__(self):
+        return '<ConfusionResult: {} correct, {} swapped, {} spurious, {} missing>'.format(
+            self.correct, self.swapped, self.spurious, self.missing)
+
+    def top_confusions(self, n=10):
+        """
+        Most frequent label swaps.
+        :return: list of (Gold Standard label, predicted label, count), most frequent first
+        """
+        inner = self.matrix.iloc[:len(self.labels), :len(self.labels)].to_numpy().copy()
+        np.fill_diagonal(inner, 0)
+        gold, pred = np.nonzero(inner)
+        order = np.lexsort((pred, gold, -inner[gold, pred]))[:n]
+        return [(self.labels[gold[i]], self.labels[pred[i]], int(inner[gold[i], pred[i]])) for i in order]
+
+
+def confusion(gs, pred, rel_labels=None):
+    """
+    Label confusion between a Gold Standard and predictions, for mentions with the same filename and span.
+    Mentions with the same span and label are correct. The rest of the mentions that share a span are paired (in label
+    order) as label swaps, and whatever is left is spurious (predictions) or missing (Gold Standard).
+    Both sides are encoded as integer keys over the columnar tables and joined with hash lookups, so it costs about as
+    much as fscore. Duplicated mentions (same filename, span and label) are counted once.
+    :param gs: Gold Standard as AnnCorpus (or AnnTable) object.
+    :param pred: Predictions as AnnCorpus (or AnnTable) object.
+    :param rel_labels: optional list of labels to consider (all by default).
+    :return: ConfusionResult
+
+    EXAMPLE USE:
+    result = peek.metrics.confusion(gs, pred, gs.text_labels)
+    print(result.top_confusions(5))
+    """
+    tables = [get_table(gs), get_table(pred)]
+    if rel_labels is not None:
+        tables = [t.select(rel_labels) for t in tables]
+    (gs_tag, pred_tag), labels = shared_codes(tables, 'label')
+    n_labels = max(len(labels), 1)
+    gs_span, pred_span = encode_keys(tables, ['filename', 'span'])
+
+    # Distinct (span, label) of each side, sorted by span and then label
+    gs_key = np.unique(gs_span * n_labels + gs_tag)
+    pred_key = np.unique(pred_span * n_labels + pred_tag)
+    # Same span and label
+    found = pd.Index(gs_key).get_indexer(pred_key)
+    correct = pred_key[found >= 0] % n_labels
+    gs_rest = np.delete(gs_key, found[found >= 0])
+    pred_rest = pred_key[found < 0]
+
+    # Pair the remaining mentions that share a span by their rank inside it
+    def ranked(keys):
+        span = keys // n_labels
+        return span * n_labels + np.arange(len(span)) - np.searchsorted(span, span)
+    found = pd.Index(ranked(gs_rest)).get_indexer(ranked(pred_rest))
+    missing = np.ones(len(gs_rest), dtype=bool)
+    missing[found[found >= 0]] = False
+
+    # Rows and columns: labels, then NO_LABEL
+    side = n_labels + 1
+    gs_rest, pred_rest = gs_rest % n_labels, pred_rest % n_labels
+    cells = np.concatenate([correct * side + correct,
+                            gs_rest[found[found >= 0]] * side + pred_rest[found >= 0],
+                            gs_rest[missing] * side + n_labels,
+                            n_labels * side + pred_rest[found < 0]])
+    values = np.bincount(cells, minlength=side * side).reshape(side, side)
+    # Labels in alphabetical order (only the relevant ones, tables keep their whole label dictionaries)
+    order = [i for i in np.argsort(labels, kind='stable') if rel_labels is None or labels[i] in rel_labels]
+    names = [labels[i] for i in order] + [NO_LABEL]
+    order.append(n_labels)
+    matrix = pd.DataFrame(values[np.ix_(order, order)], index=pd.Index(names, name='gold'),
+                          columns=pd.Index(names, name='pred'))
+    return ConfusionResult(names[:-1], matrix)
+
+
+# Relations and events
+def get_relation_table(corpus, kind='relations'):
+    '''
+    Relation metrics accept AnnCorpus objects (or any object with name and iter_docs) and RelationTables.
+    '''
+    if isinstance(corpus, RelationTable):
+        if corpus.kind != kind:
+            raise ValueError('Expected a table of {}, got one of {}'.format(kind, corpus.kind))
+        return corpus
+    return RelationTable.from_corpus(corpus, kind)
+
+
+def relation_fscore(gs, pred, kind='relations', rel_labels=None):
+    """
+    Precision, recall and F-score of relations or events, globally, per document and per type.
+    A prediction is a true positive if the Gold Standard has one in the same file, with the same type and with
+    arguments that have the same roles and the same entity spans (their IDs do not matter). Arguments are resolved
+    through an ID index of each document and the resulting signatures are hashed, so the cost is linear in the number
+    of annotations.
+    :param gs: Gold Standard as AnnCorpus (or RelationTable) object.
+    :param pred: Predictions as AnnCorpus (or RelationTable) object.
+    :param kind: 'relations' or 'events'
+    :param rel_labels: optional list of relation or event types to consider (all by default).
+    :return: FScoreResult (per_label is per type)
+
+    EXAMPLE USE:
+    result = peek.metrics.relation_fscore(gs, pred, 'events')
+    print(result.f1, result.per_label)
+    """
+    tables = [get_relation_table(gs, kind), get_relation_table(pred, kind)]
+    if rel_labels is not None:
+        tables = [t.select(rel_labels) for t in tables]
+    gs_key, pred_key = encode_relation_keys(tables)
+    (gs_doc, pred_doc), doc_names = shared_codes(tables, 'filename')
+    (gs_tag, pred_tag), labels = shared_codes(tables, 'label')
+
+    # Drop duplicates, then join
+    gs_key, gs_rows = np.unique(gs_key, return_index=True)
+    pred_key, pred_rows = np.unique(pred_key, return_index=True)
+    is_tp = np.isin(gs_key, pred_key, assume_unique=True)
+    gs_doc, gs_tag = gs_doc[gs_rows], gs_tag[gs_rows]
+    pred_doc, pred_tag = pred_doc[pred_rows], pred_tag[pred_rows]
+
+    n_docs, n_labels = len(doc_names), len(labels)
+    per_doc = _scores_frame(np.bincount(gs_doc[is_tp], minlength=n_docs), np.bincount(pred_doc, minlength=n_docs),
+                            np.bincount(gs_doc, minlength=n_docs), pd.Index(doc_names, name='filename'))
+    per_label = _scores_frame(np.bincount(gs_tag[is_tp], minlength=n_labels),
+                              np.bincount(pred_tag, minlength=n_labels),
+                              np.bincount(gs_tag, minlength=n_labels), pd.Index(labels, name='label'))
+    if rel_labels is not None:
+        per_label = per_label[per_label.index.isin(rel_labels)]
+    return FScoreResult(int(is_tp.sum()), len(pred_key), len(gs_key), per_doc, per_label.sort_index())
+
+
+def relation_iaa(corpus_list, kind='relations', rel_labels=None):
+    """
+    Agreement between several annotators on relations or events (all together, by pairs and per type), matching
+    them as relation_fscore does.
+    :param corpus_list: list of AnnCorpus (or RelationTable), one per annotator.
+    :param kind: 'relations' or 'events'
+    :param rel_labels: optional list of relation or event types to consider (all by default).
+    :return: IAAResult (labels are types)
+
+    EXAMPLE USE:
+    result = peek.metrics.relation_iaa([corpus1, corpus2], 'relations')
+    print(result.all_vs_all, result.pairwise)
+    """
+    tables = [get_relation_table(corpus, kind) for corpus in corpus_list]
+    if rel_labels is not None:
+        tables = [t.select(rel_labels) for t in tables]
+    label_codes, labels = shared_codes(tables, 'label')
+    return _iaa_from_codes([t.name for t in tables], encode_relation_keys(tables), label_codes, labels)
+
+
+class IAAResult:
+    """
+    Agreement returned by iaa: intersection / union of the annotators' sets of annotations.
+    all_vs_all: agreement of all annotators together
+    pairwise: DataFrame (annotators x annotators) with the agreement of each pair
+    per_label: DataFrame indexed by label with the all vs all agreement (iaa) and the number of annotations (count)
+    Intersection and union sizes are kept too (pair_intersection, label_union...), use label_pairwise to get the
+    pairwise agreement of a single label.
+    lenient: dict {mode: DataFrame (annotators x annotators)} with the pairwise agreement of the lenient matching
+             modes that were requested: matches / (annotations of one + annotations of the other - matches).
+    """
+
+    def __init__(self, annotators, labels, label_counts, counts, label_counts_arrays):
+        self.annotators = list(annotators)
+        self.labels = list(labels)
+        # Number of annotations of each label (duplicates included, as in show_iaa)
+        self.count_labels = Counter(dict(zip(self.labels, label_counts)))
+        (self.all_intersection, self.all_union,
+         self.pair_intersection, self.pair_union) = [a[0] for a in counts]
+        (self.label_intersection, self.label_union,
+         self.label_pair_intersection, self.label_pair_union) = label_counts_arrays
+        self.lenient = {}
+
+    def __repr__(self):
+        return '<IAAResult: {} annotators, {} labels, all vs all = {}>'.format(
+            len(self.annotators), len(self.labels), round(self.all_vs_all, 3))
+
+    @property
+    def all_vs_all(self):
+        return float(_agreement(self.all_intersection, self.all_union))
+
+    @property
+    def pairwise(self):
+        return pd.DataFrame(_agreement(self.pair_intersection, self.pair_union), index=self.annotators,
+                            columns=self.annotators)
+
+    @property
+    def per_label(self):
+        frame = pd.DataFrame({'iaa': _agreement(self.label_intersection, self.label_union),
+                              'count': [self.count_labels[label] for label in self.labels]},
+                             index=pd.Index(self.labels, name='label'))
+        return frame.sort_index()
+
+    def label_pairwise(self, label):
+        i = self.labels.index(label)
+        return pd.DataFrame(_agreement(self.label_pair_intersection[i], self.label_pair_union[i]),
+                            index=self.annotators, columns=self.annotators)
+
+    def _pairwise_dict(self, intersection, union):
+        values = _agreement(intersection, union)
+        return {(a1, a2): float(values[i, j]) for i, a1 in enumerate(self.annotators)
+                for j, a2 in enumerate(self.annotators)}
+
+    def to_dicts(self):
+        """
+        Results in the format of computations(..., by_label=True).
+        :return: tuple (iaa_all_vs_all, iaa_pairwise, iaa_by_label, count_labels)
+        """
+        label_iaa = _agreement(self.label_intersection, self.label_union)
+        iaa_by_label = {label: (float(label_iaa[i]), self._pairwise_dict(self.label_pair_intersection[i],
+                                                                         self.label_pair_union[i]))
+                        for i, label in enumerate(self.labels)}
+        return (self.all_vs_all, self._pairwise_dict(self.pair_intersection, self.pair_union), iaa_by_label,
+                Counter(self.count_labels))
+
+
+def iaa(corpus_list, rel_variables, rel_labels, lenient=None, tolerance=1):
+    """
+    Agreement between several annotators, all together, by pairs and per label (same values as show_iaa, without
+    printing). Each annotation is encoded once as an integer key built from the relevant variables (see
+    table.encode_keys), and every agreement is computed from those keys in a single pass.
+    :param corpus_list: list of AnnCorpus (or AnnTable), one per annotator.
+    :param rel_variables: list with relevant variables (annotator, filename, mark, label, offset, span).
+    :param rel_labels: list of labels to consider.
+    :param lenient: optional list of lenient matching modes ('overlap', 'boundary' and/or 'span', see matching.py)
+                    to also compute pairwise agreement with (available in result.lenient). Lenient matching always
+                    compares filename, label (except in 'span' mode) and span, whatever rel_variables are.
+    :param tolerance: maximum distance between boundaries in 'boundary' mode
+    :return: IAAResult
+
+    EXAMPLE USE:
+    result = peek.metrics.iaa([corpus1, corpus2, corpus3], ['filename', 'label', 'offset'], corpus1.text_labels)
+    print(result.all_vs_all, result.pairwise, result.per_label)
+    """
+    tables = [get_table(corpus).select(rel_labels) for corpus in corpus_list]
+    keys = encode_keys(tables, rel_variables)
+    label_codes, labels = shared_codes(tables, 'label')
+    result = _iaa_from_codes([t.name for t in tables], keys, label_codes, labels)
+    if lenient:
+        doc_codes, _ = shared_codes(tables, 'filename')
+        rows = _distinct_spans(tables)
+        sizes = np.array([len(r) for r in rows])
+        for mode in lenient:
+            groups = [doc * len(labels) + tag if mode != 'span' else doc for doc, tag in zip(doc_codes, label_codes)]
+            matches = np.diag(sizes)
+            # Each pair of annotators is matched once
+            for i in range(len(tables)):
+                for j in range(i + 1, len(tables)):
+                    matched, _ = _lenient_match(tables[i], tables[j], rows[i], rows[j], groups[i], groups[j], mode,
+                                                tolerance)
+                    matches[i, j] = matches[j, i] = len(matched)
+            union = sizes[:, None] + sizes[None, :] - matches
+            result.lenient[mode] = pd.DataFrame(_agreement(matches, union), index=result.annotators,
+                                                columns=result.annotators)
+    return result
+
+
+def _agreement(intersection, union):
+    # intersection / union, 0 where there are no annotations at all (as show_iaa has always reported it)
+    intersection = np.asarray(intersection, dtype=float)
+    union = np.asarray(union, dtype=float)
+    return np.divide(intersection, union, out=np.zeros_like(union), where=union > 0)
+
+
+def _iaa_from_codes(annotator_names, keys, label_codes, labels):
+    '''
+    Build an IAAResult from integer codes.
+    :param keys: list with one array of annotation keys per annotator (equal keys mean equal annotations)
+    :param label_codes: list with one array of label codes per annotator, aligned with keys
+    :param labels: label of each label code
+    '''
+    n = len(annotator_names)
+    annotator = np.concatenate([np.full(len(k), i, dtype=np.int64) for i, k in enumerate(keys)]) if n else \
+        np.zeros(0, dtype=np.int64)
+    key = np.concatenate(keys).astype(np.int64) if n else np.zeros(0, dtype=np.int64)
+    label = np.concatenate(label_codes).astype(np.int64) if n else np.zeros(0, dtype=np.int64)
+    # Only labels with annotations are reported
+    label_counts = np.bincount(label, minlength=len(labels))
+    present = np.flatnonzero(label_counts)
+    remap = np.full(len(labels), -1, dtype=np.int64)
+    remap[present] = np.arange(len(present))
+    label = remap[label]
+    counts = _agreement_counts(np.zeros(len(key), dtype=np.int64), key, annotator, n, 1)
+    label_counts_arrays = _agreement_counts(label, key, annotator, n, len(present))
+    return IAAResult(annotator_names, [labels[i] for i in present], label_counts[present].tolist(), counts,
+                     label_counts_arrays)
+
+
+def _agreement_counts(group, key, annotator, n_annotators, n_groups):
+    '''
+    Intersection and union sizes of the annotators' sets of keys within each group (e.g. label), for all of them
+    together and for every pair.
+    Each distinct (group, key) is an item with the set of annotators that have it. Items with the same group and
+    the same annotators are counted together, so pairs are computed once per combination of annotators instead of
+    intersecting sets for every pair.
+    :return: tuple of int64 arrays (all_intersection[n_groups], all_union[n_groups],
+             pair_intersection[n_groups, n, n], pair_union[n_groups, n, n]), where the diagonal has each annotator's
+             number of distinct annotations
+    '''
+    n = n_annotators
+    pair_intersection = np.zeros((n_groups, n, n), dtype=np.int64)
+    if len(key) == 0:
+        zeros = np.zeros(n_groups, dtype=np.int64)
+        return zeros, zeros.copy(), pair_intersection, pair_intersection.copy()
+    n_keys = int(key.max()) + 1
+    items, item_index = np.unique(group * n_keys + key, return_inverse=True)
+    member = np.zeros((len(items), n), dtype=bool)
+    member[item_index.ravel(), annotator] = True
+    item_group = items // n_keys
+    # Distinct (group, set of annotators) combinations and how many items have each of them
+    _, first, pattern_counts = np.unique(np.column_stack([item_group, np.packbits(member, axis=1)]), axis=0,
+                                         return_index=True, return_counts=True)
+    pattern_member = member[first]
+    pattern_group = item_group[first]
+    in_all = pattern_member.all(axis=1)
+    all_intersection = np.bincount(pattern_group[in_all], weights=pattern_counts[in_all], minlength=n_groups)
+    all_union = np.bincount(pattern_group, weights=pattern_counts, minlength=n_groups)
+    # Every pair of annotators in a combination shares all of its items
+    both = (pattern_member[:, :, None] & pattern_member[:, None, :]).reshape(len(first), n * n)
+    cells = pattern_group[:, None] * (n * n) + np.arange(n * n)
+    pair_intersection = np.bincount(cells.ravel(), weights=(both * pattern_counts[:, None]).ravel(),
+                                    minlength=n_groups * n * n).reshape(n_groups, n, n).astype(np.int64)
+    sizes = np.diagonal(pair_intersection, axis1=1, axis2=2)
+    pair_union = sizes[:, :, None] + sizes[:, None, :] - pair_intersection
+    return all_intersection.astype(np.int64), all_union.astype(np.int64), pair_intersection, pair_union
+
+
+DISAGREEMENT_COLUMNS = ['filename', 'label', 'offset', 'span']
+
+
+def disagreements(corpus_list, rel_labels, columns=None):
+    """
+    Annotations that some annotators have and others lack, for any number of annotators.
+    :param corpus_list: list of AnnCorpus (or AnnTable), one per annotator.
+    :param rel_labels: list of labels to consider.
+    :param columns: variables that identify an annotation (by default filename, label, offset (text) and span).
+    :return: DataFrame with the columns, one column per annotator (1 if they have the annotation, 0 otherwise) and
+             'has'/'lacks' with the names of the annotators that have/lack it, sorted by filename and position.
+    """
+    columns = columns if columns is not None else DISAGREEMENT_COLUMNS
+    tables = [get_table(corpus).select(rel_labels) for corpus in corpus_list]
+    names = [t.name for t in tables]
+    keys = encode_keys(tables, columns)
+    annotator = np.concatenate([np.full(len(k), i, dtype=np.int64) for i, k in enumerate(keys)])
+    row = np.concatenate([np.arange(len(k)) for k in keys])
+    unique, first, inverse = np.unique(np.concatenate(keys), return_index=True, return_inverse=True)
+    member = np.zeros((len(unique), len(tables)), dtype=bool)
+    member[inverse.ravel(), annotator] = True
+    disagree = ~member.all(axis=1)
+
+    # Take the values of each annotation from the first annotator that has it
+    first, member = first[disagree], member[disagree]
+    parts = []
+    for i, table in enumerate(tables):
+        mine = annotator[first] == i
+        frame = table.take(row[first[mine]]).to_frame()
+        frame['_start'] = table.start[row[first[mine]]]
+        frame.index = np.flatnonzero(mine)
+        parts.append(frame)
+    report = pd.concat(parts).sort_index() if parts else pd.DataFrame(columns=KEY_COLUMNS + ['_start'])
+    report = report[list(dict.fromkeys(columns + ['filename', '_start']))].reset_index(drop=True)
+    for i, name in enumerate(names):
+        report[name] = member[:, i].astype(int)
+    names = np.array(names, dtype=object)
+    report['has'] = [', '.join(names[m]) for m in member]
+    report['lacks'] = [', '.join(names[~m]) for m in member]
+    report = report.sort_values(by=['filename', '_start'], kind='stable').drop(columns='_start')
+    if 'filename' not in columns:
+        report = report.drop(columns='filename')
+    return report.reset_index(drop=True)
+
+
+def write_disagreements(corpus_list, rel_labels, output, columns=None, chunksize=100000):
+    """
+    Write the disagreements between annotators (see disagreements) as a tsv file.
+    :param output: path or open (text) file object, e.g. sys.stdout
+    :param chunksize: rows formatted at a time, so big reports are written progressively
+    """
+    report = disagreements(corpus_list, rel_labels, columns=columns)
+    if isinstance(output, str):
+        with open(output, 'w', encoding='utf-8', newline='') as f_out:
+            _write_tsv_chunks(report, f_out, chunksize)
+    else:
+        _write_tsv_chunks(report, output, chunksize)
+
+
+def _write_tsv_chunks(frame, f_out, chunksize):
+    frame.iloc[:0].to_csv(f_out, sep='\t', header=True, index=False)
+    for start in range(0, len(frame), chunksize):
+        frame.iloc[start:start + chunksize].to_csv(f_out, sep='\t', header=False, index=False)
+
+
 # These are all helper functions
 def output_annotation_tables(list_df, outpaths):
     '''
@@ -286,111 +931,22 @@ def computations(list_df, relevant_colnames, annotator_names, by_label=False):
         Keys: label
         Values: tuple (iaa_all_vs_all, iaa_pairwise)
     '''
-    # Get labels
-    labels = []
-    for df in list_df:
-        labels = labels + df.label.to_list()
-    count_labels = Counter(labels)
-    labels = set(count_labels.keys())
-
-    # Extract info from dataframe
-    codes, _ = get_codes(list_df, relevant_colnames, labels)
+    # Encode each annotation once: rows with the same relevant values (in any dataframe) get the same integer key
+    rows = pd.concat(list_df, ignore_index=True)
+    keys = rows.groupby(relevant_colnames, sort=False, dropna=False).ngroup().to_numpy() if len(rows) else \
+        np.zeros(0, dtype=np.int64)
+    label_codes, labels = pd.factorize(rows['label'])
+    splits = np.cumsum([len(df) for df in list_df])[:-1]
 
-    # Compute IAA
-    iaa_all_vs_all, iaa_pairwise = compute_iaa(codes, annotator_names)
+    # Compute IAA (all vs all, pairwise and per label at once)
+    result = _iaa_from_codes(annotator_names, np.split(keys, splits), np.split(label_codes, splits), list(labels))
+    iaa_all_vs_all, iaa_pairwise, iaa_by_label, count_labels = result.to_dicts()
 
     if by_label == False:
         return iaa_all_vs_all, iaa_pairwise
-
-    # In case we want to compute IAA per each label
-    iaa_by_label = {}
-    for label in labels:
-        # Extract info from dataframe
-        codes, _ = get_codes(list_df, relevant_colnames, [label])
-        # Compute IAA
-        iaa_all_vs_all_l, iaa_pairwise_l = compute_iaa(codes, annotator_names)
-
-        iaa_by_label[label] = (iaa_all_vs_all_l, iaa_pairwise_l)
     return iaa_all_vs_all, iaa_pairwise, iaa_by_label, count_labels
 
 
-def get_codes(list_df, relevant_colnames, rel_labels):
-    '''
-    Extract "codes" from dataframe.
-
-    Parameters
-    ----------
-    list_df : list
-        Contains one pandas dataframe per annotator.
-    relevant_colnames : list
-        List of relevant column names to compute IAA.
-    rel_labels : list
-        List of relevant values of the "label" column of dataframe.
-
-    Returns
-    -------
-    codes : list
-        Contains sets of codes for each dataframe.
-    annotator_names : list
-        Contains names of annotators.
-
-    '''
-    codes = []
-    annotator_names = []
-    for df in list_df:
-        if df.shape[0] == 0:
-            codes.append(set())
-            annotator_names.append('empty')
-            continue
-        codes.append(set(df[relevant_colnames].
-                         drop(df[df['label'].isin(rel_labels) == False].index).
-                         drop_duplicates(subset=relevant_colnames).
-                         agg('|'.join, axis=1).to_list()))
-        annotator_names.append(df.annotator.drop_duplicates().to_list()[0])
-
-    return codes, annotator_names
-
-
-def compute_iaa(codes, annotator_names):
-    '''
-    Compute IAA given the codes and annotator names
-
-    Parameters
-    ----------
-    codes : list
-        Contains sets of codes for each dataframe.
-    annotator_names : list
-        Contains names of annotators.
-
-    Returns
-    -------
-    iaa_all_vs_all: float
-        IAA (pairwise agreement: intersection / union)
-    iaa_pairwise: dict
-        Contains IAA annotator by annotator
-        Keys: annotators compared
-        Values; float IAA (pairwise agreement: intersection / union)
-
-    '''
-
-    if len(set.union(*codes)) == 0:
-        all_vs_all = 0
-    else:
-        all_vs_all = len(set.intersection(*codes)) / len(set.union(*codes))
-
-    pairwise = {}
-    for annotator1, annotations1 in zip(annotator_names, codes):
-        for annotator2, annotations2 in zip(annotator_names, codes):
-            comparison = (annotator1, annotator2)
-            if len(annotations1.union(annotations2)) == 0:
-                pairwise[comparison] = 0
-                continue
-            pairwise[comparison] = (len(annotations1.intersection(annotations2)) /
-                                    len(annotations1.union(annotations2)))
-
-    return all_vs_all, pairwise
-
-
 def print_iaa_annotators(annotator_names, iaa_pairwise):
     '''
     Print IAA pairwise in a pretty way
@@ -16,12 +16,21 @@ import os
 
 from ast import literal_eval
 
+# Versioned binary format (see store.py), an alternative to pickle for big corpora
+from .store import save_corpus_store, load_corpus_store, CorpusStore
+# Reading and writing brat files in .zip/.tar(.gz) archives (see archive.py)
+from .archive import ArchiveWriter, iter_archive_documents, load_archive_document
+
 
 # BRAT .ANN FILES FUNCTIONS
 def write_ann_file(doc, output_path):
     """
     Create new .ann file in output_path with annotations in doc.
+    output_path can also be an archive.ArchiveWriter, to write many files into a single .zip or .tar(.gz) archive.
     """
+    if isinstance(output_path, ArchiveWriter):
+        output_path.write('{}.ann'.format(doc.name), ''.join(str(ann) + '\n' for k in doc.anns for ann in doc.anns[k]))
+        return
     with open('{}/{}.ann'.format(output_path, doc.name), 'w') as f_out:
         for k in doc.anns:
             for ann in doc.anns[k]:
@@ -124,8 +133,11 @@ def add_default_attribute(corpus, attribute_tuple, output_path):
 def write_txt_file(doc, output_path):
     """
     Create new .txt file using txt attribute from doc
+    output_path can also be an archive.ArchiveWriter (see write_ann_file).
     """
-    if doc.txt:
+    if doc.txt and isinstance(output_path, ArchiveWriter):
+        output_path.write('{}.txt'.format(doc.name), ''.join(sent + '\n' if sent != '\n' else '\n' for sent in doc.txt))
+    elif doc.txt:
         with open('{}/{}.txt'.format(output_path, doc.name), 'w') as f_out:
             for sent in doc.txt:
                 if sent != '\n':
@@ -156,7 +168,7 @@ def write_json_from_doc(doc, output_path, txt=False):
 
     if txt:
         if doc.txt:
-            json_dict["text"] = '\n'.join([sent for sent in doc.txt])
+            json_dict["text"] = doc.text
         else:
             print('AnnDoc object does not have an associated text')
 
@@ -185,7 +197,7 @@ def write_json_from_corpus(corpus, output_path, txt=False):
 
         if txt:
             if doc.txt:
-                doc_dict["text"] = '\n'.join([sent for sent in doc.txt])
+                doc_dict["text"] = doc.text
             else:
                 print('AnnDoc object does not have an associated text')
 
@@ -386,6 +398,7 @@ def save_corpus(corpus, output_path: str):
 def load_corpus(input_path):
     """
     Loads pickled AnnCorpora.
+    For big corpora, save_corpus_store/load_corpus_store are faster, smaller and can load only some documents.
     """
     with open(input_path, 'rb') as f_in:
         return pickle.load(f_in)
@@ -410,7 +423,7 @@ def brat2spacy(AnnCorpus, nlp):
         Doc.set_extension("filename", default=None)
 
     # Create text, filename tuples
-    text_tuples = [('\n'.join(doc.txt), {"filename": doc.name}) for doc in AnnCorpus.docs]
+    text_tuples = [(doc.text, {"filename": doc.name}) for doc in AnnCorpus.docs]
     doc_tuples = nlp.pipe(text_tuples, as_tuples=True)
 
     # Iterate through docs to assign filenames and entities
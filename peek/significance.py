@@ -0,0 +1,269 @@
+"""
+Confidence intervals and significance tests for F-score, by resampling documents.
+
+Per-document true positives, false positives and false negatives are counted once (with the same matching as
+metrics.fscore) into NumPy arrays, so every resample is just a weighted sum of those counts:
+    - bootstrap: documents are drawn with replacement and micro-averaged scores are recomputed for every sample,
+      giving percentile confidence intervals
+    - randomization_test: approximate randomisation between two systems, swapping their outputs for random
+      documents and counting how often the difference in scores is at least as big as the observed one
+
+Samples are drawn in fixed-size chunks, each one with its own seed derived from the given seed, so results are the
+same whatever the number of workers.
+
+EXAMPLE USE:
+    result = peek.significance.bootstrap(gs, pred, gs.text_labels, n_samples=1000, seed=42)
+    print(result.intervals['f1'])
+    test = peek.significance.randomization_test(gs, pred_a, pred_b, gs.text_labels, seed=42, workers=4)
+    print(test.difference['f1'], test.p_value['f1'])
+"""
+from . import metrics
+from .table import encode_keys, shared_codes
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+SCORES = ['precision', 'recall', 'f1']
+# Samples drawn at once by every task (also bounded by the number of documents, see _chunks)
+CHUNK_SIZE = 1000
+
+
+def document_counts(gs, pred_list, rel_labels):
+    """
+    Per-document true positives, false positives and false negatives of one or more systems against a Gold Standard.
+    Same matching as metrics.fscore (filename, label and text, duplicates not counted).
+    :param gs: Gold Standard as AnnCorpus (or AnnTable) object.
+    :param pred_list: list of predictions as AnnCorpus (or AnnTable) objects.
+    :param rel_labels: list of labels to consider.
+    :return: tuple (list of document names, int64 array with shape (systems, documents, 3) with tp, fp and fn).
+             Documents are the Gold Standard's (with or without annotations) followed by documents that are only in
+             the predictions.
+    """
+    tables = [metrics.get_table(t).select(rel_labels) for t in [gs] + list(pred_list)]
+    keys = encode_keys(tables, ['filename', 'label', 'offset'])
+    doc_codes, doc_names = shared_codes(tables, 'filename')
+    n_docs = len(doc_names)
+
+    gs_key, gs_rows = np.unique(keys[0], return_index=True)
+    gs_doc = doc_codes[0][gs_rows]
+    gs_pos = np.bincount(gs_doc, minlength=n_docs)
+    counts = np.zeros((len(tables) - 1, n_docs, 3), dtype=np.int64)
+    for i, (key, doc) in enumerate(zip(keys[1:], doc_codes[1:])):
+        key, rows = np.unique(key, return_index=True)
+        tp = np.bincount(gs_doc[np.isin(gs_key, key, assume_unique=True)], minlength=n_docs)
+        counts[i, :, 0] = tp
+        counts[i, :, 1] = np.bincount(doc[rows], minlength=n_docs) - tp
+        counts[i, :, 2] = gs_pos - tp
+    return doc_names, counts
+
+
+def micro_scores(sums):
+    """
+    Micro-averaged precision, recall and F1 from summed counts (0 where they are not defined, as in metrics.fscore).
+    :param sums: array with shape (..., 3) with tp, fp and fn
+    :return: float array with shape (..., 3) with precision, recall and f1
+    """
+    sums = np.asarray(sums, dtype=float)
+    tp, fp, fn = sums[..., 0], sums[..., 1], sums[..., 2]
+    scores = np.zeros(sums.shape)
+    np.divide(tp, tp + fp, out=scores[..., 0], where=(tp + fp) > 0)
+    np.divide(tp, tp + fn, out=scores[..., 1], where=(tp + fn) > 0)
+    # Same as the harmonic mean of precision and recall
+    np.divide(2 * tp, 2 * tp + fp + fn, out=scores[..., 2], where=tp > 0)
+    return scores
+
+
+class BootstrapResult:
+    """
+    Scores returned by bootstrap (one system) or one system of bootstrap_counts.
+    estimate: dict {score: value on the whole corpus}
+    intervals: dict {score: (low, high)}, percentile confidence intervals
+    samples: float array with shape (n_samples, 3) with the precision, recall and f1 of every sample
+    """
+
+    def __init__(self, estimate, samples, confidence):
+        self.estimate = dict(zip(SCORES, estimate.tolist()))
+        self.samples = samples
+        self.confidence = confidence
+        alpha = (1 - confidence) / 2
+        low, high = np.quantile(samples, [alpha, 1 - alpha], axis=0)
+        self.intervals = {score: (float(low[i]), float(high[i])) for i, score in enumerate(SCORES)}
+        self.std = dict(zip(SCORES, samples.std(axis=0, ddof=1).tolist())) if len(samples) > 1 else {}
+
+    def __repr__(self):
+        low, high = self.intervals['f1']
+        return '<BootstrapResult: F1={} [{}, {}] ({:.0%})>'.format(round(self.estimate['f1'], 3), round(low, 3),
+                                                                  round(high, 3), self.confidence)
+
+
+class RandomizationResult:
+    """
+    Scores returned by randomization_test.
+    difference: dict {score: score of system a - score of system b}
+    p_value: dict {score: two-sided p-value}, (r + 1) / (n_samples + 1) where r is the number of samples with an
+             absolute difference at least as big as the observed one
+    """
+
+    def __init__(self, scores_a, scores_b, n_extreme, n_samples):
+        self.scores_a = dict(zip(SCORES, scores_a.tolist()))
+        self.scores_b = dict(zip(SCORES, scores_b.tolist()))
+        self.difference = dict(zip(SCORES, (scores_a - scores_b).tolist()))
+        self.n_samples = n_samples
+        self.p_value = dict(zip(SCORES, ((n_extreme + 1) / (n_samples + 1)).tolist()))
+
+    def __repr__(self):
+        return '<RandomizationResult: F1 difference={} p={}>'.format(round(self.difference['f1'], 3),
+                                                                    round(self.p_value['f1'], 4))
+
+
+def _chunks(n_samples, n_docs, seed):
+    # (size, seed) of every chunk of samples, independent of the number of workers
+    size = max(1, min(CHUNK_SIZE, 2 ** 24 // max(n_docs, 1)))
+    sizes = [size] * (n_samples // size) + ([n_samples % size] if n_samples % size else [])
+    return list(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))))
+
+
+def _run(fn, chunks, workers=None, executor=None):
+    # Map fn over the chunks (sequentially, with an executor or a new process pool) keeping their order
+    if not workers and executor is None:
+        return list(map(fn, chunks))
+    elif executor is not None:
+        return list(executor.map(fn, chunks))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(fn, chunks))
+
+
+def _bootstrap_chunk(counts, chunk):
+    # Summed counts of every system for each sample: shape (size, systems, 3)
+    size, seed = chunk
+    rng = np.random.default_rng(seed)
+    n_docs = counts.shape[1]
+    # How many times every document is drawn in each sample
+    weights = rng.multinomial(n_docs, np.full(n_docs, 1 / n_docs), size=size)
+    return np.tensordot(weights, counts, axes=(1, 1))
+
+
+def _randomization_chunk(counts_a, counts_b, chunk):
+    # Number of samples with a difference at least as big as the observed one, for each score
+    size, seed = chunk
+    rng = np.random.default_rng(seed)
+    observed = np.abs(micro_scores(counts_a.sum(axis=0)) - micro_scores(counts_b.sum(axis=0)))
+    swap = (rng.random((size, counts_a.shape[0])) < 0.5).astype(float)
+    moved = swap @ (counts_b - counts_a)
+    difference = np.abs(micro_scores(counts_a.sum(axis=0) + moved) - micro_scores(counts_b.sum(axis=0) - moved))
+    # Tolerance so that samples equal to the observed difference are not lost to rounding
+    return (difference >= observed - 1e-12).sum(axis=0)
+
+
+def bootstrap_counts(counts, n_samples=1000, confidence=0.95, seed=None, workers=None, executor=None):
+    """
+    Bootstrap from precomputed per-document counts (see document_counts). The same resampled documents are used for
+    every system, so their intervals can be compared.
+    :param counts: int array with shape (documents, 3) or (systems, documents, 3) with tp, fp and fn
+    :param n_samples: number of bootstrap samples
+    :param confidence: confidence level of the intervals
+    :param seed: seed for reproducible samples (any value accepted by numpy.random.SeedSequence)
+    :param workers: number of processes used to draw samples (sequential by default)
+    :param executor: any concurrent.futures.Executor to use instead of creating a process pool
+    :return: BootstrapResult, or a list with one per system if counts has three dimensions
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    single = counts.ndim == 2
+    counts = counts[None] if single else counts
+    chunks = _chunks(n_samples, counts.shape[1], seed)
+    sums = np.concatenate(_run(partial(_bootstrap_chunk, counts), chunks, workers, executor))
+    samples = micro_scores(sums)
+    estimates = micro_scores(counts.sum(axis=1))
+    results = [BootstrapResult(estimates[i], samples[:, i], confidence) for i in range(counts.shape[0])]
+    return results[0] if single else results
+
+
+def randomization_counts(counts_a, counts_b, n_samples=10000, seed=None, workers=None, executor=None):
+    """
+    Approximate randomisation test from precomputed per-document counts of two systems (see document_counts).
+    :param counts_a: int array with shape (documents, 3) with tp, fp and fn of the first system
+    :param counts_b: same for the second system, aligned with counts_a
+    :param n_samples: number of random swaps
+    :param seed: seed for reproducible samples (any value accepted by numpy.random.SeedSequence)
+    :param workers: number of processes used to draw samples (sequential by default)
+    :param executor: any concurrent.futures.Executor to use instead of creating a process pool
+    :return: RandomizationResult
+    """
+    counts_a = np.asarray(counts_a, dtype=np.int64)
+    counts_b = np.asarray(counts_b, dtype=np.int64)
+    if counts_a.shape != counts_b.shape:
+        raise ValueError('Counts of both systems must be aligned by document')
+    chunks = _chunks(n_samples, counts_a.shape[0], seed)
+    n_extreme = sum(_run(partial(_randomization_chunk, counts_a, counts_b), chunks, workers, executor))
+    return RandomizationResult(micro_scores(counts_a.sum(axis=0)), micro_scores(counts_b.sum(axis=0)),
+                               n_extreme, n_samples)
+
+
+def bootstrap(gs, pred, rel_labels, n_samples=1000, confidence=0.95, seed=None, workers=None, executor=None):
+    """
+    Bootstrap confidence intervals of micro-averaged precision, recall and F-score, resampling documents.
+    :param gs: Gold Standard as AnnCorpus (or AnnTable) object.
+    :param pred: Predictions as AnnCorpus (or AnnTable) object.
+    :param rel_labels: list of labels to consider.
+    See bootstrap_counts for the other parameters.
+    :return: BootstrapResult
+
+    EXAMPLE USE:
+    result = peek.significance.bootstrap(gs, pred, gs.text_labels, seed=42)
+    low, high = result.intervals['f1']
+    """
+    _, counts = document_counts(gs, [pred], rel_labels)
+    return bootstrap_counts(counts[0], n_samples=n_samples, confidence=confidence, seed=seed, workers=workers,
+                            executor=executor)
+
+
+def randomization_test(gs, pred_a, pred_b, rel_labels, n_samples=10000, seed=None, workers=None, executor=None):
+    """
+    Paired approximate randomisation test between two systems evaluated on the same Gold Standard: is the difference
+    in precision, recall and F-score bigger than what swapping their outputs document by document gives?
+    :param gs: Gold Standard as AnnCorpus (or AnnTable) object.
+    :param pred_a: Predictions of the first system as AnnCorpus (or AnnTable) object.
+    :param pred_b: Predictions of the second system.
+    :param rel_labels: list of labels to consider.
+    See randomization_counts for the other parameters.
+    :return: RandomizationResult
+
+    EXAMPLE USE:
+    test = peek.significance.randomization_test(gs, pred_a, pred_b, gs.text_labels, seed=42)
+    print(test.p_value['f1'])
+    """
+    _, counts = document_counts(gs, [pred_a, pred_b], rel_labels)
+    return randomization_counts(counts[0], counts[1], n_samples=n_samples, seed=seed, workers=workers,
+                                executor=executor)
+
+
+def compare_systems(gs, pred_list, rel_labels, baseline=0, n_bootstrap=1000, n_randomization=10000, confidence=0.95,
+                    seed=None, workers=None, executor=None):
+    """
+    Scores of several systems against the same Gold Standard, with F-score confidence intervals and the p-value of
+    the F-score difference with a baseline system. Per-document counts are computed once for all systems.
+    :param gs: Gold Standard as AnnCorpus (or AnnTable) object.
+    :param pred_list: list of predictions as AnnCorpus (or AnnTable) objects.
+    :param rel_labels: list of labels to consider.
+    :param baseline: index in pred_list of the system the others are tested against
+    See bootstrap_counts and randomization_counts for the other parameters.
+    :return: DataFrame indexed by system name with columns precision, recall, f1, f1_low, f1_high and p_value
+    """
+    pred_list = list(pred_list)
+    _, counts = document_counts(gs, pred_list, rel_labels)
+    names = [metrics.get_table(pred).name for pred in pred_list]
+    intervals = bootstrap_counts(counts, n_samples=n_bootstrap, confidence=confidence, seed=seed, workers=workers,
+                                 executor=executor)
+    rows = []
+    for i, result in enumerate(intervals):
+        p_value = np.nan
+        if i != baseline:
+            p_value = randomization_counts(counts[i], counts[baseline], n_samples=n_randomization, seed=seed,
+                                           workers=workers, executor=executor).p_value['f1']
+        rows.append([result.estimate['precision'], result.estimate['recall'], result.estimate['f1'],
+                     result.intervals['f1'][0], result.intervals['f1'][1], p_value])
+    return pd.DataFrame(rows, index=pd.Index(names, name='system'),
+                        columns=['precision', 'recall', 'f1', 'f1_low', 'f1_high', 'p_value'])
@@ -2,6 +2,7 @@
 Visualization and stats reporting.
 '''
 from . import ann_structure
+from .table import AnnTable
 
 import csv
 import os
@@ -90,21 +91,35 @@ def generate_corpus_stats_tsv(ann_corpus, out_path, collections=False, include_t
 
 
 def create_stats_row(ann_corpus, columns, include_txt=False):
+    """
+    Fill in a row of generate_corpus_stats_tsv.
+    Entity counts come from the corpus' columnar table (AnnCorpus.to_table), which can also be given directly
+    instead of the corpus when include_txt is False.
+    """
+    if isinstance(ann_corpus, AnnTable):
+        table = ann_corpus
+        if include_txt:
+            raise ValueError('Text statistics need an AnnCorpus loaded with txt=True')
+    else:
+        table = ann_corpus.to_table()
+    text_labels = sorted(table.labels)
     # Create accumulator to count entities
     accum = defaultdict(list)
-    # Get statistics for each document
-    for doc in ann_corpus.docs:
-        if include_txt:
+    # Get text statistics for each document
+    if include_txt:
+        for doc in ann_corpus.iter_docs():
             # TODO: Not too reliable, use actual tokenizer
             accum['sents'].append(len([sent.split('.') for sent in doc.txt]))
             accum['tokens'].append(len([sent.split(' ') for sent in doc.txt]))
-        for label in ann_corpus.text_labels:
-            accum[label].append(doc.count['entities'][label] if doc.count['entities'][label] else 0)
-        accum['entities'].append(len(doc.anns['entities']))
+    # Entities per document and label
+    histogram = table.doc_label_histogram()
+    n_docs = len(table.doc_names)
+    label_totals = dict(zip(table.labels, histogram.sum(axis=0).tolist()))
+    total_entities = int(histogram.sum())
 
     # Fill in columns dictionary
     columns['corpus'] = ann_corpus.name
-    columns['docs'] = len(ann_corpus.docs)
+    columns['docs'] = n_docs
     # Get total and average of sentences and tokens
     if include_txt:
         columns['total_sents'] = sum(accum['sents'])
@@ -112,13 +127,13 @@ def create_stats_row(ann_corpus, columns, include_txt=False):
         columns['total_tokens'] = sum(accum['tokens'])
         columns['avg_tokens'] = round(sum(accum['tokens']) / len(accum['tokens']), 2)
     # Get total numbers for labels
-    columns['total_entities'] = sum(accum['entities'])
-    for label in ann_corpus.text_labels:
-        columns['total_{}'.format(label)] = sum(accum[label])
+    columns['total_entities'] = total_entities
+    for label in text_labels:
+        columns['total_{}'.format(label)] = label_totals[label]
     # Get average numbers for labels
-    columns['avg_entities'] = round(sum(accum['entities']) / len(accum['entities']), 2)
-    for label in ann_corpus.text_labels:
-        columns['avg_{}'.format(label)] = round(sum(accum[label]) / len(accum[label]), 2)
+    columns['avg_entities'] = round(total_entities / n_docs, 2)
+    for label in text_labels:
+        columns['avg_{}'.format(label)] = round(label_totals[label] / n_docs, 2)
 
     return columns
 
@@ -0,0 +1,252 @@
+"""
+Versioned binary format to store corpora (an alternative to pickling AnnCorpus objects).
+
+A stored corpus is a single file with:
+    - a small header: magic bytes, format version and a JSON description of the arrays in the file
+    - columnar entity arrays (IDs, labels, texts and offsets) with per-document row offsets
+    - the rest of the annotation lines (relations, events, attributes, notes) with per-document offsets
+    - a string table shared by all of the above (and by the document texts, if saved)
+
+Arrays are aligned so that the file can be memory-mapped, which means a corpus can be opened instantly and only the
+documents that are actually requested are built (see CorpusStore).
+"""
+from . import ann_structure
+from .table import AnnTable
+
+import json
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b'PEEKCORP'
+VERSION = 1
+_ALIGN = 64
+_PREAMBLE = struct.Struct('<8sIQ')  # magic, version, header length
+
+
+def _aligned(n):
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def save_corpus_store(corpus, output_path, txt=False):
+    """
+    Store an AnnCorpus in output_path/<corpus name>.peek.
+    :param corpus: AnnCorpus
+    :param output_path: str, folder where the file will be written
+    :param txt: whether to also store the documents' text (corpus must have been loaded with txt=True)
+    :return: path of the stored file
+    """
+    strings = {}
+
+    def sid(string):
+        return strings.setdefault(string, len(strings))
+
+    doc_name, doc_path, doc_collection, doc_text = [], [], [], []
+    ent_offsets, line_offsets = [0], [0]
+    ent_name, ent_tag, ent_text, ent_spans = [], [], [], []
+    lines = []
+    for doc in corpus.iter_docs():
+        doc_name.append(sid(doc.name))
+        doc_path.append(sid(doc.path))
+        doc_collection.append(sid(doc.collection))
+        if txt and doc.txt:
+            # A final newline keeps empty last lines when the text is read back
+            doc_text.append(sid(doc.text + '\n'))
+        else:
+            doc_text.append(-1)
+        for ent in doc.anns['entities']:
+            ent_name.append(sid(ent.name))
+            ent_tag.append(sid(ent.tag))
+            ent_text.append(sid(ent.text))
+            if len(ent.span) == 2:
+                ent_spans.append((ent.span[0][0], ent.span[0][1], ent.span[1][0], ent.span[1][1]))
+            else:
+                ent_spans.append((ent.span[0][0], ent.span[0][1], -1, -1))
+        ent_offsets.append(len(ent_name))
+        for k in ['relations', 'events', 'attributes', 'notes']:
+            lines.extend(sid(str(ann)) for ann in doc.anns[k])
+        line_offsets.append(len(lines))
+
+    encoded = [string.encode('utf-8') for string in strings]
+    str_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=str_offsets[1:])
+
+    arrays = {
+        'doc_name': np.array(doc_name, dtype=np.int32),
+        'doc_path': np.array(doc_path, dtype=np.int32),
+        'doc_collection': np.array(doc_collection, dtype=np.int32),
+        'doc_text': np.array(doc_text, dtype=np.int32),
+        'ent_offsets': np.array(ent_offsets, dtype=np.int64),
+        'ent_name': np.array(ent_name, dtype=np.int32),
+        'ent_tag': np.array(ent_tag, dtype=np.int32),
+        'ent_text': np.array(ent_text, dtype=np.int32),
+        'ent_spans': np.array(ent_spans, dtype=np.int64).reshape(-1, 4),
+        'line_offsets': np.array(line_offsets, dtype=np.int64),
+        'lines': np.array(lines, dtype=np.int32),
+        'str_offsets': str_offsets,
+        'str_data': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+    }
+
+    # Describe where each array is, relative to the start of the data section
+    described = {}
+    offset = 0
+    for k, array in arrays.items():
+        described[k] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _aligned(offset + array.nbytes)
+    header = json.dumps({'version': VERSION, 'name': corpus.name, 'path': corpus.path,
+                         'collections': sorted(corpus.collections), 'txt': bool(txt),
+                         'arrays': described}).encode('utf-8')
+
+    out_file = os.path.join(output_path, corpus.name + '.peek')
+    with open(out_file, 'wb') as f_out:
+        f_out.write(_PREAMBLE.pack(MAGIC, VERSION, len(header)))
+        f_out.write(header)
+        data_start = _aligned(_PREAMBLE.size + len(header))
+        f_out.write(b'\0' * (data_start - _PREAMBLE.size - len(header)))
+        for k, array in arrays.items():
+            f_out.write(b'\0' * (data_start + described[k]['offset'] - f_out.tell()))
+            f_out.write(np.ascontiguousarray(array).tobytes())
+
+    print('Corpus stored at {}'.format(out_file))
+    return out_file
+
+
+class CorpusStore:
+    """
+    Corpus stored with save_corpus_store.
+    Opening it only reads the header and the document names, documents are built when requested.
+    With mmap=True arrays are memory-mapped, so only the parts of the file that are used are read from disk.
+    """
+
+    def __init__(self, path, mmap=True):
+        self.path = path
+        with open(path, 'rb') as f_in:
+            magic, version, header_len = _PREAMBLE.unpack(f_in.read(_PREAMBLE.size))
+            if magic != MAGIC:
+                raise ValueError('{} is not a stored corpus'.format(path))
+            if version > VERSION:
+                raise ValueError('{} was stored with format version {}, but this version of brat-peek can only read '
+                                 'up to version {}. Please update brat-peek.'.format(path, version, VERSION))
+            header = json.loads(f_in.read(header_len).decode('utf-8'))
+        self.version = version
+        self.header = header
+        self.name = header['name']
+
+        if mmap:
+            buffer = np.memmap(path, dtype=np.uint8, mode='r')
+        else:
+            buffer = np.fromfile(path, dtype=np.uint8)
+        data_start = _aligned(_PREAMBLE.size + header_len)
+        self.arrays = {}
+        for k, desc in header['arrays'].items():
+            dtype = np.dtype(desc['dtype'])
+            start = data_start + desc['offset']
+            n_bytes = int(np.prod(desc['shape'])) * dtype.itemsize
+            self.arrays[k] = buffer[start:start + n_bytes].view(dtype).reshape(desc['shape'])
+
+        self._strings = {}
+        self.doc_names = [self.string(i) for i in self.arrays['doc_name']]
+        self.doc_collections = [self.string(i) for i in self.arrays['doc_collection']]
+
+    def __len__(self):
+        return len(self.doc_names)
+
+    def __repr__(self):
+        return '<CorpusStore {}: {} documents, version {}>'.format(self.name, len(self), self.version)
+
+    def string(self, i):
+        """
+        Decode string i of the string table (decoded strings are cached).
+        """
+        i = int(i)
+        string = self._strings.get(i)
+        if string is None:
+            offsets = self.arrays['str_offsets']
+            string = bytes(self.arrays['str_data'][offsets[i]:offsets[i + 1]]).decode('utf-8')
+            self._strings[i] = string
+        return string
+
+    def select(self, names=None, collections=None):
+        """
+        Positions of the documents with the given names and/or in the given collections (all of them by default).
+        """
+        names = set(names) if names is not None else None
+        collections = set(collections) if collections is not None else None
+        return [i for i, (name, coll) in enumerate(zip(self.doc_names, self.doc_collections))
+                if (names is None or name in names) and (collections is None or coll in collections)]
+
+    def load_doc(self, i, txt=True):
+        """
+        Build the AnnDocument stored in position i.
+        :param txt: whether to attach the document's text (if it was stored)
+        """
+        a = self.arrays
+        anns = {'entities': [], 'relations': [], 'events': [], 'attributes': [], 'notes': []}
+        first, last = a['ent_offsets'][i], a['ent_offsets'][i + 1]
+        for name, tag, text, span in zip(a['ent_name'][first:last], a['ent_tag'][first:last],
+                                         a['ent_text'][first:last], a['ent_spans'][first:last].tolist()):
+            span = ((span[0], span[1]), (span[2], span[3])) if span[2] >= 0 else ((span[0], span[1]),)
+            anns['entities'].append(ann_structure.Entity(name=self.string(name), tag=self.string(tag), span=span,
+                                                         text=self.string(text)))
+        for line in a['lines'][a['line_offsets'][i]:a['line_offsets'][i + 1]]:
+            ann = ann_structure.AnnDocument._parse_line(self.string(line))
+            for k, cls in [('relations', ann_structure.Relation), ('events', ann_structure.Event),
+                           ('attributes', ann_structure.Attribute), ('notes', ann_structure.Note)]:
+                if isinstance(ann, cls):
+                    anns[k].append(ann)
+                    break
+        text = None
+        if txt and a['doc_text'][i] >= 0:
+            text = self.string(a['doc_text'][i])
+        return ann_structure.AnnDocument.from_annotations(self.string(a['doc_path'][i]), anns, txt=text,
+                                                          collection=self.doc_collections[i])
+
+    def to_corpus(self, names=None, collections=None, txt=True):
+        """
+        Build an AnnCorpus with the selected documents (all of them by default).
+        """
+        docs = [self.load_doc(i, txt=txt) for i in self.select(names, collections)]
+        corpus = ann_structure.AnnCorpus(path=self.header['path'], from_list=docs)
+        corpus.name = self.name
+        corpus.collections = set(doc.collection for doc in docs if doc.collection)
+        return corpus
+
+    def to_table(self, names=None, collections=None):
+        """
+        Build the corpus' AnnTable straight from the stored arrays, without creating any annotation objects.
+        """
+        a = self.arrays
+        positions = np.array(self.select(names, collections), dtype=np.int64)
+        offsets = a['ent_offsets']
+        counts = (offsets[positions + 1] - offsets[positions]) if len(positions) else np.zeros(0, dtype=np.int64)
+        rows = np.concatenate([np.arange(offsets[i], offsets[i + 1]) for i in positions]) if counts.sum() \
+            else np.zeros(0, dtype=np.int64)
+
+        def recode(column):
+            uniques, codes = np.unique(column[rows], return_inverse=True)
+            return [self.string(u) for u in uniques], codes.astype(np.int32)
+
+        labels, tag = recode(a['ent_tag'])
+        marks, mark = recode(a['ent_name'])
+        texts, text = recode(a['ent_text'])
+        spans = a['ent_spans'][rows]
+        return AnnTable(name=self.name, doc_names=[self.doc_names[i] for i in positions],
+                        doc_collections=[self.doc_collections[i] for i in positions],
+                        labels=labels, marks=marks, texts=texts,
+                        doc=np.repeat(np.arange(len(positions), dtype=np.int32), counts), tag=tag, mark=mark,
+                        text=text, start=spans[:, 0].copy(), end=spans[:, 1].copy(), start2=spans[:, 2].copy(),
+                        end2=spans[:, 3].copy())
+
+
+def load_corpus_store(path, names=None, collections=None, txt=True, mmap=True):
+    """
+    Load a corpus stored with save_corpus_store, optionally only some of its documents.
+    :param path: path to the .peek file
+    :param names: optional list of document names to load
+    :param collections: optional list of collections to load
+    :param txt: whether to attach the documents' text (if it was stored)
+    :param mmap: whether to memory-map the file instead of reading it whole
+    :return: AnnCorpus
+    """
+    return CorpusStore(path, mmap=mmap).to_corpus(names=names, collections=collections, txt=txt)
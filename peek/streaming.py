@@ -0,0 +1,276 @@
+"""
+F-score and IAA computed straight from folders, without loading whole corpora.
+
+.ann files are paired by their path inside each folder. Pairs are parsed in batches: every batch becomes a small
+AnnTable per folder, is tallied (see mapreduce.FScoreTally and mapreduce.IAATally) and thrown away, so only one batch
+of documents is in memory at a time (per worker) however big the corpora are. A document missing from a folder
+counts as a document without annotations in it. Documents are named by their path inside the folders, without the
+.ann extension (e.g. 'sub/doc1' in the 'filename' variable and in per-document results), so files with the same name
+in different subfolders are never mixed up, whatever the batch size.
+
+EXAMPLE USE:
+    tally = peek.streaming.stream_fscore('gold/', 'predictions/', ['Organism'], workers=4)
+    print(tally.results())
+    tally = peek.streaming.stream_iaa(['annotator1/', 'annotator2/'], ['filename', 'label', 'offset'], ['Organism'])
+    peek.metrics.print_iaa(tally.variables, tally.annotators, *tally.results())
+
+IAATracker keeps the agreement of every document, so that after an annotation round only the files that changed are
+parsed again:
+    tracker = peek.streaming.IAATracker(['annotator1/', 'annotator2/'], ['filename', 'label', 'offset'], ['Organism'])
+    tracker.update()
+    tracker.save('iaa_state.json')
+    # Next round
+    tracker = peek.streaming.IAATracker.load('iaa_state.json')
+    print(tracker.update())
+    tracker.show()
+"""
+from . import metrics
+from .ann_structure import AnnDocument, _fingerprint
+from .mapreduce import FScoreTally, IAATally
+from .table import AnnTable, encode_keys, shared_codes
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import glob
+import json
+import os
+
+import numpy as np
+
+
+def pair_files(directories):
+    """
+    Pair the .ann files of several folders by their path inside each folder.
+    :param directories: list of folder paths
+    :return: list of (relative path, [path in each folder or None if it is missing]) sorted by relative path
+    """
+    pairs = {}
+    for i, directory in enumerate(directories):
+        for f in glob.iglob(os.path.join(directory, '**/*.ann'), recursive=True):
+            pairs.setdefault(os.path.relpath(f, directory), [None] * len(directories))[i] = f
+    return sorted(pairs.items())
+
+
+def _names(directories):
+    # Same naming as AnnCorpus
+    return [os.path.split(directory.rstrip('/'))[-1] for directory in directories]
+
+
+def _doc_name(rel):
+    # Relative path without the .ann extension (the same name as in AnnCorpus for files at the top of the folder)
+    return rel[:-4]
+
+
+def _batch_tables(names, batch):
+    # One AnnTable per folder with the batch's documents (missing files are left out)
+    tables = []
+    for i, name in enumerate(names):
+        present = [(rel, paths[i]) for rel, paths in batch if paths[i] is not None]
+        table = AnnTable.from_documents(name, [AnnDocument(path) for _, path in present])
+        # Documents are named by their path inside the folders, which is unique (file names may not be)
+        table.doc_names = [_doc_name(rel) for rel, _ in present]
+        tables.append(table)
+    return tables
+
+
+def _fscore_batch(names, rel_labels, batch):
+    gs, pred = _batch_tables(names, batch)
+    return FScoreTally.from_tables(gs, pred, rel_labels)
+
+
+def _iaa_batch(names, rel_variables, rel_labels, batch):
+    tally = IAATally.from_tables(_batch_tables(names, batch), rel_variables, rel_labels)
+    # Annotators are named after the folders, even if a batch has no documents from one of them
+    tally.annotators = list(names)
+    return tally
+
+
+def _stream(fn, pairs, batch_size, workers=None, executor=None, reduce_fn=None):
+    # Tally every batch and merge the tallies as they come back (or pass them to reduce_fn)
+    reduce_fn = reduce_fn or _merge_all
+    batches = [pairs[i:i + batch_size] for i in range(0, len(pairs), batch_size)]
+    if not workers and executor is None:
+        tallies = map(fn, batches)
+    elif executor is not None:
+        tallies = executor.map(fn, batches)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return reduce_fn(pool.map(fn, batches))
+    return reduce_fn(tallies)
+
+
+def _merge_all(tallies):
+    total = None
+    for tally in tallies:
+        total = tally if total is None else total.merge(tally)
+    return total
+
+
+def stream_fscore(gs_dir, pred_dir, rel_labels, batch_size=500, workers=None, executor=None):
+    """
+    Counts behind show_fscore for a Gold Standard folder and a predictions folder.
+    :param gs_dir: Gold Standard folder
+    :param pred_dir: predictions folder
+    :param rel_labels: list of labels to consider for F-score
+    :param batch_size: number of document pairs parsed at once (per worker)
+    :param workers: number of processes used to parse and tally batches (sequential by default)
+    :param executor: any concurrent.futures.Executor to use instead of creating a process pool
+    :return: mapreduce.FScoreTally (results() gives the same values as show_fscore, per_doc() the per-document ones)
+    """
+    pairs = pair_files([gs_dir, pred_dir])
+    fn = partial(_fscore_batch, _names([gs_dir, pred_dir]), list(rel_labels))
+    return _stream(fn, pairs, batch_size, workers, executor) or FScoreTally()
+
+
+def stream_iaa(directories, rel_variables, rel_labels, batch_size=500, workers=None, executor=None):
+    """
+    Intersection and union sizes behind show_iaa for one folder per annotator.
+    :param directories: list of folders, one per annotator
+    :param rel_variables: relevant variables, as in show_iaa ('filename' must be one of them, so that batches can
+                          be added up)
+    :param rel_labels: list of labels to consider
+    See stream_fscore for the other parameters.
+    :return: mapreduce.IAATally (results() gives the same values as metrics.computations)
+    """
+    if 'filename' not in rel_variables:
+        raise ValueError("Streaming IAA needs 'filename' to be one of the relevant variables")
+    directories = list(directories)
+    names = _names(directories)
+    pairs = pair_files(directories)
+    fn = partial(_iaa_batch, names, list(rel_variables), list(rel_labels))
+    return _stream(fn, pairs, batch_size, workers, executor) or IAATally(names, rel_variables, rel_labels)
+
+
+def _document_tallies(names, rel_variables, rel_labels, batch):
+    """
+    Contribution of every document of a batch to the IAA sizes, computed in one pass with documents as groups.
+    :return: dict {relative path: IAATally}
+    """
+    tables = [t.select(rel_labels) for t in _batch_tables(names, batch)]
+    n = len(tables)
+    keys = encode_keys(tables, rel_variables)
+    doc_codes, doc_names = shared_codes(tables, 'filename')
+    label_codes, labels = shared_codes(tables, 'label')
+    n_docs, n_labels = len(doc_names), len(labels)
+    annotator = np.concatenate([np.full(len(k), i, dtype=np.int64) for i, k in enumerate(keys)])
+    key, doc, label = np.concatenate(keys), np.concatenate(doc_codes), np.concatenate(label_codes)
+    doc_label = doc * n_labels + label
+
+    all_i, all_u, pair_i, pair_u = metrics._agreement_counts(doc, key, annotator, n, n_docs)
+    label_i, label_u, label_pair_i, label_pair_u = metrics._agreement_counts(doc_label, key, annotator, n,
+                                                                              n_docs * n_labels)
+    label_counts = np.bincount(doc_label, minlength=n_docs * n_labels)
+    rels = {_doc_name(rel): rel for rel, _ in batch}
+    tallies = {}
+    for d, name in enumerate(doc_names):
+        tally = IAATally(names, rel_variables, rel_labels)
+        tally.all_vs_all = [int(all_i[d]), int(all_u[d])]
+        tally.pairwise = np.stack([pair_i[d], pair_u[d]], axis=-1)
+        # Only labels with annotations, as in metrics.iaa
+        for g in np.flatnonzero(label_counts[d * n_labels:(d + 1) * n_labels]) + d * n_labels:
+            label_name = labels[g % n_labels]
+            tally.by_label[label_name] = ([int(label_i[g]), int(label_u[g])],
+                                          np.stack([label_pair_i[g], label_pair_u[g]], axis=-1))
+            tally.count_labels[label_name] = int(label_counts[g])
+        tallies[rels[name]] = tally
+    return tallies
+
+
+class IAATracker:
+    """
+    IAA between annotator folders, kept up to date across annotation rounds.
+    The contribution of every document (intersection and union sizes for all annotators, every pair and every label)
+    is kept together with the fingerprints (size and modification time) of its .ann files. update only parses the
+    documents whose files were added, removed or modified and adjusts the totals, so results are the same as
+    computing show_iaa from scratch. The state can be saved as JSON and loaded in the next run.
+    Documents are identified by their path inside the folders ('filename' must be one of the relevant variables).
+    """
+
+    def __init__(self, directories, rel_variables, rel_labels):
+        if 'filename' not in rel_variables:
+            raise ValueError("IAA tracking needs 'filename' to be one of the relevant variables")
+        self.directories = list(directories)
+        self.annotators = _names(self.directories)
+        self.variables = list(rel_variables)
+        self.labels = list(rel_labels)
+        # {relative path: IAATally} and {relative path: [fingerprint of the file in each folder or None]}
+        self.docs = {}
+        self.fingerprints = {}
+        self.total = IAATally(self.annotators, self.variables, self.labels)
+
+    def __repr__(self):
+        return '<IAATracker: {} annotators, {} documents>'.format(len(self.annotators), len(self.docs))
+
+    def update(self, batch_size=500, workers=None, executor=None):
+        """
+        Look for changes in the folders and update the agreement of the documents that changed.
+        :param batch_size: number of documents parsed at once (per worker)
+        :param workers: number of processes used to parse and tally batches (sequential by default)
+        :param executor: any concurrent.futures.Executor to use instead of creating a process pool
+        :return: dict with the relative paths of the 'added', 'removed' and 'modified' documents
+        """
+        pairs, fingerprints = {}, {}
+        # Files are fingerprinted before parsing, so changes made meanwhile are found by the next update
+        for rel, paths in pair_files(self.directories):
+            found = [_fingerprint(path) if path is not None else None for path in paths]
+            # A file deleted since the folders were listed is missing for this round
+            paths = [path if fp is not None else None for path, fp in zip(paths, found)]
+            if any(path is not None for path in paths):
+                pairs[rel] = paths
+                fingerprints[rel] = [list(fp) if fp is not None else None for fp in found]
+        changes = {'added': sorted(rel for rel in pairs if rel not in self.docs),
+                   'removed': sorted(rel for rel in self.docs if rel not in pairs),
+                   'modified': sorted(rel for rel in pairs if rel in self.docs
+                                      and fingerprints[rel] != self.fingerprints[rel])}
+        for rel in changes['removed'] + changes['modified']:
+            self.total.subtract(self.docs.pop(rel))
+            del self.fingerprints[rel]
+
+        todo = sorted(changes['added'] + changes['modified'])
+        fn = partial(_document_tallies, self.annotators, self.variables, self.labels)
+        for tallies in _stream(fn, [(rel, pairs[rel]) for rel in todo], batch_size, workers, executor,
+                               reduce_fn=list) or []:
+            for rel, tally in tallies.items():
+                self.docs[rel] = tally
+                self.total.merge(tally)
+        # Documents without relevant annotations have no tally, but they are tracked too
+        for rel in todo:
+            self.docs.setdefault(rel, IAATally(self.annotators, self.variables, self.labels))
+            self.fingerprints[rel] = fingerprints[rel]
+        return changes
+
+    def results(self):
+        """
+        :return: tuple (iaa_all_vs_all, iaa_pairwise, iaa_by_label, count_labels), as metrics.computations
+        """
+        return self.total.results()
+
+    def show(self):
+        """
+        Print the agreement as show_iaa does.
+        """
+        metrics.print_iaa(self.variables, self.annotators, *self.results())
+
+    def save(self, path):
+        """
+        Save the tracker's state as JSON (see load).
+        """
+        state = {'directories': self.directories, 'variables': self.variables, 'labels': self.labels,
+                 'fingerprints': self.fingerprints, 'docs': {rel: t.to_dict() for rel, t in self.docs.items()}}
+        with open(path, 'w', encoding='utf-8') as f_out:
+            json.dump(state, f_out, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a tracker saved with save. Call update to catch up with the changes made since then.
+        """
+        with open(path, 'r', encoding='utf-8') as f_in:
+            state = json.load(f_in)
+        tracker = cls(state['directories'], state['variables'], state['labels'])
+        tracker.fingerprints = state['fingerprints']
+        for rel, d in state['docs'].items():
+            tracker.docs[rel] = IAATally.from_dict(d)
+            tracker.total.merge(tracker.docs[rel])
+        return tracker
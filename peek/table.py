@@ -0,0 +1,355 @@
+"""
+Columnar view of a corpus' text annotations for whole-corpus analytics.
+
+Each row is an entity. Documents, labels, entity IDs and texts are dictionary-encoded (integer codes pointing to a
+list of unique values) and offsets are stored in NumPy arrays, so counting, grouping and joining annotations are
+vectorised operations instead of loops over Entity objects.
+RelationTable does the same for relations and events, with their arguments resolved to entity spans.
+"""
+import numpy as np
+import pandas as pd
+
+# Variables that can be used to build annotation keys, named as in metrics.show_iaa.
+# Note that, as in metrics, 'offset' refers to the annotated text and 'span' to its character offsets.
+KEY_COLUMNS = ['annotator', 'filename', 'mark', 'label', 'offset', 'span']
+
+
+class AnnTable:
+    """
+    Columns (one value per entity):
+        doc: index of the document in doc_names (and doc_collections)
+        tag: index of the label in labels
+        mark: index of the entity ID (T1, T2, ...) in marks
+        text: index of the annotated text in texts
+        start, end: offsets of the first fragment
+        start2, end2: offsets of the second fragment of discontinuous entities (-1 otherwise)
+    """
+
+    def __init__(self, name, doc_names, doc_collections, labels, marks, texts, doc, tag, mark, text,
+                 start, end, start2, end2):
+        self.name = name
+        # Dictionaries
+        self.doc_names = doc_names
+        self.doc_collections = doc_collections
+        self.labels = labels
+        self.marks = marks
+        self.texts = texts
+        # Columns
+        self.doc = doc
+        self.tag = tag
+        self.mark = mark
+        self.text = text
+        self.start = start
+        self.end = end
+        self.start2 = start2
+        self.end2 = end2
+
+    def __len__(self):
+        return len(self.doc)
+
+    def __repr__(self):
+        return '<AnnTable {}: {} entities, {} documents, {} labels>'.format(self.name, len(self), len(self.doc_names),
+                                                                           len(self.labels))
+
+    @classmethod
+    def from_corpus(cls, corpus):
+        """
+        Build the table by going once through all of the corpus' entities.
+        :param corpus: AnnCorpus
+        :return: AnnTable
+        """
+        return cls.from_documents(corpus.name, corpus.iter_docs())
+
+    @classmethod
+    def from_documents(cls, name, documents):
+        """
+        Build the table from any iterable of AnnDocument (e.g. a batch of documents that are not in a corpus).
+        :param name: name of the table (e.g. annotator)
+        :param documents: iterable of AnnDocument
+        :return: AnnTable
+        """
+        doc_names, doc_collections = [], []
+        labels, marks, texts = {}, {}, {}
+        doc, tag, mark, text, spans = [], [], [], [], []
+        for i, ann_doc in enumerate(documents):
+            doc_names.append(ann_doc.name)
+            doc_collections.append(ann_doc.collection)
+            for ent in ann_doc.anns['entities']:
+                doc.append(i)
+                tag.append(labels.setdefault(ent.tag, len(labels)))
+                mark.append(marks.setdefault(ent.name, len(marks)))
+                text.append(texts.setdefault(ent.text, len(texts)))
+                if len(ent.span) == 2:
+                    spans.append((ent.span[0][0], ent.span[0][1], ent.span[1][0], ent.span[1][1]))
+                else:
+                    spans.append((ent.span[0][0], ent.span[0][1], -1, -1))
+
+        spans = np.array(spans, dtype=np.int64).reshape(-1, 4)
+        return cls(name=name, doc_names=doc_names, doc_collections=doc_collections,
+                   labels=list(labels), marks=list(marks), texts=list(texts),
+                   doc=np.array(doc, dtype=np.int32), tag=np.array(tag, dtype=np.int32),
+                   mark=np.array(mark, dtype=np.int32), text=np.array(text, dtype=np.int32),
+                   start=spans[:, 0].copy(), end=spans[:, 1].copy(), start2=spans[:, 2].copy(), end2=spans[:, 3].copy())
+
+    # Selection
+    def label_mask(self, labels):
+        """
+        Boolean mask of the rows whose label is in labels.
+        """
+        wanted = set(labels)
+        keep = np.array([label in wanted for label in self.labels], dtype=bool)
+        return keep[self.tag] if len(keep) else np.zeros(len(self), dtype=bool)
+
+    def take(self, rows):
+        """
+        New table with the selected rows (boolean mask or indices). Dictionaries are shared with this table.
+        """
+        return AnnTable(name=self.name, doc_names=self.doc_names, doc_collections=self.doc_collections,
+                        labels=self.labels, marks=self.marks, texts=self.texts,
+                        doc=self.doc[rows], tag=self.tag[rows], mark=self.mark[rows], text=self.text[rows],
+                        start=self.start[rows], end=self.end[rows], start2=self.start2[rows], end2=self.end2[rows])
+
+    def select(self, labels):
+        """
+        New table with only the given labels.
+        """
+        return self.take(self.label_mask(labels))
+
+    # Aggregates
+    def label_counts(self):
+        """
+        Number of entities per label.
+        :return: dict {label: count}
+        """
+        counts = np.bincount(self.tag, minlength=len(self.labels))
+        return {label: int(c) for label, c in zip(self.labels, counts)}
+
+    def doc_counts(self):
+        """
+        Number of entities in each document (documents without entities included).
+        :return: numpy array aligned with doc_names
+        """
+        return np.bincount(self.doc, minlength=len(self.doc_names))
+
+    def doc_label_histogram(self):
+        """
+        Number of entities per document and label.
+        :return: numpy array with shape (documents, labels), aligned with doc_names and labels
+        """
+        n_labels = len(self.labels)
+        flat = np.bincount(self.doc.astype(np.int64) * n_labels + self.tag,
+                           minlength=len(self.doc_names) * n_labels)
+        return flat.reshape(len(self.doc_names), n_labels)
+
+    # Conversion
+    def span_strings(self):
+        """
+        Offsets as space-separated strings, like in metrics ('0 5' or '0 5 8 12' for discontinuous entities).
+        """
+        spans = pd.Series(self.start).astype(str) + ' ' + pd.Series(self.end).astype(str)
+        discontinuous = self.start2 >= 0
+        if discontinuous.any():
+            extra = ' ' + pd.Series(self.start2).astype(str) + ' ' + pd.Series(self.end2).astype(str)
+            spans[discontinuous] = spans[discontinuous] + extra[discontinuous]
+        return spans
+
+    def to_frame(self, labels=None):
+        """
+        Pandas DataFrame with the columns used in metrics: annotator, filename, mark, label, offset (text) and span.
+        :param labels: optional list of labels to keep.
+        """
+        table = self.select(labels) if labels is not None else self
+        return pd.DataFrame({'annotator': [self.name] * len(table),
+                             'filename': np.array(self.doc_names, dtype=object)[table.doc],
+                             'mark': np.array(self.marks, dtype=object)[table.mark],
+                             'label': np.array(self.labels, dtype=object)[table.tag],
+                             'offset': np.array(self.texts, dtype=object)[table.text],
+                             'span': table.span_strings().to_numpy(dtype=object)},
+                            columns=KEY_COLUMNS)
+
+    def column_values(self, column):
+        """
+        Codes and dictionary of one of the KEY_COLUMNS.
+        :return: tuple (codes array, list of values) or (None, None) for 'span', which is not dictionary-encoded.
+        """
+        if column == 'annotator':
+            return np.zeros(len(self), dtype=np.int32), [self.name]
+        elif column == 'filename':
+            return self.doc, self.doc_names
+        elif column == 'mark':
+            return self.mark, self.marks
+        elif column == 'label':
+            return self.tag, self.labels
+        elif column == 'offset':
+            return self.text, self.texts
+        elif column == 'span':
+            return None, None
+        raise ValueError('Unknown column <{}>, possible values are: {}'.format(column, ', '.join(KEY_COLUMNS)))
+
+
+class RelationTable:
+    """
+    Columnar view of a corpus' relations or events, with their arguments resolved to entity spans, so that
+    annotations from different files can be compared whatever their IDs are (T12 in one file is the same argument as
+    T40 in another if both entities have the same span).
+    Columns (one value per relation or event):
+        doc: index of the document in doc_names
+        tag: index of the relation or event type in labels
+        args: tuple of (role, span) pairs, sorted, with the span of every argument (for events, the trigger is the
+              first argument, with an empty role). Arguments that are events are resolved to their trigger's span.
+        resolved: False if an argument points to an ID that is not in the document
+    """
+
+    def __init__(self, name, kind, doc_names, labels, doc, tag, args, resolved):
+        self.name = name
+        self.kind = kind
+        # Dictionaries
+        self.doc_names = doc_names
+        self.labels = labels
+        # Columns
+        self.doc = doc
+        self.tag = tag
+        self.args = args
+        self.resolved = resolved
+
+    def __len__(self):
+        return len(self.doc)
+
+    def __repr__(self):
+        return '<RelationTable {}: {} {}, {} documents, {} types>'.format(self.name, len(self), self.kind,
+                                                                         len(self.doc_names), len(self.labels))
+
+    @classmethod
+    def from_corpus(cls, corpus, kind='relations'):
+        """
+        :param corpus: AnnCorpus
+        :param kind: 'relations' or 'events'
+        :return: RelationTable
+        """
+        return cls.from_documents(corpus.name, corpus.iter_docs(), kind)
+
+    @classmethod
+    def from_documents(cls, name, documents, kind='relations'):
+        """
+        Build the table from any iterable of AnnDocument.
+        Entity (and event) IDs are indexed once per document, so every argument is resolved with a single lookup.
+        """
+        if kind not in ('relations', 'events'):
+            raise ValueError("kind must be 'relations' or 'events'")
+        doc_names, labels = [], {}
+        doc, tag, args, resolved = [], [], [], []
+        for i, ann_doc in enumerate(documents):
+            doc_names.append(ann_doc.name)
+            spans = {ent.name: ent.span for ent in ann_doc.anns['entities']}
+            # Events can be arguments of other events (and relations), they stand for their trigger
+            spans.update((eve.name, spans.get(eve.trigger)) for eve in ann_doc.anns['events'])
+            for ann in ann_doc.anns[kind]:
+                if kind == 'relations':
+                    pairs = [ann.arg1.split(':', 1), ann.arg2.split(':', 1)]
+                else:
+                    pairs = [('', ann.trigger)] + [arg.split(':', 1) for arg in ann.arguments]
+                ann_args = tuple(sorted(((pair[0], spans.get(pair[-1])) for pair in pairs),
+                                       key=lambda arg: (arg[0], arg[1] or ())))
+                doc.append(i)
+                tag.append(labels.setdefault(ann.tag, len(labels)))
+                args.append(ann_args)
+                resolved.append(all(span is not None for _, span in ann_args))
+
+        # Object array of tuples (built element by element, so tuples are not turned into dimensions)
+        args_column = np.empty(len(args), dtype=object)
+        args_column[:] = args
+        return cls(name=name, kind=kind, doc_names=doc_names, labels=list(labels),
+                   doc=np.array(doc, dtype=np.int32), tag=np.array(tag, dtype=np.int32), args=args_column,
+                   resolved=np.array(resolved, dtype=bool))
+
+    def take(self, rows):
+        """
+        New table with the selected rows (boolean mask or indices). Dictionaries are shared with this table.
+        """
+        return RelationTable(name=self.name, kind=self.kind, doc_names=self.doc_names, labels=self.labels,
+                             doc=self.doc[rows], tag=self.tag[rows], args=self.args[rows],
+                             resolved=self.resolved[rows])
+
+    def select(self, labels):
+        """
+        New table with only the given relation or event types.
+        """
+        wanted = set(labels)
+        keep = np.array([label in wanted for label in self.labels], dtype=bool)
+        return self.take(keep[self.tag] if len(keep) else np.zeros(len(self), dtype=bool))
+
+    def column_values(self, column):
+        """
+        Codes and dictionary of 'filename' or 'label' (see shared_codes).
+        """
+        if column == 'filename':
+            return self.doc, self.doc_names
+        elif column == 'label':
+            return self.tag, self.labels
+        raise ValueError("Relation tables can only be encoded by 'filename' and 'label'")
+
+
+def _combine(key, codes):
+    # Mixed-radix combination followed by factorize keeps keys dense, so they never overflow int64
+    n = int(codes.max()) + 1 if len(codes) else 1
+    return pd.factorize(key * n + codes)[0].astype(np.int64)
+
+
+def shared_codes(tables, column):
+    """
+    Codes of a dictionary-encoded column (any of KEY_COLUMNS but 'span') mapped onto a dictionary shared by all
+    tables, so that equal values get equal codes in every table.
+    :return: tuple (list of int64 code arrays, one per table, list of shared values)
+    """
+    shared = {}
+    codes = []
+    for t in tables:
+        t_codes, t_values = t.column_values(column)
+        mapping = np.array([shared.setdefault(v, len(shared)) for v in t_values], dtype=np.int64)
+        codes.append(mapping[t_codes] if len(t_codes) else np.zeros(0, dtype=np.int64))
+    return codes, list(shared)
+
+
+def encode_keys(tables, columns):
+    """
+    Encode each annotation in one or more tables as a single integer.
+    Two annotations get the same key if, and only if, they have the same values in all of the given columns,
+    no matter which table they come from (e.g. gold standard vs. predictions).
+    :param tables: list of AnnTable
+    :param columns: list of KEY_COLUMNS
+    :return: list of int64 numpy arrays, one per table
+    """
+    sizes = [len(t) for t in tables]
+    key = np.zeros(sum(sizes), dtype=np.int64)
+    for column in columns:
+        if column == 'span':
+            for part in ['start', 'end', 'start2', 'end2']:
+                values = np.concatenate([getattr(t, part) for t in tables]) if tables else np.zeros(0, dtype=np.int64)
+                key = _combine(key, pd.factorize(values)[0])
+            continue
+        codes, _ = shared_codes(tables, column)
+        key = _combine(key, np.concatenate(codes) if codes else np.zeros(0, dtype=np.int64))
+
+    return np.split(key, np.cumsum(sizes)[:-1]) if tables else []
+
+
+def encode_relation_keys(tables):
+    """
+    Encode each relation or event in one or more RelationTables as a single integer: two of them get the same key if
+    they are in the same document, have the same type and their arguments have the same roles and spans.
+    Relations with unresolved arguments get keys of their own, so they never match.
+    :param tables: list of RelationTable
+    :return: list of int64 numpy arrays, one per table
+    """
+    sizes = [len(t) for t in tables]
+    if not tables:
+        return []
+    args = np.concatenate([t.args for t in tables])
+    # Hash join of argument signatures across tables
+    key = pd.factorize(args)[0].astype(np.int64) if len(args) else np.zeros(0, dtype=np.int64)
+    for column in ['filename', 'label']:
+        codes, _ = shared_codes(tables, column)
+        key = _combine(key, np.concatenate(codes))
+    unresolved = ~np.concatenate([t.resolved for t in tables])
+    key[unresolved] = key.max(initial=0) + 1 + np.arange(unresolved.sum())
+    return np.split(key, np.cumsum(sizes)[:-1])
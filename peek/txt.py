@@ -28,11 +28,11 @@ def check_annotations_alignment_doc(doc):
     # TODO: Needs more testing, I think there might be some strange behaviour
     Check whether the annotations in a document are properly aligned at span level and can be properly shown by brat.
     """
-    full_txt = '\n'.join(doc.txt)
     misalignment = False
     for ann in doc.anns['entities']:
-        if ann.text != full_txt[ann.span[0][0]:ann.span[0][1]]:
-            print('ANNOTATION NOT ALIGNED: ', ann.text, '|', doc.name, '|', 'current span:', full_txt[ann.span[0][0]:ann.span[0][1]])
+        current_text = doc.get_span_text(ann.span[0][0], ann.span[0][1])
+        if ann.text != current_text:
+            print('ANNOTATION NOT ALIGNED: ', ann.text, '|', doc.name, '|', 'current span:', current_text)
             misalignment = True
     return misalignment
 
@@ -83,16 +83,15 @@ def doc2sent(doc: ann_structure.AnnDocument, tokenizer=''):
         else:
             # Brat doesn't count newlines. If we add them to our ending span, we'll be off by one ch for every newline.
             ending_span = current_span
-        # Get annotations for the sentence
-        for ent in doc.anns['entities']:
-            # If the annotation's span is inside the sentence's, construct a new entity
-            if ent.span[0][0] >= current_span and ent.span[0][1] <= ending_span:
-                new_start_span = ent.span[0][0] - current_span
-                new_end_span = ent.span[0][1] - current_span
-                new_ent = ann_structure.Entity(name=ent.name, tag=ent.tag, span=((new_start_span, new_end_span),),
-                                               text=ent.text)
-                ann_sent.anns['entities'].append(new_ent)
-                ann_sent.from_entity(ent)
+        # Get annotations for the sentence: those whose span is inside the sentence's (see AnnDocument.span_index)
+        for ent in doc.contained_in(current_span, ending_span):
+            # Construct a new entity with the adjusted span
+            new_start_span = ent.span[0][0] - current_span
+            new_end_span = ent.span[0][1] - current_span
+            new_ent = ann_structure.Entity(name=ent.name, tag=ent.tag, span=((new_start_span, new_end_span),),
+                                           text=ent.text)
+            ann_sent.anns['entities'].append(new_ent)
+            ann_sent.from_entity(ent)
         current_span = ending_span + 1
         ann_sent.update_stats()
         sent_list.append(ann_sent)
@@ -144,7 +143,7 @@ def get_text_window(doc: ann_structure.AnnDocument, annotation, size=75, directi
     include_mention: whether to include the mention text in the output string (surrounded by a double pipe character || to distinguish it)
     """
     # Get text
-    txt = '\n'.join([sent for sent in doc.txt])
+    txt = doc.text
     # Get left and right windows
 
     # Create string
@@ -261,31 +260,36 @@ def clean_overlapping_annotations(doc, only_same_label=True, ignore_sug_prefix=T
     ignore_sug_prefix: Whether to ignore the '_SUG_' prefix added to suggestions when considering labels
     """
     # Create a new document
-    new_doc = peek.AnnSentence()
+    new_doc = ann_structure.AnnSentence()
     new_doc.name = doc.name
     anns_to_keep = []
+    kept_spans = set()
+
+    def label(ann):
+        return ann.tag.replace('_SUG_', '') if ignore_sug_prefix else ann.tag
 
     # Go through the annotations and keep them based on overlaps
     for ann in doc.anns['entities']:
-        # Possible overlap types are exact, nested-bigger, nested-smaller, starts-before, ends-after and None
+        start, end = ann.span[0]
+        # Only annotations that contain this one can make it an exact duplicate or a nested annotation
+        # (overlap types exact and nested-smaller in Entity.compare_overlap), the span index finds them directly.
         # We need to use 'is not' to compare the objects themselves, if we use == for equality it will not work!
-        overlaps = [(ann2, ann.compare_overlap(ann2)) for ann2 in [ann2 for ann2 in doc.anns['entities'] if ann is not ann2]]
-        if only_same_label and ignore_sug_prefix:
-            overlaps = [ann_overl for ann_overl in overlaps if ann_overl[0].tag.replace('_SUG_', '') == ann.tag.replace('_SUG_', '')]
-        elif only_same_label:
-            overlaps = [ann_overl for ann_overl in overlaps if ann_overl[0].tag == ann.tag]
-
-        # Annotations with no overlap we'll just take them and move on
-        if all([overlap[1] is None for overlap in overlaps]):
-            anns_to_keep.append(ann)
-        elif any([overlap[1] == 'exact' for overlap in overlaps]):
-            if not any([ann.span == kept_ann.span for kept_ann in anns_to_keep]):
+        containing = [ann2 for ann2 in doc.containing(start, end) if ann2 is not ann]
+        if only_same_label:
+            containing = [ann2 for ann2 in containing if label(ann2) == label(ann)]
+
+        if any(ann2.span[0] == ann.span[0] for ann2 in containing):
+            # Exact overlap: keep only the first annotation with this span
+            if ann.span not in kept_spans:
                 anns_to_keep.append(ann)
+                kept_spans.add(ann.span)
         # Annotations with the same label that are nested within a bigger one are removed
-        elif any([overlap[1] == 'nested-smaller' for overlap in overlaps]):
+        elif containing:
             continue
+        # Annotations with no overlap (or partial ones) we'll just take them and move on
         else:
             anns_to_keep.append(ann)
+            kept_spans.add(ann.span)
 
     # Save non-overlapping annotations
     for ann in anns_to_keep:
@@ -0,0 +1,98 @@
+"""
+Small random brat corpora for the tests.
+Documents share their text across corpora (it only depends on the document number), so corpora written with different
+seeds look like several annotators, or a Gold Standard and predictions, working on the same files.
+"""
+import os
+import random
+
+import pytest
+
+LABELS = ['Disease', 'Drug', 'Procedure', 'Symptom', 'Anatomy']
+WORDS = ['fever', 'aspirin', 'biopsy', 'cough', 'liver', 'pain', 'insulin', 'scan', 'rash', 'heart', '.', ',']
+
+
+def document_text(d):
+    rnd = random.Random('text-{}'.format(d))
+    return ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(20, 40)))
+
+
+def document_lines(d, seed=0, n_entities=8, noise=0.0, labels=LABELS, links=True):
+    """
+    .ann lines of document d. Entities span one to three words and may overlap, some are discontinuous.
+    With noise > 0, that fraction of entities gets another label, moved boundaries or is dropped (the rest are the same
+    for every seed). With links, relations, events, attributes and notes point to the entities.
+    """
+    text = document_text(d)
+    starts, pos = [], 0
+    for word in text.split(' '):
+        starts.append((pos, pos + len(word)))
+        pos += len(word) + 1
+    base = random.Random('anns-{}'.format(d))
+    rnd = random.Random('noise-{}-{}'.format(seed, d))
+    lines = []
+    names = []
+    for i in range(n_entities):
+        first = base.randrange(len(starts))
+        last = min(first + base.randint(0, 2), len(starts) - 1)
+        label = base.choice(labels)
+        span = [(starts[first][0], starts[last][1])]
+        if base.random() < 0.15 and last + 2 < len(starts):
+            span.append(starts[last + 2])
+        if noise and rnd.random() < noise:
+            change = rnd.random()
+            if change < 0.3:
+                continue
+            elif change < 0.6:
+                label = rnd.choice(labels)
+            else:
+                start, end = span[0]
+                start = min(max(0, start + rnd.randint(-2, 2)), end - 1)
+                span[0] = (start, min(max(start + 1, end + rnd.randint(-2, 2)), len(text)))
+        name = 'T{}'.format(i + 1)
+        names.append(name)
+        lines.append('{}\t{} {}\t{}'.format(name, label, ';'.join('{} {}'.format(s, e) for s, e in span),
+                                            ' '.join(text[s:e] for s, e in span)))
+    if links and names:
+        for i in range(n_entities // 3):
+            lines.append('R{}\tRelated Arg1:{} Arg2:{}'.format(i + 1, base.choice(names), base.choice(names)))
+        lines.append('E1\tTreatment:{} Theme:{}'.format(base.choice(names), base.choice(names)))
+        lines.append('A1\tNegated {}'.format(base.choice(names)))
+        lines.append('#1\tAnnotatorNotes {}\tnote'.format(base.choice(names)))
+    return lines
+
+
+def write_corpus(folder, n_docs=10, seed=0, noise=0.0, txt=True, subfolders=False, **kwargs):
+    """
+    Write n_docs .ann (and .txt) files to folder, see document_lines.
+    With subfolders, documents are split between the subfolders a/ and b/, which reuse the same file names.
+    :return: folder
+    """
+    for d in range(n_docs):
+        sub = ('a' if d % 2 == 0 else 'b') if subfolders else ''
+        name = 'doc{:03d}'.format(d // 2 if subfolders else d)
+        os.makedirs(os.path.join(folder, sub), exist_ok=True)
+        path = os.path.join(folder, sub, name)
+        with open(path + '.ann', 'w', encoding='utf-8') as f_out:
+            f_out.write('\n'.join(document_lines(d, seed=seed, noise=noise, **kwargs)) + '\n')
+        if txt:
+            with open(path + '.txt', 'w', encoding='utf-8') as f_out:
+                f_out.write(document_text(d))
+    return folder
+
+
+def entity_lines(doc):
+    # Comparable content of a document
+    return sorted(str(ann) for anns in doc.anns.values() for ann in anns)
+
+
+@pytest.fixture
+def corpus_dir(tmp_path):
+    return write_corpus(str(tmp_path / 'corpus'))
+
+
+@pytest.fixture
+def annotator_dirs(tmp_path):
+    # Gold Standard-like annotator first, then two noisy ones
+    return [write_corpus(str(tmp_path / name), seed=seed, noise=0 if seed == 0 else 0.3)
+            for seed, name in enumerate(['gold', 'annotator1', 'annotator2'])]
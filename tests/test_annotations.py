@@ -0,0 +1,38 @@
+import pickle
+
+from peek.ann_structure import AnnCorpus
+
+
+def _ids(arg):
+    return arg.split(':')[-1]
+
+
+def test_links_match_brute_force(corpus_dir):
+    for doc in AnnCorpus(corpus_dir).docs:
+        anns = doc.anns
+        for ent in anns['entities']:
+            assert list(ent.rels) == [rel for rel in anns['relations'] if ent.name in (_ids(rel.arg1), _ids(rel.arg2))]
+            assert list(ent.events) == [eve for eve in anns['events']
+                                        if ent.name in [eve.trigger] + [_ids(arg) for arg in eve.arguments]]
+            assert list(ent.attr) == [att for att in anns['attributes'] if att.arguments[:1] == [ent.name]]
+            assert list(ent.notes) == [note for note in anns['notes'] if note.ann_id == ent.name]
+
+
+def test_interaction_lists_are_created_on_link(corpus_dir):
+    doc = AnnCorpus(corpus_dir).docs[0]
+    unlinked = [ent for ent in doc.anns['entities'] if not ent.rels and not ent.events and not ent.attr
+                and not ent.notes]
+    assert unlinked
+    for ent in unlinked:
+        # Reading an interaction list does not create it
+        assert ent.rels == ent.events == ent.attr == ent.notes == ()
+        assert ent._rels is None and ent._events is None and ent._attr is None and ent._notes is None
+    linked = [ent for ent in doc.anns['entities'] if ent.rels]
+    assert linked and all(isinstance(ent._rels, list) for ent in linked)
+
+    # Lists can still be assigned, and entities keep their links when pickled
+    ent = unlinked[0]
+    ent.notes = ['note']
+    assert ent.notes == ['note']
+    copy = pickle.loads(pickle.dumps(doc))
+    assert [len(e.rels) for e in copy.anns['entities']] == [len(e.rels) for e in doc.anns['entities']]
@@ -0,0 +1,99 @@
+import os
+import random
+import tarfile
+import zipfile
+
+import pytest
+
+from peek import archive, rwsl
+from peek.ann_structure import AnnCorpus
+
+from conftest import entity_lines, write_corpus
+
+
+def _members(folder):
+    return sorted(os.listdir(folder))
+
+
+def _write_archives(folder, out):
+    # Archives as created from the folder, plus a tar with the files shuffled, the texts at the end and one text missing
+    files = _members(folder)
+    with tarfile.open(os.path.join(out, 'round.tar.gz'), 'w:gz') as tar:
+        for f in files:
+            tar.add(os.path.join(folder, f), 'round/' + f)
+    with zipfile.ZipFile(os.path.join(out, 'round.zip'), 'w') as zip_file:
+        for f in files:
+            zip_file.write(os.path.join(folder, f), 'round/' + f)
+    anns = [f for f in files if f.endswith('.ann')]
+    random.Random(0).shuffle(anns)
+    texts = [f for f in files if f.endswith('.txt') and f != 'doc000.txt']
+    with tarfile.open(os.path.join(out, 'shuffled.tar'), 'w') as tar:
+        for f in anns[:5] + texts[:5] + anns[5:] + texts[5:]:
+            tar.add(os.path.join(folder, f), 'round/' + f)
+    return [os.path.join(out, name) for name in ['round.tar.gz', 'round.zip', 'shuffled.tar']]
+
+
+def test_archives_match_folder(tmp_path, capsys):
+    folder = write_corpus(str(tmp_path / 'round'))
+    # Entity texts may contain characters that str.splitlines would split on
+    with open(os.path.join(folder, 'doc009.ann'), 'a', encoding='utf-8') as f_out:
+        f_out.write('T99\tDrug 0 3\ta b\x0cc\n')
+    expected = {doc.name: doc for doc in AnnCorpus(folder, txt=True).docs}
+    capsys.readouterr()
+    for path in _write_archives(folder, str(tmp_path)):
+        corpus = AnnCorpus(path, txt=True)
+        assert capsys.readouterr().out == ''
+        assert corpus.name == archive.archive_name(path)
+        assert sorted(doc.name for doc in corpus.docs) == sorted(expected)
+        for doc in corpus.docs:
+            assert doc.path == os.path.join(path, 'round', doc.name + '.ann')
+            assert entity_lines(doc) == entity_lines(expected[doc.name])
+            if doc.txt:
+                assert doc.text == expected[doc.name].text
+        if path.endswith('shuffled.tar'):
+            # Reported, not printed
+            assert list(corpus.errors) == [os.path.join(path, 'round', 'doc000.ann')]
+            assert not corpus.get_doc_by_name('doc000').txt
+        else:
+            assert corpus.errors == {}
+
+
+def test_documents_come_out_with_their_text(tmp_path, monkeypatch):
+    folder = write_corpus(str(tmp_path / 'round'))
+    path = _write_archives(folder, str(tmp_path))[0]
+    iter_members = archive._iter_members
+    read = []
+
+    def recording(path):
+        for member, open_member in iter_members(path):
+            read.append(member)
+            yield member, open_member
+    monkeypatch.setattr(archive, '_iter_members', recording)
+    for doc in archive.iter_archive_documents(path, txt=True):
+        # Each document is ready as soon as its own text has been read, not when the archive ends
+        assert read[-1] == 'round/{}.txt'.format(doc.name)
+        assert doc.txt
+    monkeypatch.setattr(archive, '_iter_members', iter_members)
+    doc = archive.load_archive_document(path, 'round/doc003.ann', txt=True)
+    assert doc.name == 'doc003'
+    with pytest.raises(KeyError):
+        archive.load_archive_document(path, 'round/missing.ann')
+
+
+@pytest.mark.parametrize('name', ['export.tar.gz', 'export.zip', 'export.tar.xz'])
+def test_writer_round_trip(tmp_path, capsys, name):
+    corpus = AnnCorpus(write_corpus(str(tmp_path / 'round')), txt=True)
+    capsys.readouterr()
+    path = str(tmp_path / name)
+    with archive.ArchiveWriter(path, folder='export') as out:
+        for doc in corpus.docs:
+            rwsl.write_ann_file(doc, out)
+            rwsl.write_txt_file(doc, out)
+    assert out.n_files == 20
+    assert capsys.readouterr().out == ''
+    loaded = {doc.name: doc for doc in AnnCorpus(path, txt=True).docs}
+    for doc in corpus.docs:
+        assert entity_lines(loaded[doc.name]) == entity_lines(doc)
+        assert loaded[doc.name].text.rstrip('\n') == doc.text.rstrip('\n')
+    with pytest.raises(ValueError):
+        archive.ArchiveWriter(str(tmp_path / 'export.rar'))
@@ -0,0 +1,84 @@
+import os
+
+from peek.ann_structure import AnnCorpus
+from peek.cache import DEFAULT_MAX_SIZE, ParseCache
+
+from conftest import entity_lines, write_corpus
+
+
+def _ann_files(folder):
+    return sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.endswith('.ann'))
+
+
+def test_cached_load_matches_parsing(corpus_dir, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    parsed = AnnCorpus(corpus_dir, txt=True)
+    first = AnnCorpus(corpus_dir, txt=True, cache_dir=cache_dir)
+    second = AnnCorpus(corpus_dir, txt=True, cache_dir=cache_dir, workers=2)
+    for corpus in [first, second]:
+        assert [entity_lines(doc) for doc in corpus.docs] == [entity_lines(doc) for doc in parsed.docs]
+        assert [doc.text for doc in corpus.docs] == [doc.text for doc in parsed.docs]
+    assert len(os.listdir(cache_dir)) == len(parsed.docs)
+
+
+def test_invalidation(corpus_dir, tmp_path):
+    cache = ParseCache(str(tmp_path / 'cache'))
+    path = _ann_files(corpus_dir)[0]
+    doc = cache.load(path, with_text=True)
+    assert cache.get(path, with_text=True) is not None
+    # Entries with and without text are separate
+    assert cache.get(path) is None
+
+    # Touched but with the same content: the entry is still used, and updated so the content is not hashed again
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert entity_lines(cache.get(path, with_text=True)) == entity_lines(doc)
+    assert cache.get(path, with_text=True) is not None
+
+    # Edited .ann file: the document is parsed again
+    with open(path, 'a') as f_out:
+        f_out.write('T99\tDrug 0 1\t{}\n'.format(doc.text[0]))
+    assert cache.get(path, with_text=True) is None
+    reloaded = cache.load(path, with_text=True)
+    assert len(reloaded.anns['entities']) == len(doc.anns['entities']) + 1
+
+    # Edited text file
+    with open(path[:-3] + 'txt', 'a') as f_out:
+        f_out.write(' more')
+    assert cache.get(path, with_text=True) is None
+    assert cache.get(path) is None
+    assert cache.load(path, with_text=True).text == doc.text + ' more'
+
+    # Removed file
+    os.remove(path[:-3] + 'txt')
+    assert cache.get(path, with_text=True) is None
+
+
+def test_eviction(tmp_path):
+    folder = write_corpus(str(tmp_path / 'corpus'), n_docs=40)
+    cache_dir = str(tmp_path / 'cache')
+    AnnCorpus(folder, cache_dir=cache_dir, cache_size_bytes=None)
+    entry_size = ParseCache(cache_dir).size() / 40
+    limit = int(entry_size * 10)
+
+    cache = ParseCache(cache_dir, max_size=limit)
+    cache.evict()
+    assert 0 < cache.size() <= limit
+
+    cache.clear()
+    AnnCorpus(folder, cache_dir=cache_dir, cache_size_bytes=limit)
+    assert 0 < cache.size() <= limit
+
+    # Lazy corpora evict while documents are loaded, not only at the end
+    cache.clear()
+    corpus = AnnCorpus(folder, lazy=True, cache_size=0, cache_dir=cache_dir, cache_size_bytes=limit)
+    for i in range(len(corpus.docs)):
+        corpus.docs[i]
+        assert cache.size() <= limit * 1.1 + 2 * entry_size
+    list(corpus.iter_docs())
+    assert 0 < cache.size() <= limit
+
+
+def test_default_limit(tmp_path):
+    assert AnnCorpus._get_cache(str(tmp_path / 'cache')).max_size == DEFAULT_MAX_SIZE == 1024 ** 3
+    assert AnnCorpus._get_cache(str(tmp_path / 'cache'), cache_size_bytes=1000).max_size == 1000
@@ -0,0 +1,59 @@
+from collections import Counter, defaultdict
+
+import pytest
+
+from peek import metrics
+from peek.ann_structure import AnnCorpus
+from peek.table import shared_codes
+
+
+def _brute_confusion(gold, pred, rel_labels):
+    tables = [gold.to_table(), pred.to_table()]
+    if rel_labels is not None:
+        tables = [table.select(rel_labels) for table in tables]
+    # Mentions left over in a span are paired in the order of the label codes shared by both tables
+    _, shared = shared_codes(tables, 'label')
+    rank = {label: i for i, label in enumerate(shared)}
+    sides = []
+    for table in tables:
+        spans = defaultdict(set)
+        for i, d in enumerate(table.doc):
+            key = (table.doc_names[d], table.start[i], table.end[i], table.start2[i], table.end2[i])
+            spans[key].add(table.labels[table.tag[i]])
+        sides.append(spans)
+    gold_spans, pred_spans = sides
+    cells = Counter()
+    for key in set(gold_spans) | set(pred_spans):
+        gold_labels, pred_labels = gold_spans.get(key, set()), pred_spans.get(key, set())
+        for label in gold_labels & pred_labels:
+            cells[label, label] += 1
+        gold_rest = sorted(gold_labels - pred_labels, key=rank.get)
+        pred_rest = sorted(pred_labels - gold_labels, key=rank.get)
+        for gold_label, pred_label in zip(gold_rest, pred_rest):
+            cells[gold_label, pred_label] += 1
+        for gold_label in gold_rest[len(pred_rest):]:
+            cells[gold_label, metrics.NO_LABEL] += 1
+        for pred_label in pred_rest[len(gold_rest):]:
+            cells[metrics.NO_LABEL, pred_label] += 1
+    return cells
+
+
+@pytest.mark.parametrize('rel_labels', [None, ['Drug', 'Disease', 'Symptom']])
+def test_matrix_matches_brute_force(annotator_dirs, rel_labels):
+    corpora = [AnnCorpus(folder) for folder in annotator_dirs]
+    for gold, pred in [(corpora[0], corpora[1]), (corpora[0], corpora[2]), (corpora[1], corpora[2]),
+                       (corpora[0], corpora[0])]:
+        result = metrics.confusion(gold, pred, rel_labels)
+        matrix = result.matrix
+        cells = {(i, j): int(matrix.loc[i, j]) for i in matrix.index for j in matrix.columns if matrix.loc[i, j]}
+        assert cells == dict(_brute_confusion(gold, pred, rel_labels))
+        assert list(matrix.index) == list(matrix.columns) == sorted(result.labels) + [metrics.NO_LABEL]
+        if rel_labels is not None:
+            assert set(result.labels) <= set(rel_labels)
+        # Summary counts and per label counts come from the same matrix
+        assert result.correct + result.swapped + result.missing == sum(
+            n for (i, _), n in cells.items() if i != metrics.NO_LABEL)
+        assert result.per_label['correct'].sum() == result.correct
+        assert result.per_label['swapped_out'].sum() == result.per_label['swapped_in'].sum() == result.swapped
+        if gold is pred:
+            assert result.swapped == result.spurious == result.missing == 0
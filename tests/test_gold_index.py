@@ -0,0 +1,66 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from peek import metrics
+from peek.ann_structure import AnnCorpus
+
+from conftest import LABELS, write_corpus
+
+
+def _keys(corpus, labels):
+    return {(doc.name, ent.tag, ent.text) for doc in corpus.docs for ent in doc.anns['entities'] if ent.tag in labels}
+
+
+def _check(result, gold, pred, labels):
+    # Same counts as comparing the sets of distinct (filename, label, text) annotations
+    gold_keys, pred_keys = _keys(gold, labels), _keys(pred, labels)
+    tp = gold_keys & pred_keys
+    assert (result.tp, result.pred_pos, result.gs_pos) == (len(tp), len(pred_keys), len(gold_keys))
+    if tp:
+        precision, recall = len(tp) / len(pred_keys), len(tp) / len(gold_keys)
+        assert result.f1 == pytest.approx(2 * precision * recall / (precision + recall))
+    # Scores per document are only given for documents with Gold Standard annotations
+    gold_docs = {name for name, _, _ in gold_keys}
+    for column, keys in [('tp', tp), ('pred_pos', pred_keys), ('gs_pos', gold_keys)]:
+        per_label = Counter(label for _, label, _ in keys)
+        assert {label: n for label, n in result.per_label[column].items() if n} == dict(per_label)
+        per_doc = Counter(name for name, _, _ in keys if name in gold_docs)
+        assert {name: n for name, n in result.per_doc[column].items() if n} == dict(per_doc)
+
+
+@pytest.mark.parametrize('labels', [LABELS, ['Drug', 'Disease'], ['Drug', 'Unknown']])
+def test_score_matches_sets(annotator_dirs, labels):
+    gold, pred, other = [AnnCorpus(folder) for folder in annotator_dirs]
+    index = metrics.GoldIndex(gold, labels)
+    for corpus in [pred, other, gold]:
+        _check(index.score(corpus), gold, corpus, labels)
+        _check(metrics.fscore(gold, corpus, labels), gold, corpus, labels)
+
+
+def test_predictions_with_other_documents_and_labels(annotator_dirs, tmp_path):
+    gold = AnnCorpus(annotator_dirs[0])
+    # Documents and labels the Gold Standard does not have never match
+    pred = AnnCorpus(write_corpus(str(tmp_path / 'more'), n_docs=14, seed=1, noise=0.3,
+                                  labels=LABELS + ['Unknown']))
+    for labels in [LABELS, LABELS + ['Unknown']]:
+        _check(metrics.GoldIndex(gold, labels).score(pred), gold, pred, labels)
+
+
+def test_score_many(annotator_dirs):
+    gold = AnnCorpus(annotator_dirs[0])
+    index = metrics.GoldIndex(gold, LABELS)
+    expected = [index.score(AnnCorpus(folder)) for folder in annotator_dirs]
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        for results in [index.score_many(annotator_dirs), index.score_many(annotator_dirs, workers=2),
+                        index.score_many(annotator_dirs, executor=executor)]:
+            for result, reference in zip(results, expected):
+                assert (result.tp, result.pred_pos, result.gs_pos) == \
+                       (reference.tp, reference.pred_pos, reference.gs_pos)
+                assert result.per_doc.equals(reference.per_doc)
+                assert result.per_label.equals(reference.per_label)
+    table = index.compare(annotator_dirs, names=['gold', 'annotator1', 'annotator2'])
+    assert list(table.index) == ['gold', 'annotator1', 'annotator2']
+    assert table.loc['gold', 'f1'] == 1
+    assert table['tp'].tolist() == [result.tp for result in expected]
@@ -0,0 +1,117 @@
+import os
+import re
+
+import numpy as np
+import pytest
+
+from peek import kappa
+from peek.ann_structure import AnnCorpus
+from peek.table import shared_codes
+
+from conftest import LABELS, document_text
+
+
+def _token_labels(corpora, labels, texts):
+    """
+    Brute force: for every annotator, the label of each token (None for O) and the tokens of each label.
+    A token takes the label of the shortest fragment over it, ties broken by the label codes shared by all tables.
+    """
+    _, order = shared_codes([corpus.to_table().select(labels) for corpus in corpora], 'label')
+    rank = {label: i for i, label in enumerate(order)}
+    names = sorted(texts)
+    overall, per_label = [], []
+    for corpus in corpora:
+        docs = {doc.name: doc for doc in corpus.docs}
+        tokens, tagged = [], {label: [] for label in labels}
+        for name in names:
+            spans = [m.span() for m in re.finditer(r'\w+|[^\w\s]', texts[name])]
+            best = [None] * len(spans)
+            doc_tagged = {label: [0] * len(spans) for label in labels}
+            for ent in (docs[name].anns['entities'] if name in docs else []):
+                if ent.tag not in labels:
+                    continue
+                for start, end in ent.span:
+                    for t, (token_start, token_end) in enumerate(spans):
+                        if token_start < end and token_end > start:
+                            doc_tagged[ent.tag][t] = 1
+                            candidate = (end - start, rank[ent.tag], ent.tag)
+                            if best[t] is None or candidate < best[t]:
+                                best[t] = candidate
+            tokens.extend(b[2] if b else None for b in best)
+            for label in labels:
+                tagged[label].extend(doc_tagged[label])
+        overall.append(np.array(tokens, dtype=object))
+        per_label.append({label: np.array(values) for label, values in tagged.items()})
+    return overall, per_label
+
+
+def _cohen(a, b):
+    categories = set(a) | set(b)
+    observed = np.mean(a == b)
+    expected = sum(np.mean(a == c) * np.mean(b == c) for c in categories)
+    return (observed - expected) / (1 - expected) if expected != 1 else np.nan
+
+
+def _fleiss(ratings):
+    ratings = np.array(ratings, dtype=object)
+    n_raters, n_items = ratings.shape
+    categories = set(ratings.ravel())
+    counts = np.array([[np.sum(ratings[:, i] == c) for c in categories] for i in range(n_items)], dtype=float)
+    agreement = ((counts ** 2).sum(axis=1) - n_raters) / (n_raters * (n_raters - 1))
+    shares = counts.sum(axis=0) / (n_items * n_raters)
+    expected = (shares ** 2).sum()
+    return (agreement.mean() - expected) / (1 - expected) if expected != 1 else np.nan
+
+
+def _texts(folder):
+    return {f[:-4]: open(os.path.join(folder, f), encoding='utf-8').read() for f in os.listdir(folder)
+            if f.endswith('.txt')}
+
+
+@pytest.mark.parametrize('labels', [LABELS, ['Drug', 'Disease']])
+def test_token_kappa_matches_brute_force(annotator_dirs, labels):
+    corpora = [AnnCorpus(folder) for folder in annotator_dirs]
+    result = kappa.token_kappa(corpora, labels)
+    overall, per_label = _token_labels(corpora, labels, _texts(annotator_dirs[0]))
+    assert result.n_tokens == len(overall[0])
+    assert result.missing_text == [] and result.out_of_text == []
+
+    assert result.fleiss == pytest.approx(_fleiss(overall))
+    for i in range(len(corpora)):
+        for j in range(len(corpora)):
+            assert result.cohen.iloc[i, j] == pytest.approx(_cohen(overall[i], overall[j]))
+
+    pairs = [(0, 1), (0, 2), (1, 2)]
+    for label in labels:
+        ratings = [tagged[label] for tagged in per_label]
+        row = result.per_label.loc[label]
+        assert row['fleiss'] == pytest.approx(_fleiss(ratings), nan_ok=True)
+        assert row['mean_cohen'] == pytest.approx(np.nanmean([_cohen(ratings[i], ratings[j]) for i, j in pairs]),
+                                                  nan_ok=True)
+        assert row['tokens'] == np.sum(np.any(ratings, axis=0))
+        assert result.label_cohen(label).iloc[0, 1] == pytest.approx(_cohen(ratings[0], ratings[1]), nan_ok=True)
+
+
+def test_tables_need_txt_dir(annotator_dirs):
+    corpora = [AnnCorpus(folder) for folder in annotator_dirs]
+    tables = [corpus.to_table() for corpus in corpora]
+    with pytest.raises(ValueError):
+        kappa.token_kappa(tables, LABELS)
+    from_tables = kappa.token_kappa(tables, LABELS, txt_dir=annotator_dirs[0])
+    assert from_tables.fleiss == pytest.approx(kappa.token_kappa(corpora, LABELS).fleiss)
+
+
+def test_spans_out_of_text_are_clipped(annotator_dirs, capsys):
+    # An entity that goes past the end of its text must not cover the first tokens of the next document
+    path = os.path.join(annotator_dirs[1], 'doc000.ann')
+    end = len(document_text(0))
+    with open(path, 'a', encoding='utf-8') as f_out:
+        f_out.write('T99\tDrug {} {}\tout of text\n'.format(end - 2, end + 40))
+    corpora = [AnnCorpus(folder) for folder in annotator_dirs]
+    result = kappa.token_kappa(corpora, LABELS)
+    assert result.out_of_text == [('annotator1', 'doc000', 'out of text')]
+    assert 'ANNOTATION OUT OF TEXT' in capsys.readouterr().out
+
+    overall, per_label = _token_labels(corpora, LABELS, _texts(annotator_dirs[0]))
+    assert result.fleiss == pytest.approx(_fleiss(overall))
+    assert result.per_label.loc['Drug', 'tokens'] == np.sum(np.any([tagged['Drug'] for tagged in per_label], axis=0))
@@ -0,0 +1,43 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from peek.ann_structure import AnnCorpus
+
+from conftest import entity_lines
+
+
+def _write_broken(folder):
+    # One file that cannot be decoded and one with a line that cannot be parsed (and no text)
+    with open(os.path.join(folder, 'broken.ann'), 'wb') as f_out:
+        f_out.write(b'\xff\xfe\x00not utf-8')
+    with open(os.path.join(folder, 'faulty.ann'), 'w') as f_out:
+        f_out.write('T1\tDrug 0 3\tabc\nnot a brat line\n')
+
+
+def _summary(corpus):
+    return [(doc.path, entity_lines(doc)) for doc in corpus.docs]
+
+
+def test_parallel_load_matches_sequential(corpus_dir):
+    sequential = AnnCorpus(corpus_dir, txt=True)
+    parallel = AnnCorpus(corpus_dir, txt=True, workers=2)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        threaded = AnnCorpus(corpus_dir, txt=True, executor=executor)
+    assert len(sequential.docs) == 10
+    assert _summary(parallel) == _summary(sequential)
+    assert _summary(threaded) == _summary(sequential)
+    assert parallel.errors == sequential.errors == threaded.errors == {}
+
+
+def test_load_problems_are_collected_not_printed(corpus_dir, capsys):
+    _write_broken(corpus_dir)
+    sequential = AnnCorpus(corpus_dir, txt=True)
+    parallel = AnnCorpus(corpus_dir, txt=True, workers=2)
+    assert capsys.readouterr().out == ''
+    # The file that cannot be read is left out in both cases, with the same problems reported
+    assert _summary(parallel) == _summary(sequential)
+    assert len(sequential.docs) == 11
+    assert parallel.errors == sequential.errors
+    assert sorted(sequential.errors) == [os.path.join(corpus_dir, 'broken.ann'), os.path.join(corpus_dir, 'faulty.ann')]
+    assert sequential.errors[os.path.join(corpus_dir, 'broken.ann')][0].startswith('UnicodeDecodeError')
+    assert len(sequential.errors[os.path.join(corpus_dir, 'faulty.ann')]) == 2
@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+from peek import mapreduce, metrics
+from peek.ann_structure import AnnCorpus
+
+from conftest import LABELS, write_corpus
+
+
+def test_corpus_stats_shards(tmp_path):
+    folder = write_corpus(str(tmp_path / 'corpus'), subfolders=True)
+    corpus = AnnCorpus(folder)
+    shards = [os.path.join(folder, 'a'), os.path.join(folder, 'b')]
+    for workers in [None, 2]:
+        total = mapreduce.corpus_map_reduce(shards, mapreduce.corpus_stats, workers=workers)
+        assert total.n_docs == 10
+        assert total.count == corpus.count
+        assert total.text_freq == corpus.text_freq
+        assert total.text_freq_lower == corpus.text_freq_lower
+        assert total.text_labels == corpus.text_labels
+
+    path = str(tmp_path / 'partial.json')
+    mapreduce.save_partial(total, path)
+    loaded = mapreduce.load_partial(path)
+    assert (loaded.n_docs, loaded.count, loaded.text_freq) == (total.n_docs, total.count, total.text_freq)
+
+
+def test_fscore_shards(annotator_dirs, capsys):
+    gold, pred = annotator_dirs[:2]
+    expected = metrics.show_fscore(AnnCorpus(gold), AnnCorpus(pred), LABELS)
+    capsys.readouterr()
+    tally = mapreduce.corpus_map_reduce([(gold, pred)], mapreduce.fscore_tally, rel_labels=LABELS)
+    assert tally.results() == expected
+    # Merging a shard twice doubles every count
+    twice = mapreduce.merge_partials([tally, tally])
+    assert twice.totals() == tuple(2 * n for n in tally.totals())
+    assert tally.results() == expected
+
+
+def test_nothing_to_merge():
+    with pytest.raises(ValueError, match='Nothing to merge'):
+        mapreduce.corpus_map_reduce([], mapreduce.corpus_stats)
+    with pytest.raises(ValueError, match='Nothing to merge'):
+        mapreduce.merge_partials([])
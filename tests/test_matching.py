@@ -0,0 +1,81 @@
+import random
+
+import numpy as np
+import pytest
+
+from peek import matching, metrics
+from peek.ann_structure import AnnCorpus
+
+TOLERANCE = 2
+
+
+def _side(rnd, n):
+    group = [rnd.randint(0, 2) for _ in range(n)]
+    start = [rnd.randint(0, 30) for _ in range(n)]
+    end = [s + rnd.randint(0, 6) for s in start]
+    return np.array(group, dtype=np.int64), np.array(start, dtype=np.int64), np.array(end, dtype=np.int64)
+
+
+def _brute_pairs(gold, pred, mode):
+    gold_group, gold_start, gold_end = gold
+    pred_group, pred_start, pred_end = pred
+    pairs = []
+    for i in range(len(pred_start)):
+        for j in range(len(gold_start)):
+            if pred_group[i] != gold_group[j]:
+                continue
+            if mode == 'overlap':
+                ok = max(pred_start[i], gold_start[j]) < min(pred_end[i], gold_end[j])
+            elif mode == 'boundary':
+                ok = abs(pred_start[i] - gold_start[j]) <= TOLERANCE and abs(pred_end[i] - gold_end[j]) <= TOLERANCE
+            else:
+                ok = pred_start[i] == gold_start[j] and pred_end[i] == gold_end[j]
+            if ok:
+                pairs.append((i, j))
+    return sorted(pairs)
+
+
+def _greedy(gold, pred, pairs):
+    # Closest boundaries first, then the largest overlap, then the lowest indices
+    _, gold_start, gold_end = gold
+    _, pred_start, pred_end = pred
+    scale = max(list(gold_end) + list(pred_end) + [0]) + 1
+
+    def cost(i, j):
+        distance = abs(gold_start[j] - pred_start[i]) + abs(gold_end[j] - pred_end[i])
+        return distance * scale - (min(gold_end[j], pred_end[i]) - max(gold_start[j], pred_start[i]))
+
+    used_pred, used_gold, chosen = set(), set(), []
+    for _, i, j in sorted((cost(i, j), i, j) for i, j in pairs):
+        if i not in used_pred and j not in used_gold:
+            used_pred.add(i)
+            used_gold.add(j)
+            chosen.append((i, j))
+    return sorted(chosen)
+
+
+@pytest.mark.parametrize('mode', matching.LENIENT_MODES)
+def test_candidate_pairs_and_match(mode):
+    for seed in range(300):
+        rnd = random.Random(seed)
+        gold, pred = _side(rnd, rnd.randint(0, 15)), _side(rnd, rnd.randint(0, 15))
+        expected = _brute_pairs(gold, pred, mode)
+        pred_idx, gold_idx = matching.candidate_pairs(*gold, *pred, mode=mode, tolerance=TOLERANCE)
+        assert sorted(zip(pred_idx.tolist(), gold_idx.tolist())) == expected
+
+        pred_idx, gold_idx = matching.match(*gold, *pred, mode=mode, tolerance=TOLERANCE)
+        assert len(set(pred_idx.tolist())) == len(pred_idx)
+        assert len(set(gold_idx.tolist())) == len(gold_idx)
+        assert sorted(zip(pred_idx.tolist(), gold_idx.tolist())) == _greedy(gold, pred, expected)
+
+
+def test_lenient_fscore(annotator_dirs):
+    gold, pred = AnnCorpus(annotator_dirs[0]), AnnCorpus(annotator_dirs[1])
+    labels = sorted(gold.text_labels)
+    same = metrics.fscore(gold, gold, labels, lenient=list(matching.LENIENT_MODES))
+    assert same.f1 == 1
+    assert all(same.lenient[mode].f1 == 1 for mode in matching.LENIENT_MODES)
+    # Every exact match is also a lenient one
+    result = metrics.fscore(gold, pred, labels, lenient=['overlap', 'boundary'], tolerance=TOLERANCE)
+    assert result.f1 <= result.lenient['boundary'].f1 <= 1
+    assert result.f1 <= result.lenient['overlap'].f1 <= 1
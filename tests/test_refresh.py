@@ -0,0 +1,54 @@
+import os
+import shutil
+import time
+
+import pytest
+
+from peek.ann_structure import AnnCorpus
+
+
+def _change_files(folder):
+    os.remove(os.path.join(folder, 'doc001.ann'))
+    shutil.copy(os.path.join(folder, 'doc002.ann'), os.path.join(folder, 'new.ann'))
+    with open(os.path.join(folder, 'doc003.ann')) as f_in:
+        lines = f_in.readlines()
+    with open(os.path.join(folder, 'doc003.ann'), 'w') as f_out:
+        f_out.writelines(lines[:len(lines) // 2])
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_refresh_matches_fresh_load(corpus_dir, lazy):
+    corpus = AnnCorpus(corpus_dir, lazy=lazy)
+    corpus.count  # stats are updated in place once computed
+    _change_files(corpus_dir)
+    changes = corpus.refresh()
+    assert changes == {'added': [os.path.join(corpus_dir, 'new.ann')],
+                       'removed': [os.path.join(corpus_dir, 'doc001.ann')],
+                       'modified': [os.path.join(corpus_dir, 'doc003.ann')]}
+
+    fresh = AnnCorpus(corpus_dir)
+    assert sorted(doc.name for doc in corpus.iter_docs()) == sorted(doc.name for doc in fresh.docs)
+    assert corpus.count == fresh.count
+    assert corpus.text_freq == fresh.text_freq
+    assert corpus.text_freq_lower == fresh.text_freq_lower
+    assert corpus.text_labels == fresh.text_labels
+    assert corpus.get_doc_by_name('new') is not None
+    assert corpus.get_doc_by_name('doc001') is None
+    assert len(corpus.to_table()) == len(fresh.to_table())
+    assert corpus.refresh() == {'added': [], 'removed': [], 'modified': []}
+
+
+def test_watch(corpus_dir):
+    corpus = AnnCorpus(corpus_dir)
+    found = []
+    watcher = corpus.watch(interval=0.05, callback=lambda corpus, changes: found.append(changes))
+    try:
+        os.remove(os.path.join(corpus_dir, 'doc000.ann'))
+        for _ in range(100):
+            if found:
+                break
+            time.sleep(0.05)
+    finally:
+        watcher.stop()
+    assert found[0]['removed'] == [os.path.join(corpus_dir, 'doc000.ann')]
+    assert len(corpus.docs) == 9
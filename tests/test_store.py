@@ -0,0 +1,69 @@
+import numpy as np
+
+from peek.ann_structure import AnnCorpus
+from peek.store import CorpusStore, load_corpus_store, save_corpus_store
+from peek.table import AnnTable
+
+from conftest import entity_lines, write_corpus
+
+
+def _table_rows(table):
+    # One comparable tuple per entity, whatever the codes chosen for each dictionary
+    return sorted(zip([table.doc_names[d] for d in table.doc], [table.labels[t] for t in table.tag],
+                      [table.marks[m] for m in table.mark], [table.texts[t] for t in table.text],
+                      table.start.tolist(), table.end.tolist(), table.start2.tolist(), table.end2.tolist()))
+
+
+def _table(docs):
+    return AnnTable.from_corpus(AnnCorpus(path='', from_list=docs))
+
+
+def _stored_corpus(tmp_path):
+    corpus = AnnCorpus(write_corpus(str(tmp_path / 'corpus'), subfolders=True), txt=True)
+    corpus.create_collections_subfolders()
+    path = save_corpus_store(corpus, str(tmp_path), txt=True)
+    return corpus, path
+
+
+def test_round_trip(tmp_path):
+    corpus, path = _stored_corpus(tmp_path)
+    for mmap in [True, False]:
+        loaded = load_corpus_store(path, mmap=mmap)
+        assert loaded.name == corpus.name
+        assert loaded.collections == corpus.collections == {'a', 'b'}
+        assert [doc.path for doc in loaded.docs] == [doc.path for doc in corpus.docs]
+        for doc, original in zip(loaded.docs, corpus.docs):
+            assert entity_lines(doc) == entity_lines(original)
+            assert doc.collection == original.collection
+            assert doc.text == original.text
+            assert [ent.span for ent in doc.anns['entities']] == [ent.span for ent in original.anns['entities']]
+        # Links between annotations are rebuilt too
+        assert [len(ent.rels) for ent in loaded.docs[0].anns['entities']] == \
+               [len(ent.rels) for ent in corpus.docs[0].anns['entities']]
+
+
+def test_table_and_selection(tmp_path):
+    corpus, path = _stored_corpus(tmp_path)
+    store = CorpusStore(path)
+    assert len(store) == len(corpus.docs)
+    assert _table_rows(store.to_table()) == _table_rows(AnnTable.from_corpus(corpus))
+
+    chosen = [corpus.docs[1].name, corpus.docs[4].name]
+    expected = [doc for doc in corpus.docs if doc.name in chosen]
+    assert [doc.path for doc in store.to_corpus(names=chosen).docs] == [doc.path for doc in expected]
+    assert _table_rows(store.to_table(names=chosen)) == _table_rows(_table(expected))
+
+    in_b = store.to_table(collections=['b'])
+    assert set(in_b.doc_collections) == {'b'}
+    assert _table_rows(in_b) == _table_rows(_table([doc for doc in corpus.docs if doc.collection == 'b']))
+
+    empty = store.to_table(names=['missing'])
+    assert len(empty) == 0 and empty.doc_names == []
+    assert np.array_equal(empty.start, np.zeros(0))
+
+
+def test_without_text(tmp_path):
+    corpus, path = _stored_corpus(tmp_path)
+    loaded = load_corpus_store(path, txt=False)
+    assert all(not doc.txt for doc in loaded.docs)
+    assert [entity_lines(doc) for doc in loaded.docs] == [entity_lines(doc) for doc in corpus.docs]
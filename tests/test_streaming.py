@@ -0,0 +1,121 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from peek import metrics, streaming
+from peek.ann_structure import AnnCorpus
+
+from conftest import LABELS, write_corpus
+
+VARIABLES = ['filename', 'label', 'offset']
+
+
+def _assert_same_iaa(results, reference):
+    all_vs_all, pairwise, by_label, count_labels = results
+    assert all_vs_all == pytest.approx(reference[0])
+    assert pairwise == pytest.approx(reference[1])
+    assert set(by_label) == set(reference[2])
+    for label, (label_all, label_pairwise) in by_label.items():
+        assert label_all == pytest.approx(reference[2][label][0])
+        assert label_pairwise == pytest.approx(reference[2][label][1])
+    assert count_labels == reference[3]
+
+
+@pytest.mark.parametrize('batch_size, workers', [(1, None), (3, None), (500, None), (4, 2)])
+def test_stream_fscore(annotator_dirs, batch_size, workers):
+    gold, pred = AnnCorpus(annotator_dirs[0]), AnnCorpus(annotator_dirs[1])
+    tally = streaming.stream_fscore(annotator_dirs[0], annotator_dirs[1], LABELS, batch_size=batch_size,
+                                    workers=workers)
+    result = metrics.fscore(gold, pred, LABELS)
+    assert tally.totals() == (result.tp, result.pred_pos, result.gs_pos)
+    assert tally.results() == (round(result.precision, 3), round(result.recall, 3), round(result.f1, 3))
+    per_doc = tally.per_doc()
+    assert set(per_doc) == set(result.per_doc.index)
+    for name, row in result.per_doc.iterrows():
+        assert np.allclose(per_doc[name], [row.precision, row.recall, row.f1], equal_nan=True)
+
+
+@pytest.mark.parametrize('batch_size, workers', [(1, None), (4, None), (3, 2)])
+def test_stream_iaa(annotator_dirs, batch_size, workers):
+    reference = metrics.iaa([AnnCorpus(folder) for folder in annotator_dirs], VARIABLES, LABELS).to_dicts()
+    tally = streaming.stream_iaa(annotator_dirs, VARIABLES, LABELS, batch_size=batch_size, workers=workers)
+    assert tally.annotators == ['gold', 'annotator1', 'annotator2']
+    _assert_same_iaa(tally.results(), reference)
+
+
+def test_same_names_in_subfolders(tmp_path):
+    # a/doc000 and b/doc000 are different documents: results must not depend on whether they share a batch
+    gold = write_corpus(str(tmp_path / 'gold'), subfolders=True)
+    pred = write_corpus(str(tmp_path / 'pred'), seed=1, noise=0.3, subfolders=True)
+    fscores = [streaming.stream_fscore(gold, pred, LABELS, batch_size=batch_size) for batch_size in [1, 2, 3, 100]]
+    assert len({tally.totals() for tally in fscores}) == 1
+    assert all(tally.per_doc() == fscores[0].per_doc() for tally in fscores)
+    assert sorted(fscores[0].per_doc()) == ['{}/doc{:03d}'.format(sub, d) for sub in 'ab' for d in range(5)]
+
+    iaas = [streaming.stream_iaa([gold, pred], VARIABLES, LABELS, batch_size=batch_size).results()
+            for batch_size in [1, 2, 3, 100]]
+    for results in iaas[1:]:
+        _assert_same_iaa(results, iaas[0])
+
+
+def test_missing_folder(annotator_dirs, tmp_path):
+    tally = streaming.stream_fscore(annotator_dirs[0], str(tmp_path / 'nothing'), LABELS)
+    assert tally.results() == (0, 0, 0)
+    with pytest.raises(ValueError):
+        streaming.stream_iaa(annotator_dirs, ['label', 'offset'], LABELS)
+
+
+def _check_tracker(tracker, directories):
+    reference = metrics.iaa([AnnCorpus(folder) for folder in directories], VARIABLES, LABELS).to_dicts()
+    _assert_same_iaa(tracker.results(), reference)
+
+
+def test_tracker_matches_iaa_from_scratch(annotator_dirs, tmp_path):
+    gold, first, second = annotator_dirs
+    tracker = streaming.IAATracker(annotator_dirs, VARIABLES, LABELS)
+    changes = tracker.update(batch_size=3)
+    assert len(changes['added']) == 10 and changes['removed'] == changes['modified'] == []
+    _check_tracker(tracker, annotator_dirs)
+    assert tracker.update() == {'added': [], 'removed': [], 'modified': []}
+    state = str(tmp_path / 'state.json')
+    tracker.save(state)
+
+    # Next round: an edited file, a deleted one, a new document and one with only irrelevant labels
+    with open(os.path.join(first, 'doc003.ann'), 'a') as f_out:
+        f_out.write('T99\tDrug 0 5\tdummy\n')
+    os.remove(os.path.join(second, 'doc004.ann'))
+    shutil.copy(os.path.join(gold, 'doc005.ann'), os.path.join(gold, 'extra.ann'))
+    with open(os.path.join(first, 'other.ann'), 'w') as f_out:
+        f_out.write('T1\tOther 0 3\tabc\n')
+    tracker = streaming.IAATracker.load(state)
+    assert tracker.update(workers=2) == {'added': ['extra.ann', 'other.ann'], 'removed': [],
+                                         'modified': ['doc003.ann', 'doc004.ann']}
+    _check_tracker(tracker, annotator_dirs)
+
+    # Removing the only document with a label drops the label
+    os.remove(os.path.join(gold, 'extra.ann'))
+    os.remove(os.path.join(first, 'other.ann'))
+    assert tracker.update()['removed'] == ['extra.ann', 'other.ann']
+    _check_tracker(tracker, annotator_dirs)
+
+
+def test_tracker_files_deleted_during_update(annotator_dirs, monkeypatch):
+    # A file that disappears between listing the folders and fingerprinting it is missing for this round
+    pair_files = streaming.pair_files
+
+    def listed_then_deleted(directories):
+        pairs = pair_files(directories)
+        os.remove(os.path.join(annotator_dirs[1], 'doc002.ann'))
+        os.remove(os.path.join(annotator_dirs[0], 'doc007.ann'))
+        os.remove(os.path.join(annotator_dirs[1], 'doc007.ann'))
+        os.remove(os.path.join(annotator_dirs[2], 'doc007.ann'))
+        return pairs
+    monkeypatch.setattr(streaming, 'pair_files', listed_then_deleted)
+    tracker = streaming.IAATracker(annotator_dirs, VARIABLES, LABELS)
+    changes = tracker.update()
+    assert 'doc007.ann' not in changes['added'] and len(changes['added']) == 9
+    _check_tracker(tracker, annotator_dirs)
+    monkeypatch.setattr(streaming, 'pair_files', pair_files)
+    assert tracker.update() == {'added': [], 'removed': [], 'modified': []}